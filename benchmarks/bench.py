@@ -0,0 +1,290 @@
+"""
+Benchmarks for Flask-JWT-Simple.
+
+Measures how long it takes to create and decode tokens, to pull a token out
+of the request headers, and to make a full request to a @jwt_required
+endpoint, across algorithms, payload sizes, and for valid, expired and
+invalid tokens. Results are written as json, and can be compared against a
+previously saved baseline:
+
+    $ python benchmarks/bench.py --save-baseline benchmarks/baseline.json
+    $ python benchmarks/bench.py --baseline benchmarks/baseline.json
+
+When comparing, the exit status is 1 if any benchmark got slower than the
+allowed threshold.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import re
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import flask  # noqa: E402
+import jwt  # noqa: E402
+from cryptography.hazmat.primitives import serialization  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import ec, rsa  # noqa: E402
+from flask import Flask, jsonify  # noqa: E402
+
+from flask_jwt_simple import (  # noqa: E402
+    JWTManager, jwt_required, create_jwt, decode_jwt
+)
+from flask_jwt_simple.config import get_settings  # noqa: E402
+from flask_jwt_simple.view_decorators import _decode_jwt_from_headers  # noqa: E402
+
+ALGORITHMS = ['HS256', 'HS384', 'HS512', 'RS256', 'ES256', 'PS256']
+
+# Number of extra claims added to the default token data
+PAYLOAD_SIZES = {
+    'small': 0,
+    'medium': 32,
+    'large': 128,
+}
+
+
+def _pem_pair(private_key):
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('utf-8')
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('utf-8')
+    return private_pem, public_pem
+
+
+def _keys():
+    rsa_keys = _pem_pair(rsa.generate_private_key(65537, 2048))
+    ec_keys = _pem_pair(ec.generate_private_key(ec.SECP256R1()))
+    bad_rsa_keys = _pem_pair(rsa.generate_private_key(65537, 2048))
+    bad_ec_keys = _pem_pair(ec.generate_private_key(ec.SECP256R1()))
+    return {
+        'RS': (rsa_keys, bad_rsa_keys),
+        'PS': (rsa_keys, bad_rsa_keys),
+        'ES': (ec_keys, bad_ec_keys),
+    }
+
+
+def _make_app(algorithm, payload_size, keys, bad=False):
+    app = Flask(__name__)
+    app.config['JWT_ALGORITHM'] = algorithm
+    if algorithm.startswith('HS'):
+        app.config['JWT_SECRET_KEY'] = 'bad-secret' if bad else 'secret'
+    else:
+        good_keys, bad_keys = keys[algorithm[:2]]
+        private_pem, public_pem = bad_keys if bad else good_keys
+        app.config['JWT_PRIVATE_KEY'] = private_pem
+        app.config['JWT_PUBLIC_KEY'] = public_pem
+    jwt_manager = JWTManager(app)
+
+    extra_claims = {
+        'claim_{}'.format(i): 'value_{}'.format(i)
+        for i in range(PAYLOAD_SIZES[payload_size])
+    }
+
+    @jwt_manager.jwt_data_loader
+    def jwt_data(identity):
+        now = datetime.datetime.utcnow()
+        data = {
+            'exp': now + app.config['JWT_EXPIRES'],
+            'iat': now,
+            'nbf': now,
+            'sub': identity,
+        }
+        data.update(extra_claims)
+        return data
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    return app
+
+
+def _token(app, expires=None):
+    if expires is not None:
+        app.config['JWT_EXPIRES'] = expires
+    with app.app_context():
+        token = create_jwt('username')
+    app.config['JWT_EXPIRES'] = datetime.timedelta(hours=1)
+    return token
+
+
+def _suppress(fn, exceptions):
+    def run():
+        try:
+            fn()
+        except exceptions:
+            pass
+    return run
+
+
+def _cases(keys, name_filter):
+    """
+    Yields (name, app, headers, fn) for every benchmark matching the filter.
+    The function is called with the app context (and a request context with
+    the given headers) pushed.
+    """
+    errors = (jwt.InvalidTokenError,)
+    for algorithm in ALGORITHMS:
+        for payload_size in PAYLOAD_SIZES:
+            prefix = '{}/{}'.format(algorithm, payload_size)
+
+            def wanted(name):
+                return name_filter is None or name_filter.search(name)
+
+            app = _make_app(algorithm, payload_size, keys)
+            bad_app = _make_app(algorithm, payload_size, keys, bad=True)
+            valid = _token(app)
+            expired = _token(app, datetime.timedelta(hours=-1))
+            invalid = _token(bad_app)
+
+            tokens = (('valid', valid), ('expired', expired),
+                      ('invalid', invalid))
+
+            name = '{}/create_jwt'.format(prefix)
+            if wanted(name):
+                yield name, app, {}, lambda: create_jwt('username')
+
+            for outcome, token in tokens:
+                name = '{}/decode_jwt/{}'.format(prefix, outcome)
+                if wanted(name):
+                    fn = _suppress(lambda t=token: decode_jwt(t), errors)
+                    yield name, app, {}, fn
+
+                name = '{}/decode_jwt_from_headers/{}'.format(prefix, outcome)
+                if wanted(name):
+                    headers = {'Authorization': 'Bearer {}'.format(token)}
+                    fn = _suppress(lambda s=get_settings(app): _decode_jwt_from_headers(s),
+                                   errors)
+                    yield name, app, headers, fn
+
+                name = '{}/jwt_required/{}'.format(prefix, outcome)
+                if wanted(name):
+                    client = app.test_client()
+                    headers = {'Authorization': 'Bearer {}'.format(token)}
+
+                    def request(c=client, h=headers):
+                        c.get('/protected', headers=h)
+                    yield name, app, {}, request
+
+
+def _measure(app, headers, fn, min_time, repeat):
+    with app.test_request_context(headers=headers):
+        timer = timeit.Timer(fn)
+        number, _ = timer.autorange()
+        number = max(1, int(number * min_time / 0.2))
+        timings = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    timings.sort()
+    best = timings[0]
+    median = timings[len(timings) // 2]
+    return {
+        'usec_per_op': round(best * 1e6, 3),
+        'median_usec_per_op': round(median * 1e6, 3),
+        'ops_per_sec': round(1.0 / best, 1),
+        'iterations': number,
+    }
+
+
+def run(name_filter=None, min_time=0.2, repeat=5, out=sys.stderr):
+    keys = _keys()
+    results = {}
+    for name, app, headers, fn in _cases(keys, name_filter):
+        results[name] = _measure(app, headers, fn, min_time, repeat)
+        print('{:<55} {:>12.2f} us  {:>12.1f} ops/s'.format(
+            name, results[name]['usec_per_op'], results[name]['ops_per_sec']
+        ), file=out)
+    return {
+        'meta': {
+            'created': datetime.datetime.utcnow().isoformat() + 'Z',
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'flask': getattr(flask, '__version__', 'unknown'),
+            'pyjwt': jwt.__version__,
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, threshold, out=sys.stderr):
+    """
+    Prints how every benchmark changed compared to the baseline, and returns
+    the names of the ones that got slower by more than the threshold.
+    """
+    regressions = []
+    print('\n{:<55} {:>10} {:>10} {:>8}'.format(
+        'benchmark', 'baseline', 'current', 'change'), file=out)
+    for name, result in sorted(current['results'].items()):
+        base = baseline['results'].get(name)
+        if base is None:
+            continue
+        change = result['usec_per_op'] / base['usec_per_op'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print('{:<55} {:>10.2f} {:>10.2f} {:>+7.1%}{}'.format(
+            name, base['usec_per_op'], result['usec_per_op'], change, flag
+        ), file=out)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-k', '--filter', help='Only run benchmarks whose name '
+                        'matches this regular expression')
+    parser.add_argument('-o', '--output', help='Write the results as json to '
+                        'this file (defaults to stdout)')
+    parser.add_argument('--baseline', help='Compare the results against this '
+                        'baseline file')
+    parser.add_argument('--save-baseline', help='Write the results to this '
+                        'baseline file')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='How much slower than the baseline a benchmark '
+                        'can get before it counts as a regression (default: '
+                        '0.10, i.e. 10%%)')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Seconds to spend on each timing run')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Timing runs per benchmark; the best is kept')
+    args = parser.parse_args(argv)
+
+    name_filter = re.compile(args.filter) if args.filter else None
+    start = time.time()
+    results = run(name_filter, args.min_time, args.repeat)
+    print('\nRan {} benchmarks in {:.1f}s'.format(
+        len(results['results']), time.time() - start), file=sys.stderr)
+
+    serialized = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(serialized + '\n')
+    elif not args.save_baseline:
+        print(serialized)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(serialized + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print('\n{} benchmark(s) regressed by more than {:.0%}'.format(
+                len(regressions), args.threshold), file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,6 @@
 from .jwt_manager import JWTManager
 from .view_decorators import jwt_required, jwt_optional
-from .utils import get_jwt, get_jwt_identity, decode_jwt, create_jwt
+from .utils import (
+    get_jwt, get_jwt_identity, decode_jwt, decode_jwts, create_jwt, create_jwts,
+    decode_jwt_async, create_jwt_async
+)
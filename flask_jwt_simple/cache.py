@@ -0,0 +1,135 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'evictions',
+                                     'maxsize', 'currsize'])
+
+
+def token_digest(encoded_token):
+    """
+    Returns the digest used to key a token in the caches of this extension,
+    so that we never have to hold on to the raw tokens themselves.
+    """
+    if not isinstance(encoded_token, bytes):
+        encoded_token = encoded_token.encode('utf-8')
+    return hashlib.sha256(encoded_token).digest()
+
+
+# The fingerprints of verifying keys, by id(). Loaded keys are not always
+# hashable, so the key is kept along with its fingerprint, which also stops
+# its id from being reused by another object.
+_key_fingerprints = {}
+_max_key_fingerprints = 64
+
+
+def _key_fingerprint(key):
+    entry = _key_fingerprints.get(id(key))
+    if entry is not None and entry[0] is key:
+        return entry[1]
+
+    if isinstance(key, str):
+        key_bytes = key.encode('utf-8')
+    elif isinstance(key, bytes):
+        key_bytes = key
+    elif hasattr(key, 'public_bytes'):
+        from cryptography.hazmat.primitives.serialization import (
+            Encoding, PublicFormat)
+        key_bytes = key.public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+    else:
+        # There is nothing which identifies this key in other processes, so
+        # tokens verified with it are only ever matched within this one
+        key_bytes = os.urandom(32)
+
+    if len(_key_fingerprints) >= _max_key_fingerprints:
+        _key_fingerprints.clear()
+    fingerprint = hashlib.sha256(key_bytes).digest()
+    _key_fingerprints[id(key)] = (key, fingerprint)
+    return fingerprint
+
+
+def verified_digest(digest, algorithm, kid, key):
+    """
+    Returns the digest a token is remembered as verified under in a shared
+    store, given its :func:`token_digest`. It is bound to the algorithm and
+    the key the token was verified with, so that a token verified by one app
+    is never taken as verified by an app with other keys sharing the store.
+    """
+    return hashlib.sha256(b'\0'.join((
+        algorithm.encode('utf-8'),
+        repr(kid).encode('utf-8'),
+        _key_fingerprint(key),
+        digest,
+    ))).digest()
+
+
+class _TokenCache(object):
+    """
+    A size bounded, thread safe LRU cache where every entry also carries its
+    own expiration time. This is meant for internal use of the extension.
+
+    A new cache is created every time the settings of an app are compiled,
+    so nothing verified with an old key can be returned after the keys in
+    the app config are changed.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._data[key]
+                self._misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key, value, expires_at=None):
+        if self.maxsize <= 0:
+            return
+
+        entry_expires = time.time() + self.ttl
+        if expires_at is not None:
+            entry_expires = min(entry_expires, float(expires_at))
+
+        with self._lock:
+            self._data[key] = (entry_expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def cache_info(self):
+        """
+        Returns a :class:`CacheInfo` tuple with the hit, miss and eviction
+        counters of this cache, as well as its current and maximum size.
+        """
+        with self._lock:
+            return CacheInfo(self._hits, self._misses, self._evictions,
+                             self.maxsize, len(self._data))
+
+    def __len__(self):
+        return len(self._data)
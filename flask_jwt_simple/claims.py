@@ -0,0 +1,124 @@
+from jwt.exceptions import DecodeError
+
+# Claims which are validated by name when a token is decoded, before any
+# renamed claims are expanded, so they must keep their names
+_validated_claims = frozenset(['exp', 'iat', 'nbf', 'aud'])
+
+
+class ClaimMap(object):
+    """
+    Renames claims to shorter names when tokens are created, and back to
+    their full names when tokens are decoded, so that ``get_jwt()`` and the
+    callbacks never see the short names. Set up from ``JWT_CLAIM_MAP``::
+
+        app.config['JWT_CLAIM_MAP'] = {
+            'permissions': 'p',
+            'role': ('r', ['user', 'admin', 'owner']),
+        }
+
+    A claim can also come with the values it can take, in which case it is
+    stored as the index of its value (or as a list of indexes, if the claim
+    is a list of values). New values must only ever be added to the end, or
+    tokens which are already out there would change meaning.
+
+    Claims which are not in the map are left alone, so tokens created before
+    a claim was added to the map are still understood.
+
+    :param claim_map: A dict of full claim name to short claim name, or to a
+                      ``(short name, values)`` tuple.
+    """
+
+    def __init__(self, claim_map):
+        self._compact = {}
+        self._expand = {}
+        for name, spec in claim_map.items():
+            if isinstance(spec, str):
+                short_name, values = spec, None
+            else:
+                try:
+                    short_name, values = spec
+                    values = tuple(values)
+                except (TypeError, ValueError):
+                    raise ValueError('The "{}" claim must map to a name, or to '
+                                     'a (name, values) tuple'.format(name))
+            if not isinstance(name, str) or not isinstance(short_name, str):
+                raise ValueError('Claim names must be strings')
+            for claim in (name, short_name):
+                if claim in _validated_claims:
+                    raise ValueError('The "{}" claim cannot be renamed'.format(claim))
+            if short_name in self._expand:
+                raise ValueError('The name "{}" is used for more than one '
+                                 'claim'.format(short_name))
+
+            indexes = None
+            if values is not None:
+                try:
+                    indexes = {value: index for index, value in enumerate(values)}
+                except TypeError:
+                    raise ValueError('The values of the "{}" claim must be '
+                                     'hashable'.format(name))
+                if len(indexes) != len(values):
+                    raise ValueError('The values of the "{}" claim must be '
+                                     'unique'.format(name))
+            self._compact[name] = (short_name, indexes)
+            self._expand[short_name] = (name, values)
+
+    def compact(self, jwt_data):
+        """
+        Returns a copy of jwt_data with the claims in the map renamed to
+        their short names, and their values encoded. Raises a ValueError
+        for a value which is not one of the values of its claim.
+        """
+        compact_claims = self._compact
+        short_names = self._expand
+        compacted = {}
+        for name, value in jwt_data.items():
+            try:
+                short_name, indexes = compact_claims[name]
+            except KeyError:
+                if name in short_names:
+                    raise ValueError('The "{}" claim has the same name as a '
+                                     'renamed claim'.format(name))
+                compacted[name] = value
+                continue
+            if indexes is not None:
+                value = _encode_value(name, value, indexes)
+            compacted[short_name] = value
+        return compacted
+
+    def expand(self, jwt_data):
+        """
+        Returns a copy of decoded jwt_data with the claims in the map given
+        back their full names and values. Raises a ``jwt.DecodeError`` for
+        a value which is not the index of one of the values of its claim.
+        """
+        expand_claims = self._expand
+        expanded = {}
+        for name, value in jwt_data.items():
+            try:
+                full_name, values = expand_claims[name]
+            except KeyError:
+                expanded[name] = value
+                continue
+            if values is not None:
+                value = _decode_value(full_name, value, values)
+            expanded[full_name] = value
+        return expanded
+
+
+def _encode_value(name, value, indexes):
+    try:
+        if isinstance(value, list):
+            return [indexes[v] for v in value]
+        return indexes[value]
+    except (KeyError, TypeError):
+        raise ValueError('The "{}" claim can only be one of {}, or a list of '
+                         'them'.format(name, list(indexes)))
+
+
+def _decode_value(name, value, values):
+    if isinstance(value, list):
+        return [_decode_value(name, v, values) for v in value]
+    if type(value) is not int or not 0 <= value < len(values):
+        raise DecodeError('Invalid value for the "{}" claim'.format(name))
+    return values[value]
@@ -0,0 +1,98 @@
+import json
+from collections import deque
+from time import perf_counter
+
+import click
+from flask.cli import AppGroup
+
+from flask_jwt_simple.config import get_settings
+from flask_jwt_simple.utils import create_jwt, create_jwts, decode_jwt
+
+# The commands of this extension, as in ``flask jwt issue``. Registered with
+# the app by JWTManager.init_app.
+jwt_cli = AppGroup('jwt', help='Create and benchmark JWTs.')
+
+_percentiles = (50, 90, 99)
+
+
+@jwt_cli.command('issue')
+@click.option('--from', 'source', type=click.File('r'), default='-',
+              help='A file with one identity per line. Defaults to stdin.')
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Where to write the tokens. Defaults to stdout.')
+@click.option('--workers', type=int, default=None,
+              help='How many threads to sign the tokens with. Defaults to '
+                   'JWT_BATCH_WORKERS.')
+def issue_command(source, output, workers):
+    """
+    Creates a token for every identity in a file.
+
+    The tokens are written out as JSON lines of {"identity": ..., "jwt": ...}.
+    Identities are read as the tokens are written, so any number of them
+    can be handled.
+    """
+    # The identities create_jwts has read but not yet returned a token for
+    pending = deque()
+
+    def read_identities():
+        for line in source:
+            identity = line.strip()
+            if identity:
+                pending.append(identity)
+                yield identity
+
+    for token in create_jwts(read_identities(), workers):
+        line = json.dumps({'identity': pending.popleft(), 'jwt': token})
+        output.write(line + '\n')
+
+
+@jwt_cli.command('bench')
+@click.option('--count', '-n', type=click.IntRange(min=1), default=10000,
+              help='How many tokens to create and decode.')
+@click.option('--identity', default='bench',
+              help='The identity to create the tokens for.')
+def bench_command(count, identity):
+    """
+    Measures how fast tokens are created and decoded.
+
+    create_jwt and decode_jwt are run with the algorithm, keys and options
+    of the app, and the operations per second and latency percentiles of
+    each are reported.
+    """
+    settings = get_settings()
+    click.echo('Algorithm: {}'.format(settings.algorithm))
+
+    # Warm up, so the measurements do not include loading anything
+    try:
+        decode_jwt(create_jwt(identity))
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+
+    tokens = []
+    durations = []
+    for _ in range(count):
+        start = perf_counter()
+        token = create_jwt(identity)
+        durations.append(perf_counter() - start)
+        tokens.append(token)
+    click.echo(_format_results('create_jwt', durations))
+
+    # Every token is decoded once, as a server sees them
+    durations = []
+    for token in tokens:
+        start = perf_counter()
+        decode_jwt(token)
+        durations.append(perf_counter() - start)
+    click.echo(_format_results('decode_jwt', durations))
+
+
+def _format_results(name, durations):
+    durations = sorted(durations)
+    total = sum(durations)
+    ops = len(durations) / total if total else float('inf')
+    columns = ['{:<12}{:>12.0f} ops/s'.format(name, ops)]
+    for percentile in _percentiles:
+        index = min(len(durations) - 1, len(durations) * percentile // 100)
+        columns.append('p{} {:.1f}us'.format(percentile, durations[index] * 1e6))
+    columns.append('max {:.1f}us'.format(durations[-1] * 1e6))
+    return '  '.join(columns)
@@ -1,6 +1,14 @@
 import datetime
+import logging
 
 from flask import current_app
+from jwt.algorithms import get_default_algorithms
+
+from flask_jwt_simple import jws
+from flask_jwt_simple.cache import _TokenCache
+from flask_jwt_simple.claims import ClaimMap
+from flask_jwt_simple.jwks import JWKSSource
+from flask_jwt_simple.keys import KeyRing, _key_or_raise
 
 # Older versions of pyjwt do not have the requires_cryptography set. Also,
 # older versions will not be adding new algorithms to them, so I can hard code
@@ -14,6 +22,8 @@ except ImportError:  # pragma: no cover
     requires_cryptography = {'RS256', 'RS384', 'RS512', 'ES256', 'ES384',
                              'ES521', 'ES512', 'PS256', 'PS384', 'PS512'}
 
+logger = logging.getLogger(__name__)
+
 
 class _Config(object):
     """
@@ -25,6 +35,16 @@ class _Config(object):
     object. All of these values are read only.
     """
 
+    def __init__(self, app_config=None):
+        # When no config is given, options are read from the current app
+        self._bound_config = app_config
+
+    @property
+    def _app_config(self):
+        if self._bound_config is not None:
+            return self._bound_config
+        return current_app.config
+
     @property
     def is_asymmetric(self):
         return self.algorithm in requires_cryptography
@@ -39,33 +59,33 @@ class _Config(object):
 
     @property
     def header_name(self):
-        name = current_app.config['JWT_HEADER_NAME']
+        name = self._app_config['JWT_HEADER_NAME']
         if not name:
             raise RuntimeError("JWT_HEADER_NAME cannot be empty")
         return name
 
     @property
     def header_type(self):
-        return current_app.config['JWT_HEADER_TYPE']
+        return self._app_config['JWT_HEADER_TYPE']
 
     @property
     def jwt_expires(self):
-        delta = current_app.config['JWT_EXPIRES']
+        delta = self._app_config['JWT_EXPIRES']
         if not isinstance(delta, datetime.timedelta):
             raise RuntimeError('JWT_EXPIRES must be a datetime.timedelta')
         return delta
 
     @property
     def algorithm(self):
-        return current_app.config['JWT_ALGORITHM']
+        return self._app_config['JWT_ALGORITHM']
 
     @property
     def audience(self):
-        return current_app.config['JWT_DECODE_AUDIENCE']
+        return self._app_config['JWT_DECODE_AUDIENCE']
 
     @property
     def _secret_key(self):
-        key = current_app.config['JWT_SECRET_KEY']
+        key = self._app_config['JWT_SECRET_KEY']
         if not key:
             raise RuntimeError('JWT_SECRET_KEY must be set to use '
                                'symmetric cryptography algorithm '
@@ -74,7 +94,7 @@ class _Config(object):
 
     @property
     def _public_key(self):
-        key = current_app.config['JWT_PUBLIC_KEY']
+        key = self._app_config['JWT_PUBLIC_KEY']
         if not key:
             raise RuntimeError('JWT_PUBLIC_KEY must be set to use '
                                'asymmetric cryptography algorithm '
@@ -83,7 +103,7 @@ class _Config(object):
 
     @property
     def _private_key(self):
-        key = current_app.config['JWT_PRIVATE_KEY']
+        key = self._app_config['JWT_PRIVATE_KEY']
         if not key:
             raise RuntimeError('JWT_PRIVATE_KEY must be set to use '
                                'asymmetric cryptography algorithm '
@@ -92,8 +112,361 @@ class _Config(object):
 
     @property
     def identity_claim(self):
-        return current_app.config['JWT_IDENTITY_CLAIM']
+        return self._app_config['JWT_IDENTITY_CLAIM']
+
+    @property
+    def decode_cache_size(self):
+        size = self._app_config['JWT_DECODE_CACHE_SIZE']
+        if not isinstance(size, int) or size < 0:
+            raise RuntimeError('JWT_DECODE_CACHE_SIZE must be a non-negative integer')
+        return size
+
+    @property
+    def decode_cache_ttl(self):
+        delta = self._app_config['JWT_DECODE_CACHE_TTL']
+        if not isinstance(delta, datetime.timedelta):
+            raise RuntimeError('JWT_DECODE_CACHE_TTL must be a datetime.timedelta')
+        return delta.total_seconds()
+
+    @property
+    def max_token_length(self):
+        length = self._app_config['JWT_MAX_TOKEN_LENGTH']
+        if length is not None and (not isinstance(length, int) or length < 1):
+            raise RuntimeError('JWT_MAX_TOKEN_LENGTH must be None or a '
+                               'positive integer')
+        return length
+
+    @property
+    def optional_lazy_decode(self):
+        return self._app_config['JWT_OPTIONAL_LAZY_DECODE']
+
+    @property
+    def negative_cache_size(self):
+        size = self._app_config['JWT_NEGATIVE_CACHE_SIZE']
+        if not isinstance(size, int) or size < 0:
+            raise RuntimeError('JWT_NEGATIVE_CACHE_SIZE must be a non-negative integer')
+        return size
+
+    @property
+    def negative_cache_ttl(self):
+        delta = self._app_config['JWT_NEGATIVE_CACHE_TTL']
+        if not isinstance(delta, datetime.timedelta):
+            raise RuntimeError('JWT_NEGATIVE_CACHE_TTL must be a datetime.timedelta')
+        return delta.total_seconds()
+
+    @property
+    def batch_workers(self):
+        workers = self._app_config['JWT_BATCH_WORKERS']
+        if not isinstance(workers, int) or workers < 1:
+            raise RuntimeError('JWT_BATCH_WORKERS must be a positive integer')
+        return workers
+
+    @property
+    def keys(self):
+        keys = self._app_config['JWT_KEYS']
+        if keys is None:
+            return {}
+        if not isinstance(keys, dict):
+            raise RuntimeError('JWT_KEYS must be None or a dict of kid to key')
+        for kid, key in keys.items():
+            if not isinstance(kid, str):
+                raise RuntimeError('The kids in JWT_KEYS must be strings')
+            if self.is_asymmetric and (not isinstance(key, (tuple, list)) or
+                                       len(key) != 2):
+                raise RuntimeError('The keys in JWT_KEYS must be (private_key, '
+                                   'public_key) tuples when using the {} '
+                                   'algorithm'.format(self.algorithm))
+        return keys
+
+    @property
+    def active_kid(self):
+        kid = self._app_config['JWT_ACTIVE_KID']
+        if kid is None:
+            return None
+        keys = self.keys
+        if kid not in keys:
+            raise RuntimeError('JWT_ACTIVE_KID must be one of the kids in JWT_KEYS')
+        if self.is_asymmetric and keys[kid][0] is None:
+            raise RuntimeError('The key for JWT_ACTIVE_KID must have a private key')
+        return kid
+
+    @property
+    def jwks_source(self):
+        source = self._app_config['JWT_JWKS_SOURCE']
+        if source is not None and not isinstance(source, str):
+            raise RuntimeError('JWT_JWKS_SOURCE must be None, a file path or a url')
+        return source
+
+    @property
+    def jwks_ttl(self):
+        delta = self._app_config['JWT_JWKS_TTL']
+        if not isinstance(delta, datetime.timedelta):
+            raise RuntimeError('JWT_JWKS_TTL must be a datetime.timedelta')
+        return delta.total_seconds()
+
+    @property
+    def jwks_refresh_interval(self):
+        delta = self._app_config['JWT_JWKS_REFRESH_INTERVAL']
+        if not isinstance(delta, datetime.timedelta):
+            raise RuntimeError('JWT_JWKS_REFRESH_INTERVAL must be a datetime.timedelta')
+        return delta.total_seconds()
+
+    @property
+    def shared_store(self):
+        store = self._app_config['JWT_SHARED_STORE']
+        if store is not None and not hasattr(store, 'mark_verified'):
+            raise RuntimeError('JWT_SHARED_STORE must be None or a '
+                               'flask_jwt_simple.shared.SharedStore')
+        return store
+
+    @property
+    def json_dumps(self):
+        dumps = self._app_config['JWT_JSON_DUMPS']
+        if dumps is not None and not callable(dumps):
+            raise RuntimeError('JWT_JSON_DUMPS must be None or a callable')
+        return dumps
+
+    @property
+    def json_loads(self):
+        loads = self._app_config['JWT_JSON_LOADS']
+        if loads is not None and not callable(loads):
+            raise RuntimeError('JWT_JSON_LOADS must be None or a callable')
+        return loads
+
+    @property
+    def claim_map(self):
+        claim_map = self._app_config['JWT_CLAIM_MAP']
+        if not claim_map:
+            return None
+        if not isinstance(claim_map, dict):
+            raise RuntimeError('JWT_CLAIM_MAP must be None or a dict')
+        try:
+            return ClaimMap(claim_map)
+        except ValueError as e:
+            raise RuntimeError('Invalid JWT_CLAIM_MAP: {}'.format(e))
+
+    @property
+    def compress_threshold(self):
+        threshold = self._app_config['JWT_COMPRESS_THRESHOLD']
+        if threshold is not None and (not isinstance(threshold, int) or threshold < 0):
+            raise RuntimeError('JWT_COMPRESS_THRESHOLD must be None or a '
+                               'non-negative integer')
+        return threshold
+
+    @property
+    def max_decompressed_size(self):
+        size = self._app_config['JWT_MAX_DECOMPRESSED_SIZE']
+        if not isinstance(size, int) or size < 1:
+            raise RuntimeError('JWT_MAX_DECOMPRESSED_SIZE must be a positive integer')
+        return size
+
+    @property
+    def direct_error_responses(self):
+        return self._app_config['JWT_DIRECT_ERROR_RESPONSES']
+
+    @property
+    def upstream_header(self):
+        return self._app_config['JWT_UPSTREAM_HEADER'] or None
+
+    @property
+    def upstream_secret(self):
+        secret = self._app_config['JWT_UPSTREAM_SECRET']
+        if self.upstream_header and not secret:
+            raise RuntimeError('JWT_UPSTREAM_SECRET must be set to use '
+                               'JWT_UPSTREAM_HEADER')
+        return secret
+
+    @property
+    def upstream_max_age(self):
+        delta = self._app_config['JWT_UPSTREAM_MAX_AGE']
+        if not isinstance(delta, datetime.timedelta):
+            raise RuntimeError('JWT_UPSTREAM_MAX_AGE must be a datetime.timedelta')
+        return delta.total_seconds()
+
+    @property
+    def metrics_enabled(self):
+        return self._app_config['JWT_METRICS_ENABLED'] or bool(self.metrics_url)
+
+    @property
+    def metrics_url(self):
+        url = self._app_config['JWT_METRICS_URL']
+        if url is not None and (not isinstance(url, str) or not url.startswith('/')):
+            raise RuntimeError('JWT_METRICS_URL must be None or a path '
+                               'starting with "/"')
+        return url
 
 config = _Config()
 
 
+class _Settings(object):
+    """
+    An immutable snapshot of the options in :class:`_Config` for one
+    application. This is compiled (and validated) when the
+    :class:`~flask_jwt_simple.JWTManager` is registered with an app, so that
+    handling a request only needs to read plain attributes. If the app config
+    is changed afterwards, ``JWTManager.refresh_config`` must be called for
+    the changes to take effect.
+
+    Besides the raw ``encode_key`` and ``decode_key``, the settings hold the
+    ``signing_key`` and ``verifying_key`` already loaded into the objects
+    pyjwt works with, so that PEM keys are not parsed again for every token.
+    """
+    __slots__ = ('header_name', 'header_type', 'jwt_expires', 'algorithm',
+                 'is_asymmetric', 'audience', 'identity_claim',
+                 'decode_cache_size', 'decode_cache_ttl', 'decode_cache',
+                 'negative_cache_size', 'negative_cache_ttl', 'negative_cache',
+                 'batch_workers', 'optional_lazy_decode', 'max_token_length',
+                 'shared_store', 'timing_listeners', 'key_ring', 'decoder',
+                 'json_dumps', 'json_loads', 'claim_map', 'compress_threshold',
+                 'max_decompressed_size', 'error_bodies',
+                 'direct_error_responses', 'upstream_header',
+                 'upstream_secret', 'upstream_max_age', '_encode_key',
+                 '_decode_key')
+
+    def __init__(self, app_config, load_key=None, timing_listeners=()):
+        source = _Config(app_config)
+        load_key = load_key or prepare_key
+        _set = super(_Settings, self).__setattr__
+        _set('header_name', source.header_name)
+        _set('header_type', source.header_type)
+        _set('jwt_expires', source.jwt_expires)
+        _set('algorithm', source.algorithm)
+
+        # Tokens are decoded without going through pyjwt, unless it is an
+        # algorithm only pyjwt knows what to do with (or how to reject)
+        if self.algorithm in jws._algorithms:
+            _set('decoder', jws.decode)
+        else:
+            _set('decoder', jws.decode_with_pyjwt)
+        _set('json_dumps', source.json_dumps)
+        _set('json_loads', source.json_loads)
+        _set('claim_map', source.claim_map)
+        _set('compress_threshold', source.compress_threshold)
+        _set('max_decompressed_size', source.max_decompressed_size)
+
+        # Serialized bodies of the default error responses, by message
+        _set('error_bodies', {})
+        _set('direct_error_responses', source.direct_error_responses)
+        _set('is_asymmetric', source.is_asymmetric)
+        _set('audience', source.audience)
+        _set('identity_claim', source.identity_claim)
+        _set('decode_cache_size', source.decode_cache_size)
+        _set('decode_cache_ttl', source.decode_cache_ttl)
+        _set('decode_cache', _TokenCache(self.decode_cache_size,
+                                         self.decode_cache_ttl))
+        _set('negative_cache_size', source.negative_cache_size)
+        _set('negative_cache_ttl', source.negative_cache_ttl)
+        _set('negative_cache', _TokenCache(self.negative_cache_size,
+                                           self.negative_cache_ttl))
+        _set('batch_workers', source.batch_workers)
+        _set('optional_lazy_decode', source.optional_lazy_decode)
+        _set('max_token_length', source.max_token_length)
+        _set('shared_store', source.shared_store)
+        _set('upstream_header', source.upstream_header)
+        _set('upstream_secret', source.upstream_secret)
+        _set('upstream_max_age', source.upstream_max_age)
+
+        # Shared with the JWTManager, so listeners registered later are seen
+        _set('timing_listeners', timing_listeners)
+
+        # Keys are allowed to be missing until they are actually used, as
+        # only the ones for the configured algorithm are ever needed.
+        _set('_encode_key', _load_or_error(source, 'encode_key', load_key))
+        _set('_decode_key', _load_or_error(source, 'decode_key', load_key))
+
+        # With a JWKS, there does not have to be a key for tokens without a kid
+        jwks_source = source.jwks_source
+        default_verifying = self._decode_key
+        if jwks_source and default_verifying[2]:
+            default_verifying = None
+
+        # Cached results may not hold any more once the keys change
+        key_ring = KeyRing(self.algorithm, self.is_asymmetric, load_key,
+                           self._encode_key, default_verifying,
+                           on_change=self.clear_caches)
+        for kid, key in source.keys.items():
+            key_ring.add(kid, key)
+        key_ring.activate(source.active_kid)
+        _set('key_ring', key_ring)
+
+        if jwks_source:
+            key_ring.source = JWKSSource(jwks_source, key_ring, source.jwks_ttl,
+                                         source.jwks_refresh_interval)
+            try:
+                key_ring.source.refresh()
+            except Exception as e:
+                # The app can still start, and the keys are loaded later
+                logger.warning('Unable to load the JWKS from %s: %s',
+                               jwks_source, e)
+
+    def clear_caches(self):
+        """
+        Empties the verified and rejected token caches.
+        """
+        self.decode_cache.clear()
+        self.negative_cache.clear()
+        if self.shared_store is not None:
+            self.shared_store.clear_verified()
+
+    def __setattr__(self, name, value):
+        raise AttributeError('JWT settings are read only, use '
+                             'JWTManager.refresh_config() to change them')
+
+    @property
+    def encode_key(self):
+        return _key_or_raise(self._encode_key)[0]
+
+    @property
+    def decode_key(self):
+        return _key_or_raise(self._decode_key)[0]
+
+    @property
+    def signing_key(self):
+        return _key_or_raise(self._encode_key)[1]
+
+    @property
+    def verifying_key(self):
+        return _key_or_raise(self._decode_key)[1]
+
+
+def _load_or_error(source, name, load_key):
+    try:
+        key = getattr(source, name)
+    except RuntimeError as e:
+        return None, None, str(e)
+    return key, load_key(source.algorithm, key), None
+
+
+def prepare_key(algorithm, key):
+    """
+    Loads a key from the app config into the object pyjwt uses for the given
+    algorithm (for example parsing a PEM string into a cryptography key).
+    """
+    try:
+        alg_obj = get_default_algorithms()[algorithm]
+    except KeyError:
+        # Unknown algorithm, or cryptography is not installed. Hand the raw
+        # key to pyjwt and let it report the error when the key is used.
+        return key
+
+    try:
+        return alg_obj.prepare_key(key)
+    except Exception as e:
+        raise RuntimeError('Unable to load the key for the "{}" algorithm: '
+                           '{}'.format(algorithm, e))
+
+
+def get_settings(app=None):
+    """
+    Returns the compiled :class:`_Settings` of the given app, or of the
+    current app if no app is given.
+    """
+    if app is None:
+        app = current_app
+    try:
+        return app.extensions['flask-jwt-simple-settings']
+    except KeyError:  # pragma: no cover
+        raise RuntimeError("You must initialize a JWTManager with this flask "
+                           "application before using this method")
+
+
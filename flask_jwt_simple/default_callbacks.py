@@ -1,27 +1,72 @@
 import datetime
+import uuid
+from calendar import timegm
 
-from flask import jsonify
+from flask import current_app, jsonify
 
-from flask_jwt_simple.config import config
+from flask_jwt_simple.config import get_settings
 
 
 def default_jwt_data_callback(identity):
     now = datetime.datetime.utcnow()
-    identity_claim = config.identity_claim
+    settings = get_settings()
     return {
-        'exp': now + config.jwt_expires,
+        'exp': now + settings.jwt_expires,
         'iat': now,
         'nbf': now,
-        identity_claim: identity
+        'jti': str(uuid.uuid4()),
+        settings.identity_claim: identity
     }
 
 
+def _batch_jwt_data_callback(settings, now):
+    """
+    Returns a function building the same data as default_jwt_data_callback,
+    where every token shares the timestamps of a single point in time.
+    """
+    iat = timegm(now.utctimetuple())
+    exp = timegm((now + settings.jwt_expires).utctimetuple())
+    identity_claim = settings.identity_claim
+
+    def get_jwt_data(identity):
+        return {'exp': exp, 'iat': iat, 'nbf': iat, 'jti': str(uuid.uuid4()),
+                identity_claim: identity}
+    return get_jwt_data
+
+
+# Most error messages are one of a handful of constant strings, but some
+# include details about the token, so there is a limit on how many are kept
+_max_error_bodies = 256
+
+
+def _error_response(msg, status):
+    """
+    Returns a json response with the error message, serialized with
+    JWT_JSON_DUMPS if it is set, and like flask's jsonify otherwise. The
+    body for each message is only serialized once per app.
+    """
+    settings = get_settings()
+    bodies = settings.error_bodies
+    try:
+        body = bodies[msg]
+    except KeyError:
+        dumps = settings.json_dumps
+        if dumps is None:
+            body = jsonify({'msg': msg}).get_data()
+        else:
+            body = dumps({'msg': msg})
+        if len(bodies) >= _max_error_bodies:
+            bodies.clear()
+        bodies[msg] = body
+    return current_app.response_class(body, mimetype='application/json'), status
+
+
 def default_expired_token_callback():
     """
     By default, if an expired token attempts to access a protected endpoint,
     we return a generic error message with a 401 status
     """
-    return jsonify({'msg': 'Token has expired'}), 401
+    return _error_response('Token has expired', 401)
 
 
 def default_invalid_token_callback(error_string):
@@ -31,7 +76,15 @@ def default_invalid_token_callback(error_string):
 
     :param error_string: String indicating why the token is invalid
     """
-    return jsonify({'msg': error_string}), 422
+    return _error_response(error_string, 422)
+
+
+def default_revoked_token_callback():
+    """
+    By default, if a revoked token attempts to access a protected endpoint,
+    we return a generic error message with a 401 status
+    """
+    return _error_response('Token has been revoked', 401)
 
 
 def default_unauthorized_callback(error_string):
@@ -41,4 +94,4 @@ def default_unauthorized_callback(error_string):
 
     :param error_string: String indicating why this request is unauthorized
     """
-    return jsonify({'msg': error_string}), 401
+    return _error_response(error_string, 401)
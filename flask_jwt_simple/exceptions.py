@@ -17,3 +17,10 @@ class NoAuthorizationError(FlaskJWTException):
     An error raised when no JWT was found when a protected endpoint was accessed
     """
     pass
+
+
+class RevokedTokenError(FlaskJWTException):
+    """
+    An error raised when a valid JWT has been revoked
+    """
+    pass
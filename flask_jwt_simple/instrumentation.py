@@ -0,0 +1,69 @@
+from collections import namedtuple
+from time import perf_counter
+
+import jwt
+
+from flask_jwt_simple.exceptions import (
+    InvalidHeaderError, NoAuthorizationError, RevokedTokenError
+)
+
+# What the listeners registered with JWTManager.timing_listener are called with
+PhaseTiming = namedtuple('PhaseTiming', ['operation', 'phase', 'algorithm',
+                                         'outcome', 'duration'])
+
+
+def outcome_for(error):
+    """
+    Returns the outcome reported to the timing listeners for an error raised
+    while handling a token.
+    """
+    if isinstance(error, NoAuthorizationError):
+        return 'missing'
+    if isinstance(error, InvalidHeaderError):
+        return 'invalid_header'
+    if isinstance(error, RevokedTokenError):
+        return 'revoked'
+    if isinstance(error, jwt.ExpiredSignatureError):
+        return 'expired'
+    if isinstance(error, jwt.InvalidTokenError):
+        return 'invalid'
+    return 'error'
+
+
+def notify(listeners, operation, phase, algorithm, outcome, start):
+    timing = PhaseTiming(operation, phase, algorithm, outcome,
+                         perf_counter() - start)
+    for listener in listeners:
+        listener(timing)
+
+
+def timed_call(listeners, operation, phase, algorithm, fn, args,
+               outcome='success'):
+    """
+    Calls fn with args, and reports how long it took to the listeners. If fn
+    raises an error, the outcome reported is the one for that error.
+    """
+    start = perf_counter()
+    try:
+        result = fn(*args)
+    except Exception as e:
+        notify(listeners, operation, phase, algorithm, outcome_for(e), start)
+        raise
+    notify(listeners, operation, phase, algorithm, outcome, start)
+    return result
+
+
+async def timed_await(listeners, operation, phase, algorithm, awaitable,
+                      outcome='success'):
+    """
+    Like :func:`timed_call`, but awaits awaitable, and reports how long that
+    took.
+    """
+    start = perf_counter()
+    try:
+        result = await awaitable
+    except Exception as e:
+        notify(listeners, operation, phase, algorithm, outcome_for(e), start)
+        raise
+    notify(listeners, operation, phase, algorithm, outcome, start)
+    return result
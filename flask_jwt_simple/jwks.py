@@ -0,0 +1,158 @@
+import json
+import logging
+import threading
+import time
+from urllib.request import urlopen
+
+from jwt.algorithms import get_default_algorithms
+
+from flask_jwt_simple.jws import base64url_decode
+
+logger = logging.getLogger(__name__)
+
+# How long to wait on the server when fetching a JWKS document over http
+_fetch_timeout = 10
+
+_ec_curves = {'P-256': 'SECP256R1', 'P-384': 'SECP384R1', 'P-521': 'SECP521R1'}
+
+
+def load_jwks(document, algorithm):
+    """
+    Returns the keys in a JWKS document which can verify tokens signed with
+    the given algorithm, loaded into the objects pyjwt works with, by kid.
+    Keys without a kid, keys for other algorithms, and keys which are not
+    meant for signatures are left out.
+
+    :param document: The JWKS document, as a string or a decoded dict.
+    """
+    if not isinstance(document, dict):
+        document = json.loads(document)
+    alg_obj = get_default_algorithms()[algorithm]
+
+    keys = {}
+    for jwk in document.get('keys', []):
+        kid = jwk.get('kid')
+        if not isinstance(kid, str):
+            continue
+        if jwk.get('use', 'sig') != 'sig' or jwk.get('alg', algorithm) != algorithm:
+            continue
+        try:
+            keys[kid] = _load_jwk(alg_obj, jwk)
+        except Exception as e:
+            logger.warning('Skipping the JWK with the kid "%s": %s', kid, e)
+    return keys
+
+
+def _load_jwk(alg_obj, jwk):
+    # pyjwt does not know how to load elliptic curve JWKs
+    if jwk.get('kty') == 'EC':
+        return _load_ec_jwk(jwk)
+    return alg_obj.from_jwk(json.dumps(jwk))
+
+
+def _load_ec_jwk(jwk):
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    curve = getattr(ec, _ec_curves[jwk['crv']])()
+    x = int.from_bytes(base64url_decode(jwk['x']), 'big')
+    y = int.from_bytes(base64url_decode(jwk['y']), 'big')
+    public_numbers = ec.EllipticCurvePublicNumbers(x, y, curve)
+    return public_numbers.public_key(default_backend())
+
+
+def _read(location):
+    if location.startswith(('http://', 'https://')):
+        with urlopen(location, timeout=_fetch_timeout) as response:
+            return response.read().decode('utf-8')
+    with open(location) as f:
+        return f.read()
+
+
+class JWKSSource(object):
+    """
+    Keeps the keys of a key ring in sync with a JWKS document, such as the
+    one published by an identity provider. Set up from ``JWT_JWKS_SOURCE``.
+
+    The document is loaded once when the options are read. After that, it is
+    refreshed in a background thread: when it is older than ``ttl``, or when
+    a token with an unknown kid comes in (at most once every
+    ``refresh_interval``). Requests keep using the keys already loaded in the
+    meantime, so no request ever waits on the document being fetched. If a
+    refresh fails, the keys already loaded are kept.
+
+    :param location: A path to a file, or an http(s) url.
+    :param key_ring: The :class:`~flask_jwt_simple.keys.KeyRing` to put the
+                     keys into.
+    :param ttl: Seconds before the document is refreshed.
+    :param refresh_interval: The least number of seconds between two
+                             refreshes.
+    """
+
+    def __init__(self, location, key_ring, ttl=300, refresh_interval=30):
+        self.location = location
+        self.key_ring = key_ring
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._fresh_until = 0
+        self._last_attempt = None
+
+    def refresh(self):
+        """
+        Fetches the document and updates the keys right away, in the calling
+        thread. Raises an error if the document could not be loaded.
+        """
+        with self._lock:
+            self._last_attempt = time.monotonic()
+        try:
+            keys = load_jwks(_read(self.location), self.key_ring.algorithm)
+        except Exception as e:
+            self.last_error = e
+            raise
+        self.key_ring.set_source_keys(keys)
+        self.last_error = None
+        self._fresh_until = time.monotonic() + self.ttl
+
+    def refresh_if_stale(self):
+        """
+        Starts refreshing the document in the background if it is older
+        than the ttl.
+        """
+        if time.monotonic() >= self._fresh_until:
+            self._refresh_in_background()
+
+    def refresh_soon(self):
+        """
+        Starts refreshing the document in the background, unless that was
+        already done in the last ``refresh_interval`` seconds.
+        """
+        self._refresh_in_background()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            last_attempt = self._last_attempt
+            if (last_attempt is not None and
+                    time.monotonic() - last_attempt < self.refresh_interval):
+                return
+            self._refreshing = True
+            self._last_attempt = time.monotonic()
+
+        thread = threading.Thread(target=self._background_refresh,
+                                  name='flask-jwt-simple-jwks')
+        thread.daemon = True
+        thread.start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        except Exception as e:
+            logger.warning('Unable to refresh the JWKS from %s: %s',
+                           self.location, e)
+        finally:
+            with self._lock:
+                self._refreshing = False
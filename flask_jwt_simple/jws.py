@@ -0,0 +1,395 @@
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import re
+import time
+import zlib
+from calendar import timegm
+from datetime import datetime
+
+import jwt
+from jwt.algorithms import get_default_algorithms
+from jwt.exceptions import (
+    DecodeError, ExpiredSignatureError, ImmatureSignatureError,
+    InvalidAlgorithmError, InvalidAudienceError, InvalidIssuedAtError,
+    InvalidSignatureError, MissingRequiredClaimError
+)
+
+# Helpers for putting together the compact serialization of a signed JWT. These
+# produce exactly the same output as jwt.encode, but let the parts that are the
+# same for every token (such as the header segment) be built only once.
+_algorithms = get_default_algorithms()
+
+# Encoded header segments, by (algorithm, kid, compressed)
+_header_segments = {}
+
+# The zip header parameter of tokens with a DEFLATE compressed payload
+_deflate = 'DEF'
+
+# Decoded headers, by encoded header segment. Nearly every token we see uses
+# one of a handful of headers, so there is no need to decode them every time.
+_decoded_headers = {}
+_max_decoded_headers = 256
+
+_token_charset = re.compile(r'[A-Za-z0-9_\-.]*')
+
+# HMAC objects already keyed with the secret of a symmetric algorithm, by
+# (algorithm, key). Signing a token copies one of these, instead of going
+# through the key schedule of HMAC (and the pyjwt algorithm registry) again.
+_hmac_digests = {
+    'HS256': hashlib.sha256,
+    'HS384': hashlib.sha384,
+    'HS512': hashlib.sha512,
+}
+_hmac_templates = {}
+_max_hmac_templates = 64
+
+
+def base64url_encode(data):
+    return base64.urlsafe_b64encode(data).replace(b'=', b'')
+
+
+def base64url_decode(data):
+    if isinstance(data, str):
+        data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + b'=' * (-len(data) % 4))
+
+
+def header_segment(algorithm, kid=None, compressed=False):
+    """
+    Returns the encoded JOSE header segment for the given algorithm, and key
+    id if there is one. If compressed is True, the header says the payload
+    is compressed with DEFLATE.
+    """
+    try:
+        return _header_segments[(algorithm, kid, compressed)]
+    except KeyError:
+        header = {'typ': 'JWT', 'alg': algorithm}
+        if kid is not None:
+            header['kid'] = kid
+        if compressed:
+            header['zip'] = _deflate
+        json_header = json.dumps(header, separators=(',', ':'))
+        segment = base64url_encode(json_header.encode('utf-8'))
+        _header_segments[(algorithm, kid, compressed)] = segment
+        return segment
+
+
+def payload_segment(jwt_data, dumps=None):
+    """
+    Returns the encoded payload segment for the claims in jwt_data. Like pyjwt,
+    datetimes in the exp, iat and nbf claims are converted to timestamps.
+
+    :param dumps: The function to serialize the claims with, returning str
+                  or bytes. Defaults to compact ``json.dumps``, like pyjwt.
+    """
+    return base64url_encode(_serialize(jwt_data, dumps))
+
+
+def _serialize(jwt_data, dumps):
+    for time_claim in ('exp', 'iat', 'nbf'):
+        if isinstance(jwt_data.get(time_claim), datetime):
+            jwt_data = dict(jwt_data)
+            jwt_data[time_claim] = timegm(jwt_data[time_claim].utctimetuple())
+    if dumps is None:
+        json_payload = json.dumps(jwt_data, separators=(',', ':'))
+    else:
+        json_payload = dumps(jwt_data)
+    if isinstance(json_payload, str):
+        json_payload = json_payload.encode('utf-8')
+    return json_payload
+
+
+def deflate(data):
+    """
+    Compresses data with raw DEFLATE, as the zip header parameter asks for.
+    """
+    compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+def inflate(data, max_size):
+    """
+    Decompresses raw DEFLATE data, raising a ``jwt.DecodeError`` if it is
+    not valid, or if it would decompress to more than max_size bytes. Only
+    up to max_size bytes are ever decompressed.
+    """
+    decompressor = zlib.decompressobj(-15)
+    try:
+        data = decompressor.decompress(data, max_size + 1)
+    except zlib.error:
+        raise DecodeError('Invalid compressed payload')
+    if len(data) > max_size:
+        raise DecodeError('Compressed payload is too large')
+    if not decompressor.eof or decompressor.unused_data:
+        raise DecodeError('Invalid compressed payload')
+    return data
+
+
+def sign(signing_input, algorithm, key):
+    """
+    Returns the signature of signing_input. The key must already have been
+    loaded for this algorithm (see :func:`flask_jwt_simple.config.prepare_key`).
+    """
+    if algorithm in _hmac_digests:
+        signature = hmac_template(algorithm, key).copy()
+        signature.update(signing_input)
+        return signature.digest()
+
+    try:
+        alg_obj = _algorithms[algorithm]
+    except KeyError:
+        raise NotImplementedError('Algorithm not supported')
+    return alg_obj.sign(signing_input, key)
+
+
+def hmac_template(algorithm, key):
+    """
+    Returns an HMAC object keyed with key for one of the HS* algorithms,
+    which must be copied before it is used.
+    """
+    if isinstance(key, str):
+        key = key.encode('utf-8')
+    try:
+        return _hmac_templates[(algorithm, key)]
+    except KeyError:
+        pass
+
+    template = hmac.new(key, digestmod=_hmac_digests[algorithm])
+    if len(_hmac_templates) >= _max_hmac_templates:
+        _hmac_templates.clear()
+    _hmac_templates[(algorithm, key)] = template
+    return template
+
+
+def signing_input(jwt_data, algorithm, header=None, dumps=None, kid=None,
+                  compress_threshold=None):
+    """
+    Returns the header and payload segments of a JWT, which is what gets
+    signed.
+
+    :param header: A pre-encoded header segment, as returned by
+                   :func:`header_segment`. Looked up from the kid if not
+                   given, or if the payload ends up compressed.
+    :param dumps: See :func:`payload_segment`.
+    :param kid: The key id for the header.
+    :param compress_threshold: If given, payloads of at least this many bytes
+                               are compressed with DEFLATE (unless that does
+                               not make them any smaller).
+    """
+    payload = _serialize(jwt_data, dumps)
+    if compress_threshold is not None and len(payload) >= compress_threshold:
+        compressed = deflate(payload)
+        if len(compressed) < len(payload):
+            header = header_segment(algorithm, kid, compressed=True)
+            payload = compressed
+    if header is None:
+        header = header_segment(algorithm, kid)
+    return header + b'.' + base64url_encode(payload)
+
+
+def assemble(signing_input, signature):
+    """
+    Returns the complete JWT, as a string, from its signing input and
+    signature.
+    """
+    return (signing_input + b'.' + base64url_encode(signature)).decode('utf-8')
+
+
+def encode(jwt_data, key, algorithm, header=None, dumps=None, kid=None,
+           compress_threshold=None):
+    """
+    Returns a signed JWT for the claims in jwt_data, as a string. See
+    :func:`signing_input` for the other arguments.
+    """
+    to_sign = signing_input(jwt_data, algorithm, header, dumps, kid,
+                            compress_threshold)
+    return assemble(to_sign, sign(to_sign, algorithm, key))
+
+
+def check_structure(encoded_token, algorithm, max_length=None):
+    """
+    Does the cheap checks on a token, which reject most garbage before any
+    real work is done on it: its length, its number of segments, that it
+    only contains base64url characters and that its header names the
+    algorithm we expect. Raises a ``jwt.InvalidTokenError`` if any of these
+    fail.
+
+    :return: The decoded header of the token.
+    """
+    if isinstance(encoded_token, bytes):
+        try:
+            encoded_token = encoded_token.decode('ascii')
+        except UnicodeDecodeError:
+            raise DecodeError('Invalid characters in token')
+
+    if max_length is not None and len(encoded_token) > max_length:
+        raise DecodeError('Token is too long')
+
+    segments = encoded_token.split('.')
+    if len(segments) < 3:
+        raise DecodeError('Not enough segments')
+    if len(segments) > 3:
+        raise DecodeError('Too many segments')
+
+    if not _token_charset.fullmatch(encoded_token):
+        raise DecodeError('Invalid characters in token')
+
+    header = decode_header(segments[0])
+    if header.get('alg') != algorithm:
+        raise InvalidAlgorithmError('The specified alg value is not allowed')
+    return header
+
+
+def decode_header(segment):
+    """
+    Returns the decoded header of a token from its (first) header segment.
+    """
+    try:
+        return _decoded_headers[segment]
+    except KeyError:
+        pass
+
+    try:
+        header_data = base64url_decode(segment)
+    except (TypeError, binascii.Error):
+        raise DecodeError('Invalid header padding')
+
+    try:
+        header = json.loads(header_data.decode('utf-8'))
+    except ValueError as e:
+        raise DecodeError('Invalid header string: {}'.format(e))
+    if not isinstance(header, dict):
+        raise DecodeError('Invalid header string: must be a json object')
+
+    # Only remember valid headers, and never too many of them
+    if len(_decoded_headers) >= _max_decoded_headers:
+        _decoded_headers.clear()
+    _decoded_headers[segment] = header
+    return header
+
+
+def decode_with_pyjwt(encoded_token, key, algorithm, audience,
+                      verify_signature=True, loads=None, header=None,
+                      max_decompressed_size=None):
+    """
+    Verifies and decodes a token with jwt.decode. This is the decoder used
+    for the algorithms :func:`decode` does not know about, which pyjwt
+    rejects. The claims are always parsed with pyjwt's own json, and
+    compressed payloads are not supported.
+    """
+    options = None if verify_signature else {'verify_signature': False}
+    return jwt.decode(encoded_token, key, algorithms=[algorithm],
+                      audience=audience, options=options)
+
+
+def decode(encoded_token, key, algorithm, audience, verify_signature=True,
+           loads=None, header=None, max_decompressed_size=None):
+    """
+    Verifies and decodes a token. This does exactly what jwt.decode does,
+    raising the same errors, but checks the signature before the payload is
+    even decoded. The HS* algorithms are checked with a pre-keyed HMAC, the
+    others with the pyjwt algorithm, and the key must already be loaded.
+
+    The token must already have passed :func:`check_structure`.
+
+    :param loads: The function to parse the claims with, which must raise a
+                  ``ValueError`` for invalid json. Defaults to ``json.loads``.
+    :param header: The header of the token, as returned by
+                   :func:`check_structure`. Decoded again if not given.
+    :param max_decompressed_size: The most bytes a compressed payload may
+                                  decompress to. Compressed payloads are
+                                  rejected if this is None.
+    """
+    if isinstance(encoded_token, str):
+        encoded_token = encoded_token.encode('ascii')
+    signing_input, _, crypto_segment = encoded_token.rpartition(b'.')
+    payload_segment = signing_input[signing_input.index(b'.') + 1:]
+
+    # The characters were already checked, so this is the only way the
+    # segments can fail to decode
+    if len(payload_segment) % 4 == 1:
+        raise DecodeError('Invalid payload padding')
+    if len(crypto_segment) % 4 == 1:
+        raise DecodeError('Invalid crypto padding')
+
+    if verify_signature:
+        signature = base64url_decode(crypto_segment)
+        if algorithm in _hmac_digests:
+            mac = hmac_template(algorithm, key).copy()
+            mac.update(signing_input)
+            valid = hmac.compare_digest(mac.digest(), signature)
+        else:
+            valid = _algorithms[algorithm].verify(signing_input, key, signature)
+        if not valid:
+            raise InvalidSignatureError('Signature verification failed')
+
+    payload = base64url_decode(payload_segment)
+    if header is None:
+        header = decode_header(signing_input[:signing_input.index(b'.')].decode('ascii'))
+    zip_algorithm = header.get('zip')
+    if zip_algorithm is not None:
+        if zip_algorithm != _deflate or max_decompressed_size is None:
+            raise DecodeError('Unsupported compression: {}'.format(zip_algorithm))
+        payload = inflate(payload, max_decompressed_size)
+
+    try:
+        payload = (loads or json.loads)(payload.decode('utf-8'))
+    except ValueError as e:
+        raise DecodeError('Invalid payload string: {}'.format(e))
+    if not isinstance(payload, dict):
+        raise DecodeError('Invalid payload string: must be a json object')
+
+    _validate_claims(payload, audience)
+    return payload
+
+
+def _validate_claims(payload, audience):
+    now = int(time.time())
+
+    if 'iat' in payload:
+        try:
+            int(payload['iat'])
+        except ValueError:
+            raise InvalidIssuedAtError('Issued At claim (iat) must be an integer.')
+
+    if 'nbf' in payload:
+        nbf = payload['nbf']
+        if type(nbf) is not int:
+            try:
+                nbf = int(nbf)
+            except ValueError:
+                raise DecodeError('Not Before claim (nbf) must be an integer.')
+        if nbf > now:
+            raise ImmatureSignatureError('The token is not yet valid (nbf)')
+
+    if 'exp' in payload:
+        exp = payload['exp']
+        if type(exp) is not int:
+            try:
+                exp = int(exp)
+            except ValueError:
+                raise DecodeError('Expiration Time claim (exp) must be an integer.')
+        if exp < now:
+            raise ExpiredSignatureError('Signature has expired')
+
+    if 'aud' not in payload:
+        if audience is not None:
+            raise MissingRequiredClaimError('aud')
+        return
+    if audience is None:
+        raise InvalidAudienceError('Invalid audience')
+
+    audience_claims = payload['aud']
+    if isinstance(audience_claims, str):
+        audience_claims = [audience_claims]
+    if not isinstance(audience_claims, list):
+        raise InvalidAudienceError('Invalid claim format in token')
+    if any(not isinstance(claim, str) for claim in audience_claims):
+        raise InvalidAudienceError('Invalid claim format in token')
+    if isinstance(audience, str):
+        audience = [audience]
+    if not any(aud in audience_claims for aud in audience):
+        raise InvalidAudienceError('Invalid audience')
@@ -1,13 +1,27 @@
+import asyncio
 import datetime
 
 import jwt
 
-from flask_jwt_simple.config import config
-from flask_jwt_simple.exceptions import NoAuthorizationError, InvalidHeaderError
+from flask import current_app
+
+from flask_jwt_simple import jws
+from flask_jwt_simple.cli import jwt_cli
+from flask_jwt_simple.config import _Config, _Settings, get_settings, prepare_key
+from flask_jwt_simple.exceptions import (
+    NoAuthorizationError, InvalidHeaderError, RevokedTokenError
+)
+from flask_jwt_simple.instrumentation import (
+    outcome_for, timed_await, timed_call
+)
 from flask_jwt_simple.default_callbacks import (
     default_expired_token_callback, default_invalid_token_callback,
-    default_unauthorized_callback, default_jwt_data_callback
+    default_unauthorized_callback, default_jwt_data_callback,
+    default_revoked_token_callback,
+    _batch_jwt_data_callback
 )
+from flask_jwt_simple.metrics import MetricsRegistry, create_metrics_blueprint
+from flask_jwt_simple.utils import _bounded_map, _run_in_executor
 
 
 class JWTManager(object):
@@ -32,6 +46,23 @@ class JWTManager(object):
         self._invalid_token_callback = default_invalid_token_callback
         self._unauthorized_callback = default_unauthorized_callback
         self._get_jwt_data = default_jwt_data_callback
+        self._revoked_token_callback = default_revoked_token_callback
+
+        # Tokens are never considered revoked unless this is set
+        self._revocation_check = None
+
+        # Signs tokens in the calling thread when not set
+        self._signer = None
+
+        # Called with the time spent on every phase of handling a token
+        self._timing_listeners = []
+
+        # Counters and histograms for this process, when JWT_METRICS_ENABLED
+        self.metrics = MetricsRegistry()
+
+        # Keys loaded from the app config, by (algorithm, raw key), so that
+        # refreshing the config only loads the keys that actually changed.
+        self._loaded_keys = {}
 
         # Register this extension with the flask app now (if it is provided)
         if app is not None:
@@ -51,30 +82,78 @@ class JWTManager(object):
         # Set all the default configurations for this extension
         self._set_default_configuration_options(app)
         self._set_error_handler_callbacks(app)
+        self.refresh_config(app)
+        self._set_metrics(app)
+
+        # Adds the `flask jwt` commands
+        app.cli.add_command(jwt_cli)
 
         # Set propagate exceptions, so all of our error handlers properly
         # work in production
         app.config['PROPAGATE_EXCEPTIONS'] = True
 
+    def refresh_config(self, app=None):
+        """
+        The options of this extension are read from the app config and
+        validated once, when the extension is registered with the app. If you
+        change any of them afterwards, call this method for the changes to
+        take effect. This also empties the verified token cache.
+
+        :param app: A flask application. Defaults to the current app.
+        """
+        if app is None:
+            app = current_app._get_current_object()
+        settings = _Settings(app.config, self._load_key, self._timing_listeners)
+        app.extensions['flask-jwt-simple-settings'] = settings
+
+    def _set_metrics(self, app):
+        source = _Config(app.config)
+        if not source.metrics_enabled:
+            return
+        if self.metrics not in self._timing_listeners:
+            self._timing_listeners.append(self.metrics)
+        if source.metrics_url:
+            blueprint = create_metrics_blueprint(self.metrics, source.metrics_url)
+            app.register_blueprint(blueprint)
+
+    def _load_key(self, algorithm, key):
+        try:
+            return self._loaded_keys[(algorithm, key)]
+        except KeyError:
+            loaded_key = prepare_key(algorithm, key)
+            self._loaded_keys[(algorithm, key)] = loaded_key
+            return loaded_key
+
     def _set_error_handler_callbacks(self, app):
         """
         Sets the error handler callbacks used by this extension
         """
-        @app.errorhandler(NoAuthorizationError)
-        def handle_no_auth_error(e):
-            return self._unauthorized_callback(str(e))
-
-        @app.errorhandler(InvalidHeaderError)
-        def handle_invalid_header_error(e):
-            return self._invalid_token_callback(str(e))
+        for error_class in (NoAuthorizationError, InvalidHeaderError,
+                            RevokedTokenError, jwt.InvalidTokenError):
+            app.register_error_handler(error_class, self._handle_error)
 
-        @app.errorhandler(jwt.ExpiredSignatureError)
-        def handle_expired_error(e):
-            return self._expired_token_callback()
+    def _handle_error(self, error):
+        """
+        Calls the callback for an error raised by this extension. This is
+        what the flask error handlers do, and what the view decorators do
+        directly with JWT_DIRECT_ERROR_RESPONSES.
+        """
+        if isinstance(error, NoAuthorizationError):
+            return self._run_error_callback(error, self._unauthorized_callback, str(error))
+        if isinstance(error, RevokedTokenError):
+            return self._run_error_callback(error, self._revoked_token_callback)
+        if isinstance(error, jwt.ExpiredSignatureError):
+            return self._run_error_callback(error, self._expired_token_callback)
+        return self._run_error_callback(error, self._invalid_token_callback, str(error))
 
-        @app.errorhandler(jwt.InvalidTokenError)
-        def handle_invalid_token_error(e):
-            return self._invalid_token_callback(str(e))
+    @staticmethod
+    def _run_error_callback(error, callback, *args):
+        settings = get_settings()
+        listeners = settings.timing_listeners
+        if not listeners:
+            return callback(*args)
+        return timed_call(listeners, 'decode', 'error_handler', settings.algorithm,
+                          callback, args, outcome_for(error))
 
     @staticmethod
     def _set_default_configuration_options(app):
@@ -108,6 +187,91 @@ class JWTManager(object):
         app.config.setdefault('JWT_PRIVATE_KEY', None)
         app.config.setdefault('JWT_PUBLIC_KEY', None)
 
+        # More keys to sign and verify JWTs with, by key id. New tokens are
+        # signed with the JWT_ACTIVE_KID key, and its kid is put in their
+        # header. Tokens without a kid use the keys above.
+        app.config.setdefault('JWT_KEYS', None)
+        app.config.setdefault('JWT_ACTIVE_KID', None)
+
+        # A JWKS document (file path or url) to verify JWTs with, such as the
+        # one published by an identity provider. It is refreshed in the
+        # background once it is older than the TTL, or when a token with an
+        # unknown kid comes in, but never more often than the interval.
+        app.config.setdefault('JWT_JWKS_SOURCE', None)
+        app.config.setdefault('JWT_JWKS_TTL', datetime.timedelta(minutes=5))
+        app.config.setdefault('JWT_JWKS_REFRESH_INTERVAL', datetime.timedelta(seconds=30))
+
+        # Longest token we are willing to look at. Anything longer is
+        # rejected before any decoding or cryptography happens.
+        app.config.setdefault('JWT_MAX_TOKEN_LENGTH', None)
+
+        # If jwt_optional should put off verifying a token until the view
+        # actually asks for it with get_jwt() or get_jwt_identity()
+        app.config.setdefault('JWT_OPTIONAL_LAZY_DECODE', False)
+
+        # How many threads create_jwts() signs tokens with. Only worthwhile
+        # for the asymmetric algorithms, where the signing happens outside
+        # of the GIL.
+        app.config.setdefault('JWT_BATCH_WORKERS', 1)
+
+        # How many verified tokens to keep in memory, so that a token which
+        # is presented over and over again only has its signature checked
+        # once. Entries are never kept longer than the TTL, or longer than
+        # the token itself is valid. Set to 0 to disable the cache.
+        app.config.setdefault('JWT_DECODE_CACHE_SIZE', 0)
+        app.config.setdefault('JWT_DECODE_CACHE_TTL', datetime.timedelta(minutes=5))
+
+        # How many tokens that failed verification to remember, so that the
+        # same bad token being replayed over and over again is rejected
+        # without verifying it every time. Set to 0 to disable the cache.
+        app.config.setdefault('JWT_NEGATIVE_CACHE_SIZE', 0)
+        app.config.setdefault('JWT_NEGATIVE_CACHE_TTL', datetime.timedelta(seconds=10))
+
+        # A flask_jwt_simple.shared.SharedStore, so that a token verified
+        # by one worker process does not have its signature checked again
+        # by the others. Entries last at most JWT_DECODE_CACHE_TTL.
+        app.config.setdefault('JWT_SHARED_STORE', None)
+
+        # Functions to serialize and parse the claims of JWTs, and the json
+        # of the default error responses, such as orjson.dumps and
+        # orjson.loads. Defaults to the json module.
+        app.config.setdefault('JWT_JSON_DUMPS', None)
+        app.config.setdefault('JWT_JSON_LOADS', None)
+
+        # Shorter names for claims, and the values they can take, which the
+        # claims are stored with in tokens to make them smaller. The full
+        # names (and values) are given back when tokens are decoded.
+        app.config.setdefault('JWT_CLAIM_MAP', None)
+
+        # Payloads whose json is at least this many bytes are compressed
+        # with DEFLATE when tokens are created, which the zip header of the
+        # token says. None to never compress them. Compressed payloads are
+        # always accepted when decoding, but never allowed to decompress to
+        # more than JWT_MAX_DECOMPRESSED_SIZE bytes.
+        app.config.setdefault('JWT_COMPRESS_THRESHOLD', None)
+        app.config.setdefault('JWT_MAX_DECOMPRESSED_SIZE', 64 * 1024)
+
+        # If the view decorators should call the error callbacks themselves,
+        # instead of raising the errors for flask's error handlers to catch.
+        # This is faster, but errorhandlers registered on the app for the
+        # errors of this extension are not called for these.
+        app.config.setdefault('JWT_DIRECT_ERROR_RESPONSES', False)
+
+        # A header a trusted upstream (such as a gateway which has already
+        # verified the JWT) puts the claims of the JWT in, along with an HMAC
+        # made with the shared secret, so that the JWT is not verified again.
+        # Envelopes older than the max age are rejected. The upstream must
+        # drop this header from the requests it receives.
+        app.config.setdefault('JWT_UPSTREAM_HEADER', None)
+        app.config.setdefault('JWT_UPSTREAM_SECRET', None)
+        app.config.setdefault('JWT_UPSTREAM_MAX_AGE', datetime.timedelta(seconds=30))
+
+        # Count the tokens issued, verified and rejected by this process in
+        # JWTManager.metrics, and optionally serve them for Prometheus to
+        # scrape at the given url.
+        app.config.setdefault('JWT_METRICS_ENABLED', False)
+        app.config.setdefault('JWT_METRICS_URL', None)
+
     def expired_token_loader(self, callback):
         """
         Sets the callback method to be called if an expired JWT is received
@@ -146,6 +310,35 @@ class JWTManager(object):
         self._unauthorized_callback = callback
         return callback
 
+    def revoked_token_loader(self, callback):
+        """
+        Sets the callback method to be called if a revoked JWT is received
+        (see :meth:`revocation_check_loader`)
+
+        The default implementation will return json '{"msg": "Token has been revoked"}'
+        with a 401 status code.
+
+        Callback must be a function that takes zero arguments.
+        """
+        self._revoked_token_callback = callback
+        return callback
+
+    def revocation_check_loader(self, callback):
+        """
+        Sets the callback method to be called to check if a JWT has been
+        revoked. This is called by :func:`jwt_required` and :func:`jwt_optional`
+        once the JWT has been verified. If it returns True, the
+        ``revoked_token_loader`` callback is called instead of the view.
+
+        :class:`~flask_jwt_simple.revocation.RevocationStore` provides an
+        in-memory implementation of this, as its ``is_token_revoked`` method.
+
+        Callback must be a function that takes only one argument, which is the
+        decoded JWT, and returns True if it has been revoked.
+        """
+        self._revocation_check = callback
+        return callback
+
     def jwt_data_loader(self, callback):
         """
         Sets the callback method to be called for what data should be included
@@ -159,6 +352,7 @@ class JWTManager(object):
                 'exp': now + current_app.config['JWT_EXPIRES'],
                 'iat': now,
                 'nbf': now,
+                'jti': str(uuid.uuid4()),
                 'sub': identity
             }
 
@@ -168,9 +362,164 @@ class JWTManager(object):
         self._get_jwt_data = callback
         return callback
 
+    def timing_listener(self, callback):
+        """
+        Adds a callback to be called with the time spent on every phase of
+        creating and decoding tokens. Any number of these can be added.
+
+        The callback must be a function that takes one argument, a
+        ``PhaseTiming`` named tuple with these fields:
+
+        * ``operation``: ``'decode'`` or ``'encode'``
+        * ``phase``: for decoding, ``'header'`` (getting the token out of the
+          request), ``'verify'`` (checking the signature and claims),
+          ``'revocation'`` (the revocation_check_loader callback) or
+          ``'error_handler'`` (the expired/invalid/unauthorized callbacks).
+          For encoding, ``'claims'`` (the jwt_data_loader) or ``'sign'``.
+        * ``algorithm``: the configured algorithm, such as ``'HS256'``
+        * ``outcome``: ``'success'``, ``'missing'``, ``'invalid_header'``,
+          ``'expired'``, ``'invalid'``, ``'revoked'`` or ``'error'``
+        * ``duration``: how long the phase took, in seconds
+
+        When no callbacks are added, the phases are not timed at all.
+        """
+        self._timing_listeners.append(callback)
+        return callback
+
+    def key_ring(self, app=None):
+        """
+        Returns the :class:`~flask_jwt_simple.keys.KeyRing` holding the keys
+        of an app, which can be used to add, remove and activate keys while
+        the app is running. Calling :meth:`refresh_config` replaces it with
+        one built from ``JWT_KEYS`` again.
+
+        :param app: A flask application. Defaults to the current app.
+        """
+        return get_settings(app).key_ring
+
+    def set_signer(self, signer):
+        """
+        Sets the :class:`~flask_jwt_simple.signers.Signer` used to sign the
+        tokens created with create_jwt() and create_jwts(). By default,
+        tokens are signed in the calling thread. For example, to sign RSA
+        tokens in a pool of worker processes:
+
+        .. code-block:: python
+
+            from flask_jwt_simple.signers import ProcessPoolSigner
+
+            jwt.set_signer(ProcessPoolSigner(max_workers=4))
+
+        :param signer: A :class:`~flask_jwt_simple.signers.Signer`, or None
+                       to go back to signing tokens in the calling thread.
+        """
+        self._signer = signer
+        return signer
+
+    def decode_cache_info(self, app=None):
+        """
+        Returns the hits, misses and evictions of the verified token cache
+        (see ``JWT_DECODE_CACHE_SIZE``), as well as its current and maximum
+        size, in a named tuple.
+
+        :param app: A flask application. Defaults to the current app.
+        """
+        return get_settings(app).decode_cache.cache_info()
+
+    def negative_cache_info(self, app=None):
+        """
+        Returns the hits, misses and evictions of the cache of tokens that
+        failed verification (see ``JWT_NEGATIVE_CACHE_SIZE``), as well as its
+        current and maximum size, in a named tuple. A steady stream of hits
+        means the same bad tokens are being sent over and over again.
+
+        :param app: A flask application. Defaults to the current app.
+        """
+        return get_settings(app).negative_cache.cache_info()
+
     def _create_jwt(self, identity):
-        jwt_data = self._get_jwt_data(identity)
-        secret = config.encode_key
-        algorithm = config.algorithm
-        return jwt.encode(jwt_data, secret, algorithm).decode('utf-8')
+        settings = get_settings()
+        listeners = settings.timing_listeners
+        if not listeners:
+            jwt_data = self._get_jwt_data(identity)
+            return self._sign_jwt(jwt_data, settings)
+
+        algorithm = settings.algorithm
+        jwt_data = timed_call(listeners, 'encode', 'claims', algorithm,
+                              self._get_jwt_data, (identity,))
+        return timed_call(listeners, 'encode', 'sign', algorithm,
+                          self._sign_jwt, (jwt_data, settings))
+
+    def _signing_input(self, jwt_data, settings, signing_key):
+        if settings.claim_map is not None:
+            jwt_data = settings.claim_map.compact(jwt_data)
+        algorithm = settings.algorithm
+        header = jws.header_segment(algorithm, signing_key.kid)
+        return jws.signing_input(jwt_data, algorithm, header,
+                                 settings.json_dumps, signing_key.kid,
+                                 settings.compress_threshold)
+
+    def _sign_jwt(self, jwt_data, settings, signing_key=None):
+        if signing_key is None:
+            signing_key = settings.key_ring.signing_key()
+        signing_input = self._signing_input(jwt_data, settings, signing_key)
+        if self._signer is None:
+            signature = jws.sign(signing_input, settings.algorithm,
+                                 signing_key.loaded_key)
+        else:
+            signature = self._signer.sign(signing_input, settings.algorithm,
+                                          signing_key.key)
+        return jws.assemble(signing_input, signature)
+
+    async def _create_jwt_async(self, identity):
+        settings = get_settings()
+        listeners = settings.timing_listeners
+        if not listeners:
+            jwt_data = self._get_jwt_data(identity)
+            return await self._sign_jwt_async(jwt_data, settings)
+
+        algorithm = settings.algorithm
+        jwt_data = timed_call(listeners, 'encode', 'claims', algorithm,
+                              self._get_jwt_data, (identity,))
+        return await timed_await(listeners, 'encode', 'sign', algorithm,
+                                 self._sign_jwt_async(jwt_data, settings))
+
+    async def _sign_jwt_async(self, jwt_data, settings):
+        signing_key = settings.key_ring.signing_key()
+        signing_input = self._signing_input(jwt_data, settings, signing_key)
+        if self._signer is None:
+            signature = await _run_in_executor(
+                jws.sign, signing_input, settings.algorithm, signing_key.loaded_key
+            )
+        else:
+            future = self._signer.submit(signing_input, settings.algorithm,
+                                         signing_key.key)
+            signature = await asyncio.wrap_future(future)
+        return jws.assemble(signing_input, signature)
+
+    def _create_jwts(self, identities, workers=None):
+        settings = get_settings()
+        if workers is None:
+            workers = settings.batch_workers
+
+        # Everything that is the same for every token is only done once
+        algorithm = settings.algorithm
+        signing_key = settings.key_ring.signing_key()
+        listeners = settings.timing_listeners
+        if self._get_jwt_data is default_jwt_data_callback:
+            now = datetime.datetime.utcnow()
+            get_jwt_data = _batch_jwt_data_callback(settings, now)
+        else:
+            get_jwt_data = self._get_jwt_data
+
+        def encode(jwt_data):
+            if not listeners:
+                return self._sign_jwt(jwt_data, settings, signing_key)
+            return timed_call(listeners, 'encode', 'sign', algorithm,
+                              self._sign_jwt, (jwt_data, settings, signing_key))
+
+        # The claims are built here, as custom jwt_data_loader callbacks may
+        # need the app context. Only the signing is handed to the workers.
+        jwt_datas = (get_jwt_data(identity) for identity in identities)
+        return _bounded_map(encode, jwt_datas, workers)
 
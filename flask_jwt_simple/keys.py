@@ -0,0 +1,212 @@
+import threading
+from collections import namedtuple
+
+from jwt.exceptions import DecodeError
+
+# The key new tokens are signed with. kid is None for the key from
+# JWT_SECRET_KEY / JWT_PRIVATE_KEY, which is signed without a kid header.
+SigningKey = namedtuple('SigningKey', ['kid', 'key', 'loaded_key'])
+
+
+def _key_or_raise(entry):
+    key, loaded_key, error = entry
+    if error:
+        raise RuntimeError(error)
+    return key, loaded_key
+
+
+class KeyRing(object):
+    """
+    Holds every key tokens can be signed and verified with, by key id
+    (``kid``). New tokens are signed with the active key, and carry its kid
+    in their header. Tokens are verified with the key named by their kid,
+    which takes a single dictionary lookup no matter how many keys there are.
+
+    The keys from ``JWT_SECRET_KEY`` / ``JWT_PUBLIC_KEY`` / ``JWT_PRIVATE_KEY``
+    are kept under the kid ``None``, and are used for tokens without a kid.
+    Keys can also come from a JWKS document, see ``JWT_JWKS_SOURCE``.
+
+    Keys can be added, removed and activated while the app is running, for
+    example to rotate keys without a restart: add the new key, activate it
+    once every process has it, and remove the old key once the tokens signed
+    with it have expired. Changes replace the dictionaries of keys instead of
+    modifying them, so the request path never takes a lock.
+
+    As long as there are no keys other than the ``None`` one, and no JWKS,
+    tokens are verified with the ``None`` key whatever kid they carry.
+
+    Use :meth:`JWTManager.key_ring` to get the key ring of an app.
+    """
+
+    def __init__(self, algorithm, is_asymmetric, load_key, default_signing,
+                 default_verifying, on_change=None):
+        self.algorithm = algorithm
+        self.is_asymmetric = is_asymmetric
+        self._load_key = load_key
+        self._on_change = on_change
+        self._lock = threading.Lock()
+        verifying_keys = {}
+        if default_verifying is not None:
+            verifying_keys[None] = default_verifying
+        self._state = (None, {None: default_signing}, verifying_keys)
+
+        # Where the keys set with set_source_keys come from, and their kids
+        self.source = None
+        self._source_kids = frozenset()
+
+    @property
+    def active_kid(self):
+        """
+        The kid of the key new tokens are signed with.
+        """
+        return self._state[0]
+
+    @property
+    def kids(self):
+        """
+        The kids of every key in the ring (other than ``None``), sorted.
+        """
+        return sorted(kid for kid in self._state[2] if kid is not None)
+
+    def __contains__(self, kid):
+        return kid in self._state[2]
+
+    def add(self, kid, key):
+        """
+        Adds a key to the ring, or replaces the key with the same kid.
+
+        :param kid: The key id, a string.
+        :param key: For symmetric algorithms, the secret key. For asymmetric
+                    algorithms, a ``(private_key, public_key)`` tuple of PEM
+                    strings. The private key can be ``None`` for keys that are
+                    only used to verify tokens.
+        """
+        if not isinstance(kid, str):
+            raise ValueError('kid must be a string')
+        if self.is_asymmetric:
+            private_key, public_key = key
+        else:
+            private_key = public_key = key
+
+        # Keys are loaded before the lock is taken, as it can take a while
+        verifying = (public_key, self._load_key(self.algorithm, public_key), None)
+        signing = None
+        if private_key is not None:
+            loaded = self._load_key(self.algorithm, private_key)
+            signing = (private_key, loaded, None)
+
+        with self._lock:
+            active_kid, signing_keys, verifying_keys = self._state
+            if signing is None and kid == active_kid:
+                raise ValueError('The active key must have a private key')
+            signing_keys = dict(signing_keys)
+            if signing is None:
+                signing_keys.pop(kid, None)
+            else:
+                signing_keys[kid] = signing
+            verifying_keys = dict(verifying_keys)
+            verifying_keys[kid] = verifying
+            self._source_kids = self._source_kids - {kid}
+            self._state = (active_kid, signing_keys, verifying_keys)
+        self._changed()
+
+    def remove(self, kid):
+        """
+        Removes a key from the ring. Tokens signed with it are no longer
+        valid. The active key cannot be removed.
+        """
+        with self._lock:
+            active_kid, signing_keys, verifying_keys = self._state
+            if kid == active_kid:
+                raise ValueError('The active key cannot be removed')
+            if kid not in verifying_keys:
+                raise KeyError(kid)
+            signing_keys = dict(signing_keys)
+            signing_keys.pop(kid, None)
+            verifying_keys = dict(verifying_keys)
+            del verifying_keys[kid]
+            self._source_kids = self._source_kids - {kid}
+            self._state = (active_kid, signing_keys, verifying_keys)
+        self._changed()
+
+    def activate(self, kid):
+        """
+        Signs new tokens with the key with this kid from now on. Pass
+        ``None`` to go back to the key from the app config.
+        """
+        with self._lock:
+            active_kid, signing_keys, verifying_keys = self._state
+            if kid not in signing_keys:
+                raise ValueError('There is no key to sign tokens with for '
+                                 'the kid "{}"'.format(kid))
+            self._state = (kid, signing_keys, verifying_keys)
+
+    def set_source_keys(self, keys):
+        """
+        Replaces the keys from the :attr:`source` (such as a
+        :class:`~flask_jwt_simple.jwks.JWKSSource`) with a new set of keys,
+        which are only used to verify tokens. Keys added any other way, with
+        the same kid, take precedence over these.
+
+        :param keys: A dict of kid to key, already loaded into the objects
+                     pyjwt works with.
+        """
+        with self._lock:
+            active_kid, signing_keys, old_verifying_keys = self._state
+            verifying_keys = dict(old_verifying_keys)
+            for kid in self._source_kids:
+                del verifying_keys[kid]
+            source_kids = set()
+            for kid, loaded_key in keys.items():
+                if kid not in verifying_keys:
+                    verifying_keys[kid] = (None, loaded_key, None)
+                    source_kids.add(kid)
+
+            # Most refreshes find the same keys, which must not throw away
+            # the cached results
+            if verifying_keys == old_verifying_keys:
+                return
+            self._source_kids = frozenset(source_kids)
+            self._state = (active_kid, signing_keys, verifying_keys)
+        self._changed()
+
+    def signing_key(self):
+        """
+        Returns the :class:`SigningKey` new tokens are signed with.
+        """
+        kid, signing_keys, _ = self._state
+        key, loaded_key = _key_or_raise(signing_keys[kid])
+        return SigningKey(kid, key, loaded_key)
+
+    def verifying_key(self, kid):
+        """
+        Returns the loaded key to verify a token with the given kid with.
+        Raises a ``jwt.DecodeError`` if there is no such key.
+        """
+        verifying_keys = self._state[2]
+        source = self.source
+        if source is not None:
+            source.refresh_if_stale()
+        try:
+            entry = verifying_keys[kid]
+        except (KeyError, TypeError):
+            # Without any keys by kid, every token is verified with the key
+            # from the app config, whatever kid it carries (identity
+            # providers nearly always set one)
+            if source is None and len(verifying_keys) == 1 and None in verifying_keys:
+                entry = verifying_keys[None]
+            else:
+                # The key may be new, and not loaded from the source yet
+                if source is not None:
+                    source.refresh_soon()
+                raise DecodeError('Unknown key id')
+        else:
+            # Tokens without a kid when there is no key for them in the app
+            # config, only keys by kid, are simply not ours
+            if entry[2] and (source is not None or len(verifying_keys) > 1):
+                raise DecodeError('Unknown key id')
+        return _key_or_raise(entry)[1]
+
+    def _changed(self):
+        if self._on_change is not None:
+            self._on_change()
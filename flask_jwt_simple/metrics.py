@@ -0,0 +1,144 @@
+import threading
+
+from flask import Blueprint, Response
+
+from flask_jwt_simple.config import get_settings
+
+# Upper bounds (in seconds) of the latency histogram buckets. Token handling
+# takes anywhere from a few microseconds (a cached HS256 token) to a few
+# milliseconds (signing with a large RSA key).
+DEFAULT_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+                   0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+_content_type = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class MetricsRegistry(object):
+    """
+    Counters and latency histograms for the tokens handled in this process.
+    Every :class:`JWTManager` has one of these as its ``metrics`` attribute,
+    which is filled in when ``JWT_METRICS_ENABLED`` is set.
+
+    The registry is a timing listener (see :meth:`JWTManager.timing_listener`),
+    and only holds a lock for long enough to bump a couple of integers.
+
+    :param buckets: The upper bounds, in seconds, of the histogram buckets.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def __call__(self, timing):
+        operation, phase, algorithm, outcome, duration = timing
+        if outcome == 'success':
+            if phase == 'sign':
+                counter = ('jwt_tokens_issued_total', ())
+            elif phase == 'verify':
+                counter = ('jwt_tokens_verified_total', ())
+            else:
+                counter = None
+        elif operation == 'decode' and phase != 'error_handler':
+            counter = ('jwt_tokens_rejected_total', (('reason', outcome),))
+        else:
+            counter = None
+
+        labels = (('operation', operation), ('phase', phase),
+                  ('algorithm', algorithm))
+        index = self._bucket_index(duration)
+        with self._lock:
+            if counter is not None:
+                self._counters[counter] = self._counters.get(counter, 0) + 1
+            try:
+                histogram = self._histograms[labels]
+            except KeyError:
+                histogram = [[0] * (len(self.buckets) + 1), 0.0]
+                self._histograms[labels] = histogram
+            histogram[0][index] += 1
+            histogram[1] += duration
+
+    def _bucket_index(self, duration):
+        for index, bound in enumerate(self.buckets):
+            if duration <= bound:
+                return index
+        return len(self.buckets)
+
+    def counter(self, name, **labels):
+        """
+        Returns the current value of a counter, such as
+        ``counter('jwt_tokens_rejected_total', reason='expired')``.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def reset(self):
+        """
+        Sets all the counters and histograms back to zero.
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self, app=None):
+        """
+        Returns all the metrics in the Prometheus text exposition format,
+        including the hits and misses of the token caches of the given app
+        (defaults to the current app).
+        """
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {labels: (list(counts), total) for labels, (counts, total)
+                          in self._histograms.items()}
+
+        settings = get_settings(app)
+        for name, cache in (('decode', settings.decode_cache),
+                            ('negative', settings.negative_cache)):
+            info = cache.cache_info()
+            counters[('jwt_{}_cache_hits_total'.format(name), ())] = info.hits
+            counters[('jwt_{}_cache_misses_total'.format(name), ())] = info.misses
+
+        lines = []
+        previous_name = None
+        for (name, labels), value in sorted(counters.items()):
+            if name != previous_name:
+                lines.append('# TYPE {} counter'.format(name))
+                previous_name = name
+            lines.append('{}{} {}'.format(name, _format_labels(labels), value))
+
+        name = 'jwt_phase_duration_seconds'
+        if histograms:
+            lines.append('# TYPE {} histogram'.format(name))
+        for labels, (counts, total) in sorted(histograms.items()):
+            cumulative = 0
+            bounds = [repr(b) for b in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                bucket_labels = labels + (('le', bound),)
+                lines.append('{}_bucket{} {}'.format(
+                    name, _format_labels(bucket_labels), cumulative))
+            lines.append('{}_sum{} {!r}'.format(name, _format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), cumulative))
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
+
+
+def create_metrics_blueprint(registry, url):
+    """
+    Returns a blueprint which serves the metrics in the registry, in the
+    Prometheus text exposition format, at the given url.
+    """
+    blueprint = Blueprint('flask_jwt_simple_metrics', __name__)
+
+    @blueprint.route(url)
+    def metrics():
+        return Response(registry.render(), content_type=_content_type)
+
+    return blueprint
@@ -0,0 +1,109 @@
+import heapq
+import threading
+import time
+from calendar import timegm
+from datetime import datetime
+
+
+def _timestamp(exp):
+    if isinstance(exp, datetime):
+        return timegm(exp.utctimetuple())
+    return exp
+
+
+class RevocationStore(object):
+    """
+    An in-memory denylist of revoked tokens, by their ``jti`` claim. Use it
+    with :meth:`JWTManager.revocation_check_loader`::
+
+        store = RevocationStore()
+        jwt_manager.revocation_check_loader(store.is_token_revoked)
+
+        # Later, when logging someone out
+        store.revoke_token(get_jwt())
+
+    Entries are dropped once their token has expired, as the token is
+    rejected anyway from then on, so the store only ever holds the revoked
+    tokens that would otherwise still be valid.
+
+    The store is per process. Revoking a token in one worker does not revoke
+    it in the others.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._expiry = []
+        self._next_expiry = float('inf')
+
+    def __len__(self):
+        return len(self._entries)
+
+    def revoke(self, jti, exp=None):
+        """
+        Revokes the token with the given ``jti``.
+
+        :param jti: The ``jti`` claim of the token.
+        :param exp: The ``exp`` claim of the token, as a timestamp or a
+                    datetime. The entry is dropped once this has passed. If
+                    None, the entry is kept until :meth:`unrevoke` is called.
+        """
+        exp = _timestamp(exp)
+        if exp is not None and exp <= time.time():
+            return
+        with self._lock:
+            self._entries[jti] = exp
+            if exp is not None:
+                heapq.heappush(self._expiry, (exp, jti))
+                self._next_expiry = self._expiry[0][0]
+
+    def revoke_token(self, jwt_data):
+        """
+        Revokes a decoded token, such as the one returned by :func:`get_jwt`.
+        """
+        try:
+            jti = jwt_data['jti']
+        except KeyError:
+            raise ValueError('Only tokens with a jti claim can be revoked')
+        self.revoke(jti, jwt_data.get('exp'))
+
+    def unrevoke(self, jti):
+        """
+        Removes the token with the given ``jti`` from the store.
+        """
+        with self._lock:
+            self._entries.pop(jti, None)
+
+    def is_revoked(self, jti):
+        """
+        Returns True if the token with the given ``jti`` has been revoked.
+        """
+        if time.time() >= self._next_expiry:
+            self.purge()
+        return jti in self._entries
+
+    def is_token_revoked(self, jwt_data):
+        """
+        Returns True if a decoded token has been revoked. Tokens without a
+        ``jti`` claim can never be revoked.
+        """
+        jti = jwt_data.get('jti')
+        if jti is None:
+            return False
+        return self.is_revoked(jti)
+
+    def purge(self):
+        """
+        Drops the entries of the tokens which have expired. This is done
+        automatically as tokens expire.
+        """
+        now = time.time()
+        with self._lock:
+            expiry = self._expiry
+            entries = self._entries
+            while expiry and expiry[0][0] <= now:
+                exp, jti = heapq.heappop(expiry)
+                # The same token may have been revoked again since
+                if jti in entries and entries[jti] == exp:
+                    del entries[jti]
+            self._next_expiry = expiry[0][0] if expiry else float('inf')
@@ -0,0 +1,329 @@
+import hashlib
+import json
+import math
+import mmap
+import multiprocessing
+import struct
+import time
+from calendar import timegm
+from datetime import datetime
+
+from flask_jwt_simple.config import get_settings
+
+# Every slot of a table is: a sequence number, which is odd while the slot is
+# being written, the state of the slot, a value, when the slot expires, and
+# the 16 byte digest it is keyed on.
+_slot = struct.Struct('<IIdd16s')
+_seq = struct.Struct('<I')
+
+_EMPTY, _USED, _DELETED = 0, 1, 2
+
+# How many slots after the one a key hashes to it can be stored in
+_probe_limit = 16
+
+# How many times a slot is read while it is being written before giving up on
+# it, in case the process writing it died halfway through
+_read_attempts = 100
+
+_forever = float('inf')
+
+
+def _digest(value):
+    if not isinstance(value, bytes):
+        value = value.encode('utf-8')
+    return hashlib.blake2b(value, digest_size=16).digest()
+
+
+def _timestamp(exp):
+    if exp is None:
+        return _forever
+    if isinstance(exp, datetime):
+        return timegm(exp.utctimetuple())
+    return float(exp)
+
+
+class SharedStoreFullError(Exception):
+    """
+    An error raised when there is no room left in a shared store for an
+    entry that cannot be evicted, such as a revoked token
+    """
+    pass
+
+
+class _SharedTable(object):
+    """
+    A fixed size hash table living in shared memory, keyed on 16 byte
+    digests. Entries are free to be reused once they have expired.
+
+    Readers never take a lock: every slot is guarded by a sequence number,
+    and a read is simply retried if the slot was written to while it was
+    being read. Writers take the lock of the store.
+    """
+
+    def __init__(self, buffer, offset, slots, lock, evict):
+        self._buffer = buffer
+        self._offset = offset
+        self._mask = slots - 1
+        self.slots = slots
+        self._lock = lock
+        self._evict = evict
+
+    def _slot_offset(self, index):
+        return self._offset + index * _slot.size
+
+    def _read(self, index):
+        buffer = self._buffer
+        offset = self._slot_offset(index)
+        for _ in range(_read_attempts):
+            slot = _slot.unpack_from(buffer, offset)
+            seq = slot[0]
+            if not seq & 1 and _seq.unpack_from(buffer, offset)[0] == seq:
+                return slot
+        # The slot is taken as deleted, so that it matches no key but lookups
+        # still go on to the slots after it
+        return (seq, _DELETED, 0, 0, b'')
+
+    def _write(self, index, state, value, expires, key):
+        buffer = self._buffer
+        offset = self._slot_offset(index)
+        # Left odd by a writer which died, in which case this write fixes it
+        seq = _seq.unpack_from(buffer, offset)[0] & ~1
+        _seq.pack_into(buffer, offset, (seq + 1) & 0xffffffff)
+        _slot.pack_into(buffer, offset, (seq + 1) & 0xffffffff, state, value,
+                        expires, key)
+        _seq.pack_into(buffer, offset, (seq + 2) & 0xffffffff)
+
+    def _indexes(self, key):
+        start = int.from_bytes(key[:8], 'little')
+        mask = self._mask
+        return [(start + i) & mask for i in range(min(_probe_limit, self.slots))]
+
+    def get(self, key, now=None):
+        """
+        Returns the value stored for key, or None if there is none or it has
+        expired.
+        """
+        if now is None:
+            now = time.time()
+        for index in self._indexes(key):
+            _, state, value, expires, slot_key = self._read(index)
+            if state == _EMPTY:
+                return None
+            if state == _USED and slot_key == key:
+                return value if expires > now else None
+        return None
+
+    def set(self, key, value, expires, blocking=True):
+        """
+        Stores value for key until expires. If blocking is False and another
+        process holds the lock, nothing is stored and False is returned.
+        """
+        if not self._lock.acquire(blocking):
+            return False
+        try:
+            now = time.time()
+            free = None
+            evictable = None
+            for index in self._indexes(key):
+                _, state, _, slot_expires, slot_key = self._read(index)
+                if state == _USED and slot_key == key:
+                    free = index
+                    break
+                if state != _USED or slot_expires <= now:
+                    if free is None:
+                        free = index
+                    if state == _EMPTY:
+                        break
+                elif evictable is None or slot_expires < evictable[1]:
+                    evictable = (index, slot_expires)
+
+            if free is None:
+                if not self._evict:
+                    raise SharedStoreFullError('There is no room left in the '
+                                               'shared store')
+                free = evictable[0]
+            self._write(free, _USED, value, expires, key)
+        finally:
+            self._lock.release()
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            for index in self._indexes(key):
+                _, state, _, _, slot_key = self._read(index)
+                if state == _EMPTY:
+                    return
+                if state == _USED and slot_key == key:
+                    self._write(index, _DELETED, 0, 0, b'')
+                    return
+
+    def clear(self):
+        # Finding the slots in use takes a while with many slots, and needs
+        # no lock, so the lock is only held to empty the ones in use
+        used = [index for index in range(self.slots)
+                if self._read(index)[1] != _EMPTY]
+        with self._lock:
+            for index in used:
+                self._write(index, _EMPTY, 0, 0, b'')
+
+    def __len__(self):
+        now = time.time()
+        count = 0
+        for index in range(self.slots):
+            _, state, _, expires, _ = self._read(index)
+            if state == _USED and expires > now:
+                count += 1
+        return count
+
+
+def _power_of_two(name, value):
+    if not isinstance(value, int) or value < 1 or value & (value - 1):
+        raise ValueError('{} must be a power of two'.format(name))
+    return value
+
+
+class SharedStore(object):
+    """
+    Revoked tokens, revoked identities and verified tokens, kept in memory
+    shared by every worker process of a pre-fork server (such as gunicorn),
+    so that each worker does not keep its own copy of them, and a token
+    revoked in one worker is revoked in all of them.
+
+    The store must be created before the workers are forked, for example
+    when the app is created with gunicorn's ``--preload``. Use it with
+    :meth:`JWTManager.revocation_check_loader`, and set it as
+    ``JWT_SHARED_STORE`` to also share which tokens have been verified::
+
+        store = SharedStore()
+        app.config['JWT_SHARED_STORE'] = store
+        jwt_manager.revocation_check_loader(store.is_token_revoked)
+
+    Lookups never take a lock. Changes take a lock shared by every process,
+    which is only held while a few slots are written.
+
+    :param revoked_slots: How many revoked tokens can be held. A power of two.
+    :param identity_slots: How many revoked identities can be held. A power
+                           of two.
+    :param verified_slots: How many verified tokens can be remembered. A
+                           power of two. When full, the ones expiring first
+                           are forgotten.
+    """
+
+    def __init__(self, revoked_slots=65536, identity_slots=8192,
+                 verified_slots=65536):
+        sizes = (
+            _power_of_two('revoked_slots', revoked_slots),
+            _power_of_two('identity_slots', identity_slots),
+            _power_of_two('verified_slots', verified_slots),
+        )
+        # An anonymous MAP_SHARED mapping, which forked processes inherit
+        self._buffer = mmap.mmap(-1, sum(sizes) * _slot.size)
+        self._lock = multiprocessing.Lock()
+
+        offset = 0
+        tables = []
+        for slots, evict in zip(sizes, (False, False, True)):
+            tables.append(_SharedTable(self._buffer, offset, slots, self._lock, evict))
+            offset += slots * _slot.size
+        self._revoked, self._identities, self._verified = tables
+
+    def revoke(self, jti, exp=None):
+        """
+        Revokes the token with the given ``jti``, until its ``exp`` (as a
+        timestamp or a datetime) has passed. If exp is None, the token is
+        revoked until :meth:`unrevoke` is called.
+        """
+        exp = _timestamp(exp)
+        if exp > time.time():
+            self._revoked.set(_digest(jti), exp, exp)
+
+    def revoke_token(self, jwt_data):
+        """
+        Revokes a decoded token, such as the one returned by :func:`get_jwt`.
+        """
+        try:
+            jti = jwt_data['jti']
+        except KeyError:
+            raise ValueError('Only tokens with a jti claim can be revoked')
+        self.revoke(jti, jwt_data.get('exp'))
+
+    def unrevoke(self, jti):
+        """
+        Removes the token with the given ``jti`` from the revoked tokens.
+        """
+        self._revoked.delete(_digest(jti))
+
+    def is_revoked(self, jti):
+        """
+        Returns True if the token with the given ``jti`` has been revoked.
+        """
+        return self._revoked.get(_digest(jti)) is not None
+
+    def revoke_identity(self, identity, lifetime, issued_before=None):
+        """
+        Revokes every token of an identity issued before a point in time,
+        such as when someone changes their password. Tokens issued afterwards
+        are not affected.
+
+        :param identity: The identity claim of the tokens.
+        :param lifetime: How long tokens live, as a ``datetime.timedelta``.
+                         Once it has passed, every token issued before the
+                         point in time has expired, and the entry is dropped.
+        :param issued_before: A timestamp or datetime. Defaults to now. Only
+                              whole seconds count, like the iat claim.
+        """
+        if issued_before is None:
+            issued_before = time.time()
+        # iat claims are whole seconds, so a token issued later in the same
+        # second (such as right after changing a password) must still pass
+        issued_before = math.floor(_timestamp(issued_before))
+        expires = issued_before + lifetime.total_seconds()
+        self._identities.set(self._identity_key(identity), issued_before, expires)
+
+    def unrevoke_identity(self, identity):
+        self._identities.delete(self._identity_key(identity))
+
+    @staticmethod
+    def _identity_key(identity):
+        return _digest(json.dumps(identity, sort_keys=True))
+
+    def is_token_revoked(self, jwt_data):
+        """
+        Returns True if a decoded token has been revoked, either by its jti
+        or by its identity. This is meant to be registered with
+        :meth:`JWTManager.revocation_check_loader`.
+        """
+        jti = jwt_data.get('jti')
+        if jti is not None and self.is_revoked(jti):
+            return True
+
+        identity = jwt_data.get(get_settings().identity_claim)
+        if identity is None:
+            return False
+        issued_before = self._identities.get(self._identity_key(identity))
+        if issued_before is None:
+            return False
+        return jwt_data.get('iat', 0) < issued_before
+
+    def is_verified(self, digest):
+        """
+        Returns True if the token with the given digest (see
+        :func:`flask_jwt_simple.cache.verified_digest`) has had its signature
+        verified by any of the workers.
+        """
+        return self._verified.get(digest[:16]) is not None
+
+    def mark_verified(self, digest, expires):
+        """
+        Remembers that the signature of the token with the given digest was
+        verified, until the given timestamp. This is done on the request
+        path, so if another process holds the lock, the token is simply not
+        remembered, rather than waiting on (or getting stuck behind) it.
+        """
+        self._verified.set(digest[:16], 0, expires, blocking=False)
+
+    def clear_verified(self):
+        """
+        Forgets every verified token, in every worker.
+        """
+        self._verified.clear()
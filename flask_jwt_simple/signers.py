@@ -0,0 +1,134 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flask_jwt_simple import jws
+from flask_jwt_simple.config import prepare_key
+
+
+class Signer(object):
+    """
+    Base class for signers, which can be registered with
+    :meth:`JWTManager.set_signer` to change how (and where) tokens created by
+    :func:`create_jwt` are signed.
+
+    Signers receive the raw key from the app config (such as a PEM string),
+    as that is what can be handed to other threads or processes.
+    """
+
+    def submit(self, signing_input, algorithm, key):
+        """
+        Starts signing the signing input of a token, and returns a
+        ``concurrent.futures.Future`` which resolves to the signature bytes.
+        """
+        raise NotImplementedError
+
+    def sign(self, signing_input, algorithm, key):
+        """
+        Signs the signing input of a token, and returns the signature bytes.
+        """
+        return self.submit(signing_input, algorithm, key).result()
+
+
+# Keys loaded in this process by the signers, by (algorithm, raw key)
+_loaded_keys = {}
+
+
+def _sign(signing_input, algorithm, key):
+    try:
+        loaded_key = _loaded_keys[(algorithm, key)]
+    except KeyError:
+        loaded_key = prepare_key(algorithm, key)
+        _loaded_keys[(algorithm, key)] = loaded_key
+    return jws.sign(signing_input, algorithm, loaded_key)
+
+
+def _init_worker(algorithm, key):
+    # Load the key as soon as the worker starts, so that the first tokens
+    # signed by it do not have to pay for parsing the key
+    _loaded_keys[(algorithm, key)] = prepare_key(algorithm, key)
+
+
+class ProcessPoolSigner(Signer):
+    """
+    A signer which hands tokens to a pool of worker processes to be signed,
+    keeping the CPU time of signing with asymmetric algorithms (such as RSA)
+    away from the processes handling requests. Every worker keeps its own
+    loaded copy of the keys.
+
+    The pool is started on first use, so it is safe to create this before a
+    server forks its workers. If more than ``max_pending`` tokens are waiting
+    to be signed, or the pool has died, tokens are signed synchronously in
+    the calling thread instead.
+
+    :param max_workers: How many worker processes to use. Defaults to the
+                        number of CPUs.
+    :param max_pending: How many tokens can be waiting on the pool before
+                        falling back to signing synchronously.
+    """
+
+    def __init__(self, max_workers=None, max_pending=64):
+        if max_pending < 1:
+            raise ValueError('max_pending must be a positive integer')
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.fallbacks = 0
+        self._pending = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_pid = None
+
+    def submit(self, signing_input, algorithm, key):
+        if not self._pending.acquire(False):
+            return self._sign_synchronously(signing_input, algorithm, key)
+
+        try:
+            pool = self._get_pool(algorithm, key)
+            future = pool.submit(_sign, signing_input, algorithm, key)
+        except (BrokenProcessPool, RuntimeError):
+            self._pending.release()
+            self._reset_pool()
+            return self._sign_synchronously(signing_input, algorithm, key)
+
+        future.add_done_callback(lambda f: self._pending.release())
+        return future
+
+    def sign(self, signing_input, algorithm, key):
+        try:
+            return self.submit(signing_input, algorithm, key).result()
+        except BrokenProcessPool:
+            self._reset_pool()
+            return self._sign_synchronously(signing_input, algorithm, key).result()
+
+    def shutdown(self, wait=True):
+        """
+        Stops the worker processes. The pool is started again if this signer
+        is used afterwards.
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def _get_pool(self, algorithm, key):
+        with self._lock:
+            # A pool inherited through a fork belongs to the parent process
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=_init_worker,
+                    initargs=(algorithm, key)
+                )
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def _reset_pool(self):
+        with self._lock:
+            self._pool = None
+
+    def _sign_synchronously(self, signing_input, algorithm, key):
+        self.fallbacks += 1
+        future = Future()
+        future.set_result(_sign(signing_input, algorithm, key))
+        return future
@@ -1,3 +1,11 @@
+import asyncio
+import contextvars
+import copy
+import functools
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
 import jwt
 from flask import current_app
 
@@ -6,7 +14,13 @@ try:
 except ImportError:  # pragma: no cover
     from flask import _request_ctx_stack as ctx_stack
 
-from flask_jwt_simple.config import config
+from flask_jwt_simple import jws
+from flask_jwt_simple.cache import token_digest, verified_digest
+from flask_jwt_simple.config import get_settings
+from flask_jwt_simple.exceptions import FlaskJWTException, RevokedTokenError
+from flask_jwt_simple.instrumentation import timed_call
+
+DecodeResult = namedtuple('DecodeResult', ['jwt_data', 'error'])
 
 
 def _get_jwt_manager():
@@ -22,7 +36,20 @@ def get_jwt():
     Returns the python dictionary which has all of the data in this JWT. If no
     JWT is currently present, an empty dict is returned
     """
-    return getattr(ctx_stack.top, 'jwt', {})
+    ctx = ctx_stack.top
+    try:
+        return ctx.jwt
+    except AttributeError:
+        pass
+
+    # With JWT_OPTIONAL_LAZY_DECODE, jwt_optional leaves the token here to
+    # be verified the first time it is needed
+    encoded_token = getattr(ctx, 'encoded_jwt', None)
+    if encoded_token is None:
+        return {}
+    settings = get_settings()
+    ctx.jwt = _check_revocation(_decode_jwt(encoded_token, settings), settings)
+    return ctx.jwt
 
 
 def get_jwt_identity():
@@ -30,18 +57,168 @@ def get_jwt_identity():
     Returns the identity of the JWT in this context. If no JWT is present,
     None is returned.
     """
-    return get_jwt().get(config.identity_claim, None)
+    return get_jwt().get(get_settings().identity_claim, None)
 
 
 def decode_jwt(encoded_token):
     """
     Returns the decoded token from an encoded one. This does all the checks
     to insure that the decoded token is valid before returning it.
+
+    If ``JWT_DECODE_CACHE_SIZE`` is set, tokens that have already been
+    verified are returned from the cache instead of being verified again.
+    Likewise, with ``JWT_NEGATIVE_CACHE_SIZE``, tokens that recently failed
+    verification raise the same error again without being verified.
+    """
+    return _decode_jwt(encoded_token, get_settings())
+
+
+def _decode_jwt(encoded_token, settings):
+    listeners = settings.timing_listeners
+    if not listeners:
+        return _verify_jwt(encoded_token, settings)
+    return timed_call(listeners, 'decode', 'verify', settings.algorithm,
+                      _verify_jwt, (encoded_token, settings))
+
+
+def _verify_jwt(encoded_token, settings):
+    algorithm = settings.algorithm
+    audience = settings.audience
+
+    # Throw out anything that is obviously not one of our tokens before
+    # spending any time on it
+    header = jws.check_structure(encoded_token, algorithm, settings.max_token_length)
+    secret = settings.key_ring.verifying_key(header.get('kid'))
+
+    decode_cache = settings.decode_cache
+    negative_cache = settings.negative_cache
+    shared_store = settings.shared_store
+    claim_map = settings.claim_map
+    if not decode_cache.maxsize and not negative_cache.maxsize and shared_store is None:
+        jwt_data = settings.decoder(encoded_token, secret, algorithm, audience,
+                                    loads=settings.json_loads, header=header,
+                                    max_decompressed_size=settings.max_decompressed_size)
+        return jwt_data if claim_map is None else claim_map.expand(jwt_data)
+
+    digest = token_digest(encoded_token)
+    if decode_cache.maxsize:
+        jwt_data = decode_cache.get(digest)
+        if jwt_data is not None:
+            return _copy_claims(jwt_data)
+
+    # Tokens that recently failed verification fail the same way again,
+    # without being verified again
+    if negative_cache.maxsize:
+        error = negative_cache.get(digest)
+        if error is not None:
+            error_class, error_args = error
+            raise error_class(*error_args)
+
+    # Another worker may already have checked the signature, in which case
+    # only the claims are left to validate
+    if shared_store is not None:
+        shared_digest = verified_digest(digest, algorithm, header.get('kid'), secret)
+        verified = shared_store.is_verified(shared_digest)
+    else:
+        verified = False
+    try:
+        jwt_data = settings.decoder(encoded_token, secret, algorithm, audience,
+                                    verify_signature=not verified,
+                                    loads=settings.json_loads, header=header,
+                                    max_decompressed_size=settings.max_decompressed_size)
+        if claim_map is not None:
+            jwt_data = claim_map.expand(jwt_data)
+    except jwt.ImmatureSignatureError:
+        # This token will become valid, so it must not be remembered
+        raise
+    except jwt.InvalidTokenError as e:
+        negative_cache.set(digest, (type(e), e.args))
+        raise
+
+    decode_cache.set(digest, _copy_claims(jwt_data), jwt_data.get('exp'))
+    if shared_store is not None and not verified:
+        expires = time.time() + settings.decode_cache_ttl
+        exp = jwt_data.get('exp')
+        if exp is not None:
+            expires = min(expires, float(exp))
+        shared_store.mark_verified(shared_digest, expires)
+    return jwt_data
+
+
+def _copy_claims(jwt_data):
+    """
+    Returns a copy of decoded jwt_data which shares nothing that can be
+    changed with it. Most tokens only hold strings and numbers, so the
+    (much slower) deep copy is only made for those that do not.
+    """
+    for value in jwt_data.values():
+        if isinstance(value, (list, dict)):
+            return copy.deepcopy(jwt_data)
+    return dict(jwt_data)
+
+
+def _check_revocation(jwt_data, settings):
+    """
+    Raises a RevokedTokenError if the revocation check of the JWTManager
+    says this token has been revoked, and otherwise returns it.
+    """
+    is_revoked = _get_jwt_manager()._revocation_check
+    if is_revoked is None:
+        return jwt_data
+
+    # The error is raised within the timed call, so that the listeners are
+    # told the token was revoked
+    listeners = settings.timing_listeners
+    if not listeners:
+        return _raise_if_revoked(is_revoked, jwt_data)
+    return timed_call(listeners, 'decode', 'revocation', settings.algorithm,
+                      _raise_if_revoked, (is_revoked, jwt_data))
+
+
+def _raise_if_revoked(is_revoked, jwt_data):
+    if is_revoked(jwt_data):
+        raise RevokedTokenError('Token has been revoked')
+    return jwt_data
+
+
+async def decode_jwt_async(encoded_token):
+    """
+    Like :func:`decode_jwt`, but verifies the token in an executor, so that
+    the event loop is not blocked while checking its signature.
+    """
+    settings = get_settings()
+    return await _run_in_executor(_decode_jwt, encoded_token, settings)
+
+
+def decode_jwts(encoded_tokens, workers=None):
+    """
+    Decodes and verifies every token in an iterable. All of the tokens are
+    verified with the same settings and keys, and one invalid token does not
+    stop the others from being verified.
+
+    Tokens are decoded as they are consumed, and must be consumed within the
+    application context.
+
+    :param encoded_tokens: An iterable of encoded tokens.
+    :param workers: How many threads to verify the tokens with. Defaults to
+                    ``JWT_BATCH_WORKERS``.
+    :return: A generator of ``DecodeResult(jwt_data, error)`` tuples, in the
+             same order as the tokens. For a valid token, ``jwt_data`` is the
+             decoded token and ``error`` is None. Otherwise ``jwt_data`` is
+             None and ``error`` is the exception explaining why the token is
+             not valid.
     """
-    secret = config.decode_key
-    algorithm = config.algorithm
-    audience = config.audience
-    return jwt.decode(encoded_token, secret, algorithms=[algorithm], audience=audience)
+    settings = get_settings()
+    if workers is None:
+        workers = settings.batch_workers
+
+    def decode(encoded_token):
+        try:
+            return DecodeResult(_decode_jwt(encoded_token, settings), None)
+        except (jwt.InvalidTokenError, FlaskJWTException) as e:
+            return DecodeResult(None, e)
+
+    return _bounded_map(decode, encoded_tokens, workers)
 
 
 def create_jwt(identity):
@@ -54,3 +231,71 @@ def create_jwt(identity):
     """
     jwt_manager = _get_jwt_manager()
     return jwt_manager._create_jwt(identity)
+
+
+async def create_jwt_async(identity):
+    """
+    Like :func:`create_jwt`, but signs the token in an executor (or with the
+    :meth:`JWTManager.set_signer` signer), so that the event loop is not
+    blocked while signing it.
+
+    :param identity: The identity of this token. This can be anything that is
+                     json serializable.
+    :return: A utf-8 encoded jwt.
+    """
+    jwt_manager = _get_jwt_manager()
+    return await jwt_manager._create_jwt_async(identity)
+
+
+def create_jwts(identities, workers=None):
+    """
+    Creates a new JWT for every identity in an iterable. This is much faster
+    than calling :func:`create_jwt` in a loop, as all of the tokens share the
+    same timestamps, header and key.
+
+    Tokens are created as they are consumed, so this can be used for any
+    number of identities. If a custom :meth:`JWTManager.jwt_data_loader` is
+    used, all the tokens must be consumed within the application context.
+
+    :param identities: An iterable of identities, which can be anything that
+                       is json serializable.
+    :param workers: How many threads to sign the tokens with. Defaults to
+                    ``JWT_BATCH_WORKERS``.
+    :return: A generator of utf-8 encoded jwts, in the same order as the
+             identities.
+    """
+    jwt_manager = _get_jwt_manager()
+    return jwt_manager._create_jwts(identities, workers)
+
+
+def _bounded_map(fn, iterable, workers):
+    """
+    Lazily maps fn over iterable in a pool of threads, yielding the results
+    in order. Only a few items per worker are in flight at any given time,
+    so the memory used does not grow with the size of the iterable.
+    """
+    if workers <= 1:
+        for item in iterable:
+            yield fn(item)
+        return
+
+    max_pending = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for item in iterable:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+async def _run_in_executor(fn, *args):
+    """
+    Runs fn in the default executor of the running event loop, with a copy
+    of the current context so the flask contexts are still available.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, fn, *args)
+    return await loop.run_in_executor(None, call)
@@ -1,14 +1,22 @@
+from asyncio import iscoroutinefunction
 from functools import wraps
 
+import jwt
 from flask import request
 try:
     from flask import _app_ctx_stack as ctx_stack
 except ImportError:  # pragma: no cover
     from flask import _request_ctx_stack as ctx_stack
 
-from flask_jwt_simple.utils import decode_jwt
-from flask_jwt_simple.config import config
-from flask_jwt_simple.exceptions import InvalidHeaderError, NoAuthorizationError
+from flask_jwt_simple.utils import (
+    _check_revocation, _decode_jwt, _get_jwt_manager, _run_in_executor
+)
+from flask_jwt_simple.config import get_settings
+from flask_jwt_simple.exceptions import (
+    FlaskJWTException, InvalidHeaderError, NoAuthorizationError
+)
+from flask_jwt_simple.instrumentation import timed_call
+from flask_jwt_simple.upstream import decode_envelope
 
 
 def jwt_required(fn):
@@ -16,11 +24,41 @@ def jwt_required(fn):
     If you decorate a view with this, it will ensure that the requester has a
     valid JWT before calling the actual view.
 
+    This also works with async views, in which case the signature of the JWT
+    is verified in an executor instead of blocking the event loop.
+
+    If ``JWT_UPSTREAM_HEADER`` is set, and the request has that header, the
+    claims are taken from the envelope in it instead of from a JWT.
+
+    If ``JWT_DIRECT_ERROR_RESPONSES`` is set, the response of the error
+    callback is returned from here when the JWT is not valid, instead of the
+    error being raised for flask's error handlers to catch.
+
     :param fn: The view function to decorate
     """
+    if iscoroutinefunction(fn):
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            settings = get_settings()
+            try:
+                jwt_data = await _decode_jwt_from_headers_async(settings)
+            except _jwt_errors as e:
+                if not settings.direct_error_responses:
+                    raise
+                return _get_jwt_manager()._handle_error(e)
+            ctx_stack.top.jwt = jwt_data
+            return await fn(*args, **kwargs)
+        return async_wrapper
+
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        jwt_data = _decode_jwt_from_headers()
+        settings = get_settings()
+        try:
+            jwt_data = _decode_jwt_from_headers(settings)
+        except _jwt_errors as e:
+            if not settings.direct_error_responses:
+                raise
+            return _get_jwt_manager()._handle_error(e)
         ctx_stack.top.jwt = jwt_data
         return fn(*args, **kwargs)
     return wrapper
@@ -35,28 +73,134 @@ def jwt_optional(fn):
     affected. For example, if an expired JWT is passed in, it will still not
     be able to access an endpoint protected by this decorator.
 
+    This also works with async views, in which case the signature of the JWT
+    is verified in an executor instead of blocking the event loop.
+
+    If ``JWT_OPTIONAL_LAZY_DECODE`` is set, the JWT is only taken out of the
+    header here. It is verified the first time :func:`get_jwt` or
+    :func:`get_jwt_identity` is called, which raises the same errors (and
+    so calls the same callbacks) as verifying it up front would. If the view
+    never looks at the JWT, it is never verified. ``JWT_DIRECT_ERROR_RESPONSES``
+    does not apply to the errors raised then.
+
     :param fn: The view function to decorate
     """
+    if iscoroutinefunction(fn):
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            settings = get_settings()
+            try:
+                jwt_data = _decode_upstream_envelope(settings)
+                if jwt_data is None:
+                    token = _get_encoded_jwt_from_headers(settings)
+                    if settings.optional_lazy_decode:
+                        ctx_stack.top.encoded_jwt = token
+                    else:
+                        jwt_data = await _run_in_executor(_decode_jwt, token, settings)
+                if jwt_data is not None:
+                    ctx_stack.top.jwt = _check_revocation(jwt_data, settings)
+            except (NoAuthorizationError, InvalidHeaderError):
+                pass
+            except _jwt_errors as e:
+                if not settings.direct_error_responses:
+                    raise
+                return _get_jwt_manager()._handle_error(e)
+            return await fn(*args, **kwargs)
+        return async_wrapper
+
     @wraps(fn)
     def wrapper(*args, **kwargs):
+        settings = get_settings()
         try:
-            jwt_data = _decode_jwt_from_headers()
-            ctx_stack.top.jwt = jwt_data
+            jwt_data = _decode_upstream_envelope(settings)
+            if jwt_data is None:
+                token = _get_encoded_jwt_from_headers(settings)
+                if settings.optional_lazy_decode:
+                    ctx_stack.top.encoded_jwt = token
+                else:
+                    jwt_data = _decode_jwt(token, settings)
+            if jwt_data is not None:
+                ctx_stack.top.jwt = _check_revocation(jwt_data, settings)
         except (NoAuthorizationError, InvalidHeaderError):
             pass
+        except _jwt_errors as e:
+            if not settings.direct_error_responses:
+                raise
+            return _get_jwt_manager()._handle_error(e)
         return fn(*args, **kwargs)
     return wrapper
 
 
-def _decode_jwt_from_headers():
-    header_name = config.header_name
-    header_type = config.header_type
+# The errors which have an error callback
+_jwt_errors = (FlaskJWTException, jwt.InvalidTokenError)
+
+
+def _decode_jwt_from_headers(settings):
+    jwt_data = _decode_upstream_envelope(settings)
+    if jwt_data is None:
+        token = _get_encoded_jwt_from_headers(settings)
+        jwt_data = _decode_jwt(token, settings)
+    return _check_revocation(jwt_data, settings)
+
+
+async def _decode_jwt_from_headers_async(settings):
+    # Checking the envelope is cheap enough to do on the event loop
+    jwt_data = _decode_upstream_envelope(settings)
+    if jwt_data is None:
+        token = _get_encoded_jwt_from_headers(settings)
+        jwt_data = await _run_in_executor(_decode_jwt, token, settings)
+    return _check_revocation(jwt_data, settings)
+
+
+def _decode_upstream_envelope(settings):
+    """
+    Returns the claims in the envelope from the trusted upstream, or None if
+    the request has no envelope (or JWT_UPSTREAM_HEADER is not set).
+    """
+    header_name = settings.upstream_header
+    if header_name is None:
+        return None
+    envelope = request.headers.get(header_name, None)
+    if not envelope:
+        return None
+
+    args = (envelope, settings.upstream_secret, settings.upstream_max_age,
+            settings.audience, settings.json_loads)
+    listeners = settings.timing_listeners
+    if not listeners:
+        jwt_data = decode_envelope(*args)
+    else:
+        jwt_data = timed_call(listeners, 'decode', 'upstream', settings.algorithm,
+                              decode_envelope, args)
+
+    # The upstream may pass the claims on just as they were in the JWT
+    claim_map = settings.claim_map
+    return jwt_data if claim_map is None else claim_map.expand(jwt_data)
+
+
+def _get_encoded_jwt_from_headers(settings):
+    listeners = settings.timing_listeners
+    if not listeners:
+        return _read_jwt_header(settings)
+    return timed_call(listeners, 'decode', 'header', settings.algorithm,
+                      _read_jwt_header, (settings,))
+
+
+def _read_jwt_header(settings):
+    header_name = settings.header_name
+    header_type = settings.header_type
 
     # Verify we have the auth header
     jwt_header = request.headers.get(header_name, None)
     if not jwt_header:
         raise NoAuthorizationError("Missing {} Header".format(header_name))
 
+    # Don't bother splitting up headers that can't possibly hold a token
+    # we would accept
+    max_length = settings.max_token_length
+    if max_length is not None and len(jwt_header) > max_length + len(header_type or '') + 1:
+        raise InvalidHeaderError("{} header is too long".format(header_name))
+
     # Make sure the header is in a valid format that we are expecting, ie
     # <HeaderName>: <HeaderType(optional)> <JWT>
     parts = jwt_header.split()
@@ -71,4 +215,4 @@ def _decode_jwt_from_headers():
             raise InvalidHeaderError(msg)
         token = parts[1]
 
-    return decode_jwt(encoded_token=token)
+    return token
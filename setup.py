@@ -17,6 +17,7 @@ setup(name='Flask-JWT-Simple',
       packages=['flask_jwt_simple'],
       zip_safe=False,
       platforms='any',
+      python_requires='>=3.7',
       install_requires=['Flask', 'PyJWT'],
       extras_require={
         'asymmetric_crypto':  ["cryptography"]
@@ -28,11 +29,13 @@ setup(name='Flask-JWT-Simple',
         'License :: OSI Approved :: MIT License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Internet :: WWW/HTTP :: Dynamic Content',
         'Topic :: Software Development :: Libraries :: Python Modules'
       ])
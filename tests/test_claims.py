@@ -0,0 +1,136 @@
+import jwt as pyjwt
+import pytest
+from flask import Flask, jsonify, json
+
+from flask_jwt_simple import (
+    JWTManager, create_jwt, create_jwts, create_jwt_async, decode_jwt,
+    get_jwt, get_jwt_identity, jwt_required
+)
+from flask_jwt_simple.claims import ClaimMap
+
+CLAIM_MAP = {
+    'permissions': 'p',
+    'identity': 'i',
+    'role': ('r', ['user', 'admin', 'owner']),
+}
+
+
+def test_compact_and_expand():
+    claim_map = ClaimMap(CLAIM_MAP)
+    jwt_data = {'exp': 1, 'identity': 'foo', 'role': 'admin',
+                'permissions': ['read', 'write'], 'other': 'bar'}
+    compacted = claim_map.compact(jwt_data)
+    assert compacted == {'exp': 1, 'i': 'foo', 'r': 1, 'p': ['read', 'write'],
+                         'other': 'bar'}
+    assert claim_map.expand(compacted) == jwt_data
+
+    # Claims which were never compacted are left alone
+    assert claim_map.expand(jwt_data) == jwt_data
+
+
+def test_enumerated_lists():
+    claim_map = ClaimMap({'roles': ('r', ('user', 'admin', 'owner'))})
+    compacted = claim_map.compact({'roles': ['owner', 'user']})
+    assert compacted == {'r': [2, 0]}
+    assert claim_map.expand(compacted) == {'roles': ['owner', 'user']}
+
+    for value in ('root', ['user', 'root'], {'a': 1}):
+        with pytest.raises(ValueError):
+            claim_map.compact({'roles': value})
+
+    for value in (3, -1, '0', 1.0, True, [0, 5]):
+        with pytest.raises(pyjwt.DecodeError) as e:
+            claim_map.expand({'r': value})
+        assert str(e.value) == 'Invalid value for the "roles" claim'
+
+
+def test_swapped_names():
+    claim_map = ClaimMap({'a': 'b', 'b': 'a'})
+    assert claim_map.compact({'a': 1, 'b': 2}) == {'b': 1, 'a': 2}
+    assert claim_map.expand({'b': 1, 'a': 2}) == {'a': 1, 'b': 2}
+
+
+def test_unmapped_claim_named_like_short_name():
+    claim_map = ClaimMap(CLAIM_MAP)
+    with pytest.raises(ValueError):
+        claim_map.compact({'identity': 'foo', 'i': 'bar'})
+
+
+@pytest.mark.parametrize('claim_map', [
+    {'exp': 'e'},
+    {'expires': 'exp'},
+    {'a': 'x', 'b': 'x'},
+    {'a': 1},
+    {1: 'a'},
+    {'a': ('x',)},
+    {'a': ('x', 5)},
+    {'a': ('x', ['one', 'one'])},
+    {'a': ('x', [['one']])},
+])
+def test_invalid_claim_map(claim_map):
+    with pytest.raises(ValueError):
+        ClaimMap(claim_map)
+
+
+@pytest.fixture(scope='function')
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    app.config['JWT_IDENTITY_CLAIM'] = 'identity'
+    app.config['JWT_CLAIM_MAP'] = CLAIM_MAP
+    jwt_manager = JWTManager(app)
+
+    @jwt_manager.jwt_data_loader
+    def jwt_data(identity):
+        return {'identity': identity, 'role': 'owner', 'permissions': ['read']}
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(identity=get_jwt_identity(), jwt=get_jwt())
+
+    return app
+
+
+def _raw_claims(token):
+    return pyjwt.decode(token, verify=False)
+
+
+def test_claim_map(app):
+    expected = {'identity': 'foo', 'role': 'owner', 'permissions': ['read']}
+    with app.test_request_context():
+        token = create_jwt('foo')
+        tokens = list(create_jwts(['foo', 'bar']))
+    assert _raw_claims(token) == {'i': 'foo', 'r': 2, 'p': ['read']}
+    assert _raw_claims(tokens[1]) == {'i': 'bar', 'r': 2, 'p': ['read']}
+
+    with app.test_request_context():
+        assert decode_jwt(token) == expected
+        assert decode_jwt(tokens[1]) == dict(expected, identity='bar')
+
+    response = app.test_client().get('/protected', headers={
+        'Authorization': 'Bearer {}'.format(token)
+    })
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True)) == {
+        'identity': 'foo', 'jwt': expected
+    }
+
+
+def test_claim_map_async(app):
+    @app.route('/async/jwt')
+    async def create():
+        return jsonify(jwt=await create_jwt_async('foo'))
+
+    test_client = app.test_client()
+    token = json.loads(test_client.get('/async/jwt').get_data(as_text=True))['jwt']
+    assert _raw_claims(token) == {'i': 'foo', 'r': 2, 'p': ['read']}
+
+
+def test_claim_map_with_decode_cache(app):
+    app.config['JWT_DECODE_CACHE_SIZE'] = 10
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+    with app.test_request_context():
+        token = create_jwt('foo')
+        for _ in range(2):
+            assert decode_jwt(token)['role'] == 'owner'
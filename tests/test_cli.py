@@ -0,0 +1,63 @@
+import json
+
+import jwt as pyjwt
+import pytest
+from flask import Flask
+
+from flask_jwt_simple import JWTManager
+
+SECRET = 'foobarbaz'
+
+
+@pytest.fixture(scope='function')
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET
+    JWTManager(app)
+    return app
+
+
+@pytest.mark.parametrize('workers', [None, 3])
+def test_issue(app, tmpdir, workers):
+    identities = ['user{}'.format(i) for i in range(50)]
+    source = tmpdir.join('identities.txt')
+    source.write('\n'.join(identities[:25]) + '\n\n' + '\n'.join(identities[25:]))
+    output = tmpdir.join('tokens.jsonl')
+
+    args = ['jwt', 'issue', '--from', str(source), '-o', str(output)]
+    if workers:
+        args += ['--workers', str(workers)]
+    result = app.test_cli_runner().invoke(args=args)
+    assert result.exit_code == 0, result.output
+
+    lines = [json.loads(line) for line in output.read().splitlines()]
+    assert [line['identity'] for line in lines] == identities
+    for line in lines:
+        claims = pyjwt.decode(line['jwt'], SECRET, algorithms=['HS256'])
+        assert claims['sub'] == line['identity']
+
+
+def test_issue_stdin(app):
+    result = app.test_cli_runner().invoke(args=['jwt', 'issue'], input='foo\nbar\n')
+    assert result.exit_code == 0, result.output
+    lines = [json.loads(line) for line in result.output.splitlines()]
+    assert [line['identity'] for line in lines] == ['foo', 'bar']
+
+
+def test_bench(app):
+    result = app.test_cli_runner().invoke(args=['jwt', 'bench', '-n', '20'])
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    assert lines[0] == 'Algorithm: HS256'
+    assert lines[1].startswith('create_jwt')
+    assert lines[2].startswith('decode_jwt')
+    for line in lines[1:]:
+        assert 'ops/s' in line and 'p50' in line and 'p99' in line and 'max' in line
+
+
+def test_bench_without_keys():
+    app = Flask(__name__)
+    JWTManager(app)
+    result = app.test_cli_runner().invoke(args=['jwt', 'bench', '-n', '1'])
+    assert result.exit_code == 1
+    assert 'JWT_SECRET_KEY must be set' in result.output
@@ -3,7 +3,7 @@ import pytest
 from flask import Flask
 
 from flask_jwt_simple import JWTManager
-from flask_jwt_simple.config import config
+from flask_jwt_simple.config import config, get_settings
 
 
 @pytest.fixture(scope='function')
@@ -23,6 +23,21 @@ def test_default_configs(app):
         assert config.algorithm == 'HS256'
         assert config.identity_claim == 'sub'
         assert config.audience is None
+        assert config.decode_cache_size == 0
+        assert config.decode_cache_ttl == 300
+        assert config.negative_cache_size == 0
+        assert config.negative_cache_ttl == 10
+        assert config.batch_workers == 1
+        assert config.optional_lazy_decode is False
+        assert config.max_token_length is None
+        assert config.metrics_enabled is False
+        assert config.metrics_url is None
+        assert config.claim_map is None
+        assert config.compress_threshold is None
+        assert config.max_decompressed_size == 65536
+        assert config.upstream_header is None
+        assert config.upstream_secret is None
+        assert config.upstream_max_age == 30
         with pytest.raises(RuntimeError):
             config.encode_key
         with pytest.raises(RuntimeError):
@@ -73,6 +88,16 @@ def test_config_overrides(app):
         app.config['JWT_DECODE_AUDIENCE'] = 'foobar'
         assert config.audience == 'foobar'
 
+        app.config['JWT_DECODE_CACHE_SIZE'] = 128
+        assert config.decode_cache_size == 128
+
+        app.config['JWT_DECODE_CACHE_TTL'] = datetime.timedelta(seconds=30)
+        assert config.decode_cache_ttl == 30
+
+        app.config['JWT_METRICS_URL'] = '/metrics'
+        assert config.metrics_url == '/metrics'
+        assert config.metrics_enabled is True
+
 
 # noinspection PyStatementEffect
 def test_config_invalid_options(app):
@@ -100,3 +125,167 @@ def test_config_invalid_options(app):
         app.config['JWT_EXPIRES'] = 'banana'
         with pytest.raises(RuntimeError):
             config.jwt_expires
+
+        app.config['JWT_DECODE_CACHE_SIZE'] = -1
+        with pytest.raises(RuntimeError):
+            config.decode_cache_size
+
+        app.config['JWT_DECODE_CACHE_TTL'] = 30
+        with pytest.raises(RuntimeError):
+            config.decode_cache_ttl
+
+        app.config['JWT_NEGATIVE_CACHE_SIZE'] = -1
+        with pytest.raises(RuntimeError):
+            config.negative_cache_size
+
+        app.config['JWT_NEGATIVE_CACHE_TTL'] = 30
+        with pytest.raises(RuntimeError):
+            config.negative_cache_ttl
+
+        app.config['JWT_BATCH_WORKERS'] = 0
+        with pytest.raises(RuntimeError):
+            config.batch_workers
+
+        app.config['JWT_MAX_TOKEN_LENGTH'] = 0
+        with pytest.raises(RuntimeError):
+            config.max_token_length
+
+        app.config['JWT_METRICS_URL'] = 'metrics'
+        with pytest.raises(RuntimeError):
+            config.metrics_url
+
+        app.config['JWT_JSON_DUMPS'] = 'json'
+        with pytest.raises(RuntimeError):
+            config.json_dumps
+
+        app.config['JWT_JSON_LOADS'] = 'json'
+        with pytest.raises(RuntimeError):
+            config.json_loads
+
+        app.config['JWT_CLAIM_MAP'] = ['foo']
+        with pytest.raises(RuntimeError):
+            config.claim_map
+
+        app.config['JWT_CLAIM_MAP'] = {'exp': 'e'}
+        with pytest.raises(RuntimeError):
+            config.claim_map
+
+        app.config['JWT_COMPRESS_THRESHOLD'] = -1
+        with pytest.raises(RuntimeError):
+            config.compress_threshold
+
+        app.config['JWT_MAX_DECOMPRESSED_SIZE'] = None
+        with pytest.raises(RuntimeError):
+            config.max_decompressed_size
+
+        app.config['JWT_UPSTREAM_HEADER'] = 'X-Claims'
+        with pytest.raises(RuntimeError):
+            config.upstream_secret
+
+        app.config['JWT_UPSTREAM_MAX_AGE'] = 30
+        with pytest.raises(RuntimeError):
+            config.upstream_max_age
+
+        app.config['JWT_KEYS'] = ['foo']
+        with pytest.raises(RuntimeError):
+            config.keys
+
+        app.config['JWT_KEYS'] = {1: 'foo'}
+        with pytest.raises(RuntimeError):
+            config.keys
+
+        app.config['JWT_KEYS'] = {'one': 'foo'}
+        app.config['JWT_ACTIVE_KID'] = 'two'
+        with pytest.raises(RuntimeError):
+            config.active_kid
+
+        app.config['JWT_ALGORITHM'] = 'RS256'
+        with pytest.raises(RuntimeError):
+            config.keys
+
+        app.config['JWT_KEYS'] = {'two': (None, 'foo')}
+        with pytest.raises(RuntimeError):
+            config.active_kid
+
+
+def test_settings_compiled_on_init(app):
+    settings = get_settings(app)
+    assert settings.header_name == 'Authorization'
+    assert settings.header_type == 'Bearer'
+    assert settings.jwt_expires == datetime.timedelta(hours=1)
+    assert settings.algorithm == 'HS256'
+    assert settings.is_asymmetric is False
+    assert settings.identity_claim == 'sub'
+    assert settings.audience is None
+    assert settings.decode_cache.maxsize == 0
+    with pytest.raises(RuntimeError):
+        settings.encode_key
+    with pytest.raises(RuntimeError):
+        settings.decode_key
+    with pytest.raises(AttributeError):
+        settings.algorithm = 'HS512'
+
+
+def test_settings_refresh(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    app.config['JWT_ALGORITHM'] = 'HS512'
+    assert get_settings(app).algorithm == 'HS256'
+
+    jwt_manager.refresh_config(app)
+    assert get_settings(app).algorithm == 'HS512'
+    assert get_settings(app).encode_key == 'foobarbaz'
+    assert get_settings(app).decode_key == 'foobarbaz'
+
+    app.config['JWT_ALGORITHM'] = 'HS384'
+    with app.app_context():
+        jwt_manager.refresh_config()
+        assert get_settings().algorithm == 'HS384'
+
+
+def test_settings_load_asymmetric_keys(app):
+    rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+    serialization = pytest.importorskip('cryptography.hazmat.primitives.serialization')
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('utf-8')
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('utf-8')
+
+    jwt_manager = app.extensions['flask-jwt-simple']
+    app.config['JWT_ALGORITHM'] = 'RS256'
+    app.config['JWT_PRIVATE_KEY'] = private_pem
+    app.config['JWT_PUBLIC_KEY'] = public_pem
+    jwt_manager.refresh_config(app)
+
+    settings = get_settings(app)
+    assert settings.encode_key == private_pem
+    assert settings.decode_key == public_pem
+    assert isinstance(settings.signing_key, rsa.RSAPrivateKey)
+    assert isinstance(settings.verifying_key, rsa.RSAPublicKey)
+
+    # Unchanged keys are not loaded again when the config is refreshed
+    jwt_manager.refresh_config(app)
+    assert get_settings(app).signing_key is settings.signing_key
+    assert get_settings(app).verifying_key is settings.verifying_key
+
+
+def test_settings_invalid_asymmetric_keys(app):
+    pytest.importorskip('cryptography')
+    app.config['JWT_ALGORITHM'] = 'RS256'
+    app.config['JWT_PUBLIC_KEY'] = 'foo'
+    app.config['JWT_PRIVATE_KEY'] = 'bar'
+    with pytest.raises(RuntimeError):
+        app.extensions['flask-jwt-simple'].refresh_config(app)
+
+
+def test_settings_validated_on_init():
+    app = Flask(__name__)
+    app.config['JWT_EXPIRES'] = 'banana'
+    with pytest.raises(RuntimeError):
+        JWTManager(app)
@@ -0,0 +1,205 @@
+import datetime
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import jwt
+import pytest
+from flask import Flask, jsonify
+
+from flask_jwt_simple import JWTManager, jwt_required
+from flask_jwt_simple.jwks import load_jwks
+
+serialization = pytest.importorskip('cryptography.hazmat.primitives.serialization')
+rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+ec = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.ec')
+from jwt.algorithms import RSAAlgorithm  # noqa: E402
+
+
+def _pem(private_key):
+    return private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('utf-8')
+
+
+def _rsa_jwk(private_key, kid, **extra):
+    jwk = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update(kid=kid, **extra)
+    return jwk
+
+
+def _token(private_key, kid, algorithm='RS256'):
+    return jwt.encode({'sub': 'foo'}, _pem(private_key), algorithm=algorithm,
+                      headers={'kid': kid}).decode('utf-8')
+
+
+class _JWKSServer(object):
+    """
+    A local stand-in for the JWKS endpoint of an identity provider
+    """
+
+    def __init__(self, document):
+        self.document = document
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server.requests += 1
+                body = json.dumps(server.document).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/jwks.json'.format(self.httpd.server_port)
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture(scope='module')
+def keys():
+    return [rsa.generate_private_key(public_exponent=65537, key_size=2048)
+            for _ in range(2)]
+
+
+@pytest.fixture(scope='function')
+def server(keys):
+    server = _JWKSServer({'keys': [_rsa_jwk(keys[0], 'one')]})
+    yield server
+    server.close()
+
+
+def _make_app(source, **config):
+    app = Flask(__name__)
+    app.config['JWT_ALGORITHM'] = 'RS256'
+    app.config['JWT_JWKS_SOURCE'] = source
+    app.config.update(config)
+    JWTManager(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    return app
+
+
+def _status(app, token):
+    headers = {'Authorization': 'Bearer {}'.format(token)}
+    return app.test_client().get('/protected', headers=headers).status_code
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_load_jwks(keys):
+    document = {'keys': [
+        _rsa_jwk(keys[0], 'one'),
+        _rsa_jwk(keys[1], 'enc', use='enc'),
+        _rsa_jwk(keys[1], 'other-alg', alg='RS512'),
+        _rsa_jwk(keys[1], None),
+        {'kty': 'RSA', 'kid': 'broken', 'n': 'foo'},
+    ]}
+    loaded = load_jwks(json.dumps(document), 'RS256')
+    assert list(loaded) == ['one']
+    assert isinstance(loaded['one'], rsa.RSAPublicKey)
+
+
+def test_load_ec_jwks():
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    numbers = private_key.public_key().public_numbers()
+    jwk = {
+        'kty': 'EC', 'kid': 'ec', 'crv': 'P-256',
+        'x': jwt.utils.base64url_encode(numbers.x.to_bytes(32, 'big')).decode('ascii'),
+        'y': jwt.utils.base64url_encode(numbers.y.to_bytes(32, 'big')).decode('ascii'),
+    }
+    loaded = load_jwks({'keys': [jwk]}, 'ES256')
+    token = _token(private_key, 'ec', 'ES256')
+    assert jwt.decode(token, loaded['ec'], algorithms=['ES256'])['sub'] == 'foo'
+
+
+def test_jwks_from_file(keys, tmpdir):
+    path = tmpdir.join('jwks.json')
+    path.write(json.dumps({'keys': [_rsa_jwk(keys[0], 'one')]}))
+    app = _make_app(str(path))
+    assert _status(app, _token(keys[0], 'one')) == 200
+    assert _status(app, _token(keys[1], 'one')) == 422
+    assert _status(app, _token(keys[1], 'two')) == 422
+
+
+def test_jwks_refresh_on_unknown_kid(keys, server):
+    app = _make_app(server.url, JWT_JWKS_REFRESH_INTERVAL=datetime.timedelta(0))
+    key_ring = app.extensions['flask-jwt-simple'].key_ring(app)
+    assert server.requests == 1
+    assert _status(app, _token(keys[0], 'one')) == 200
+    assert server.requests == 1
+
+    # The request with the new kid does not wait for the refresh
+    server.document = {'keys': [_rsa_jwk(keys[1], 'two')]}
+    assert _status(app, _token(keys[1], 'two')) == 422
+    _wait_for(lambda: 'two' in key_ring)
+    assert _status(app, _token(keys[1], 'two')) == 200
+    assert server.requests == 2
+    assert _status(app, _token(keys[0], 'one')) == 422
+
+
+def test_jwks_refresh_is_rate_limited(keys, server):
+    app = _make_app(server.url)
+    for _ in range(5):
+        assert _status(app, _token(keys[1], 'two')) == 422
+    time.sleep(0.1)
+    assert server.requests == 1
+
+
+def test_jwks_refresh_when_stale(keys, server):
+    app = _make_app(server.url, JWT_JWKS_TTL=datetime.timedelta(0),
+                    JWT_JWKS_REFRESH_INTERVAL=datetime.timedelta(0))
+    key_ring = app.extensions['flask-jwt-simple'].key_ring(app)
+
+    # Stale keys keep being used while the new ones are fetched
+    server.document = {'keys': [_rsa_jwk(keys[1], 'two')]}
+    assert _status(app, _token(keys[0], 'one')) == 200
+    _wait_for(lambda: 'two' in key_ring)
+    assert 'one' not in key_ring
+
+
+def test_jwks_unavailable_at_startup(keys, server):
+    url = server.url
+    server.close()
+    app = _make_app(url)
+    source = app.extensions['flask-jwt-simple'].key_ring(app).source
+    assert source.last_error is not None
+    assert _status(app, _token(keys[0], 'one')) == 422
+
+
+def test_jwks_refresh_keeps_caches_when_unchanged(keys, server):
+    app = _make_app(server.url, JWT_DECODE_CACHE_SIZE=10)
+    jwt_manager = app.extensions['flask-jwt-simple']
+    source = jwt_manager.key_ring(app).source
+    assert _status(app, _token(keys[0], 'one')) == 200
+    assert jwt_manager.decode_cache_info(app).currsize == 1
+
+    source.refresh()
+    assert jwt_manager.decode_cache_info(app).currsize == 1
+
+    server.document = {'keys': [_rsa_jwk(keys[0], 'one'), _rsa_jwk(keys[1], 'two')]}
+    source.refresh()
+    assert jwt_manager.decode_cache_info(app).currsize == 0
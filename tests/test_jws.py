@@ -0,0 +1,184 @@
+import base64
+import json
+import time
+
+import jwt
+import pytest
+from flask import Flask
+
+from flask_jwt_simple import JWTManager, create_jwt, decode_jwt, jws
+from flask_jwt_simple.config import get_settings
+
+SECRET = 'foobarbaz'
+KEY = SECRET.encode('utf-8')
+
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).replace(b'=', b'').decode('ascii')
+
+
+def _raw_token(payload_bytes):
+    signing_input = jws.header_segment('HS256') + b'.' + _b64(payload_bytes).encode('ascii')
+    return jws.assemble(signing_input, jws.sign(signing_input, 'HS256', KEY))
+
+
+def _tokens():
+    now = int(time.time())
+    claims = [
+        {'sub': 'foo'},
+        {'sub': 'foo', 'exp': now + 60, 'iat': now, 'nbf': now},
+        {'sub': 'foo', 'exp': now - 60},
+        {'sub': 'foo', 'exp': str(now + 60)},
+        {'sub': 'foo', 'exp': 'soon'},
+        {'sub': 'foo', 'nbf': now + 60},
+        {'sub': 'foo', 'nbf': 'later'},
+        {'sub': 'foo', 'iat': 'then'},
+        {'sub': 'foo', 'exp': now + 60.5},
+        {'sub': 'foo', 'aud': 'api'},
+        {'sub': 'foo', 'aud': ['web', 'api']},
+        {'sub': 'foo', 'aud': ['web']},
+        {'sub': 'foo', 'aud': [1]},
+        {'sub': 'foo', 'aud': {'a': 1}},
+    ]
+    tokens = [jwt.encode(c, SECRET, 'HS256').decode('utf-8') for c in claims]
+    tokens.append(jwt.encode({'sub': 'foo'}, 'other', 'HS256').decode('utf-8'))
+    tokens.append(_raw_token(b'[1, 2]'))
+    tokens.append(_raw_token(b'not json'))
+    tokens.append(_raw_token(b'\xff\xfe'))
+
+    valid = tokens[0]
+    header, payload, signature = valid.split('.')
+    tokens.append('.'.join([header, payload + 'a', signature]))
+    tokens.append('.'.join([header, payload, signature + 'a']))
+    tokens.append('.'.join([header, payload, signature[:-2]]))
+    tokens.append('.'.join([header, payload, '']))
+    return tokens
+
+
+def _outcome(fn):
+    try:
+        return fn()
+    except Exception as e:
+        return type(e), str(e)
+
+
+@pytest.mark.parametrize('audience', [None, 'api', ['api', 'other']])
+@pytest.mark.parametrize('token', _tokens())
+def test_decode_matches_pyjwt(token, audience):
+    jws.check_structure(token, 'HS256')
+    expected = _outcome(lambda: jwt.decode(token, SECRET, algorithms=['HS256'],
+                                           audience=audience))
+    actual = _outcome(lambda: jws.decode(token, KEY, 'HS256', audience))
+    assert actual == expected
+
+
+def test_decode_without_signature_check():
+    token = jwt.encode({'sub': 'foo'}, 'other', 'HS256').decode('utf-8')
+    with pytest.raises(jwt.InvalidSignatureError):
+        jws.decode(token, KEY, 'HS256', None)
+    assert jws.decode(token, KEY, 'HS256', None,
+                           verify_signature=False) == {'sub': 'foo'}
+
+
+def test_decode_asymmetric_matches_pyjwt():
+    rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    now = int(time.time())
+    valid = jwt.encode({'sub': 'foo', 'exp': now + 60}, private_key, 'RS256').decode('utf-8')
+    expired = jwt.encode({'sub': 'foo', 'exp': now - 60}, private_key, 'RS256').decode('utf-8')
+    header, payload, signature = valid.split('.')
+    tampered = '.'.join([header, expired.split('.')[1], signature])
+
+    public_key = private_key.public_key()
+    for token in (valid, expired, tampered):
+        expected = _outcome(lambda: jwt.decode(token, public_key, algorithms=['RS256']))
+        actual = _outcome(lambda: jws.decode(token, public_key, 'RS256', None))
+        assert actual == expected
+
+
+def test_inflate():
+    data = b'{"roles":["' + b'a' * 1000 + b'"]}'
+    compressed = jws.deflate(data)
+    assert len(compressed) < len(data)
+    assert jws.inflate(compressed, len(data)) == data
+
+    with pytest.raises(jwt.DecodeError) as e:
+        jws.inflate(compressed, len(data) - 1)
+    assert str(e.value) == 'Compressed payload is too large'
+
+    bomb = jws.deflate(b'\x00' * 10 ** 7)
+    with pytest.raises(jwt.DecodeError):
+        jws.inflate(bomb, 64 * 1024)
+
+    for invalid in (b'not deflate', compressed[:-1], compressed + b'extra'):
+        with pytest.raises(jwt.DecodeError) as e:
+            jws.inflate(invalid, len(data))
+        assert str(e.value) == 'Invalid compressed payload'
+
+
+def test_compressed_payload():
+    claims = {'sub': 'foo', 'roles': ['role_{}'.format(i) for i in range(200)]}
+    assert jws.encode(claims, KEY, 'HS256', compress_threshold=None) == \
+        jws.encode(claims, KEY, 'HS256')
+
+    token = jws.encode(claims, KEY, 'HS256', kid='one', compress_threshold=100)
+    assert len(token) < len(jws.encode(claims, KEY, 'HS256', kid='one')) / 2
+    header = jws.check_structure(token, 'HS256')
+    assert header == {'typ': 'JWT', 'alg': 'HS256', 'kid': 'one', 'zip': 'DEF'}
+    assert jws.decode(token, KEY, 'HS256', None, header=header,
+                      max_decompressed_size=4096) == claims
+    assert jws.decode(token, KEY, 'HS256', None, max_decompressed_size=4096) == claims
+
+    # The signature still covers the compressed payload, like any JWS
+    payload = jwt.PyJWS().decode(token, SECRET, algorithms=['HS256'])
+    assert json.loads(jws.inflate(payload, 4096).decode('utf-8')) == claims
+
+    with pytest.raises(jwt.DecodeError) as e:
+        jws.decode(token, KEY, 'HS256', None, max_decompressed_size=1024)
+    assert str(e.value) == 'Compressed payload is too large'
+    with pytest.raises(jwt.DecodeError) as e:
+        jws.decode(token, KEY, 'HS256', None)
+    assert str(e.value) == 'Unsupported compression: DEF'
+
+
+def test_compress_threshold():
+    small = {'sub': 'foo'}
+    assert jws.encode(small, KEY, 'HS256', compress_threshold=100) == \
+        jws.encode(small, KEY, 'HS256')
+
+    # Payloads which do not get any smaller are left alone
+    assert jws.encode(small, KEY, 'HS256', compress_threshold=0) == \
+        jws.encode(small, KEY, 'HS256')
+
+
+def test_hmac_template_is_reused():
+    template = jws.hmac_template('HS256', SECRET)
+    assert jws.hmac_template('HS256', SECRET) is template
+    assert jws.hmac_template('HS256', KEY) is template
+    assert jws.hmac_template('HS384', SECRET) is not template
+
+
+def test_decode_with_pyjwt(monkeypatch):
+    # As for an algorithm pyjwt knows about but this module does not
+    monkeypatch.setattr(jws, '_algorithms', {})
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = SECRET
+    JWTManager(app)
+    with app.test_request_context():
+        settings = get_settings()
+        assert settings.decoder is jws.decode_with_pyjwt
+        token = create_jwt('foo')
+        assert decode_jwt(token)[settings.identity_claim] == 'foo'
+
+    other = jwt.encode({'sub': 'foo'}, 'other', 'HS256').decode('utf-8')
+    with pytest.raises(jwt.InvalidSignatureError):
+        jws.decode_with_pyjwt(other, KEY, 'HS256', None)
+    assert jws.decode_with_pyjwt(other, KEY, 'HS256', None,
+                                 verify_signature=False) == {'sub': 'foo'}
+
+    # Compressed payloads cannot be parsed by pyjwt
+    claims = {'sub': 'foo', 'roles': ['role_{}'.format(i) for i in range(200)]}
+    compressed = jws.encode(claims, KEY, 'HS256', compress_threshold=100)
+    with pytest.raises(jwt.DecodeError):
+        jws.decode_with_pyjwt(compressed, KEY, 'HS256', None,
+                              max_decompressed_size=4096)
@@ -1,8 +1,10 @@
+import datetime
 import json
 
+import jwt
 import pytest
 from flask import Flask, jsonify
-from flask_jwt_simple import JWTManager
+from flask_jwt_simple import JWTManager, create_jwt, decode_jwt, jwt_required
 
 
 @pytest.fixture(scope='function')
@@ -119,6 +121,8 @@ def test_default_get_jwt_data_callback(app):
         assert 'exp' in result
         assert 'iat' in result
         assert 'nbf' in result
+        assert 'jti' in result
+        assert result['jti'] != jwt_manager._get_jwt_data(identity='foo')['jti']
         assert result['sub'] == 'foo'
 
 
@@ -132,3 +136,123 @@ def test_custom_get_jwt_data_callback(app):
     with app.test_request_context():
         result = jwt_manager._get_jwt_data(identity='foo')
         assert result == {"foo": "bar"}
+
+
+@pytest.mark.parametrize("algorithm", ['HS256', 'HS384', 'HS512'])
+def test_create_jwt_matches_pyjwt(app, algorithm):
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    app.config['JWT_ALGORITHM'] = algorithm
+    jwt_manager = JWTManager(app)
+    now = datetime.datetime.utcnow()
+    claims = {'exp': now, 'iat': now, 'nbf': now, 'sub': 'foo', 'a': [1, 2]}
+
+    @jwt_manager.jwt_data_loader
+    def custom(identity):
+        return dict(claims)
+
+    with app.test_request_context():
+        token = create_jwt('foo')
+    expected = jwt.encode(dict(claims), 'foobarbaz', algorithm)
+    if not isinstance(expected, str):
+        expected = expected.decode('utf-8')
+    assert token == expected
+
+
+@pytest.mark.parametrize("algorithm", ['HS256', 'HS384', 'HS512'])
+def test_create_jwt_with_kid_matches_pyjwt(app, algorithm):
+    app.config['JWT_ALGORITHM'] = algorithm
+    app.config['JWT_KEYS'] = {'one': 'foobarbaz'}
+    app.config['JWT_ACTIVE_KID'] = 'one'
+    jwt_manager = JWTManager(app)
+
+    @jwt_manager.jwt_data_loader
+    def custom(identity):
+        return {'sub': identity}
+
+    # The pre-keyed HMAC must not carry anything over from one token to the next
+    with app.test_request_context():
+        tokens = [create_jwt(identity) for identity in ('foo', 'bar', 'foo')]
+    for identity, token in zip(('foo', 'bar', 'foo'), tokens):
+        expected = jwt.encode({'sub': identity}, 'foobarbaz', algorithm,
+                              headers={'kid': 'one'})
+        if not isinstance(expected, str):
+            expected = expected.decode('utf-8')
+        assert token == expected
+
+
+def test_custom_json(app):
+    calls = []
+
+    def dumps(obj):
+        calls.append('dumps')
+        return json.dumps(obj, sort_keys=True).encode('utf-8')
+
+    def loads(data):
+        calls.append('loads')
+        return json.loads(data)
+
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    app.config['JWT_JSON_DUMPS'] = dumps
+    app.config['JWT_JSON_LOADS'] = loads
+    jwt_manager = JWTManager(app)
+
+    @jwt_manager.jwt_data_loader
+    def custom(identity):
+        return {'sub': identity, 'a': 1}
+
+    with app.test_request_context():
+        token = create_jwt('foo')
+        assert decode_jwt(token) == {'sub': 'foo', 'a': 1}
+    assert calls == ['dumps', 'loads']
+    payload = token.split('.')[1]
+    assert jwt.utils.base64url_decode(payload) == b'{"a": 1, "sub": "foo"}'
+    assert jwt.decode(token, 'foobarbaz', algorithms=['HS256'])['sub'] == 'foo'
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    response = app.test_client().get('/protected')
+    assert response.status_code == 401
+    assert response.mimetype == 'application/json'
+    assert response.get_data() == b'{"msg": "Missing Authorization Header"}'
+    assert calls[-1] == 'dumps'
+
+
+def test_compressed_claims(app):
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    app.config['JWT_COMPRESS_THRESHOLD'] = 256
+    app.config['JWT_MAX_DECOMPRESSED_SIZE'] = 2048
+    jwt_manager = JWTManager(app)
+    roles = ['role_{}'.format(i) for i in range(100)]
+
+    @jwt_manager.jwt_data_loader
+    def custom(identity):
+        if identity == 'admin':
+            return {'sub': identity, 'roles': roles}
+        return {'sub': identity}
+
+    with app.test_request_context():
+        small = create_jwt('foo')
+        large = create_jwt('admin')
+        assert 'zip' not in jwt.get_unverified_header(small)
+        assert jwt.get_unverified_header(large)['zip'] == 'DEF'
+        assert decode_jwt(small) == {'sub': 'foo'}
+        assert decode_jwt(large) == {'sub': 'admin', 'roles': roles}
+
+    app.config['JWT_MAX_DECOMPRESSED_SIZE'] = 512
+    jwt_manager.refresh_config(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    response = app.test_client().get('/protected', headers={
+        'Authorization': 'Bearer {}'.format(large)
+    })
+    assert response.status_code == 422
+    assert json.loads(response.get_data(as_text=True)) == {
+        'msg': 'Compressed payload is too large'
+    }
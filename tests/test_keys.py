@@ -0,0 +1,188 @@
+import jwt
+import pytest
+from flask import Flask, jsonify, json
+
+from flask_jwt_simple import JWTManager, jwt_required, create_jwt, create_jwts
+
+
+@pytest.fixture(scope='function')
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'legacy'
+    app.config['JWT_KEYS'] = {'one': 'secret-one', 'two': 'secret-two'}
+    app.config['JWT_ACTIVE_KID'] = 'one'
+    app.config['JWT_DECODE_CACHE_SIZE'] = 10
+    JWTManager(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    return app
+
+
+def _request(app, token):
+    test_client = app.test_client()
+    headers = {'Authorization': 'Bearer {}'.format(token)}
+    response = test_client.get('/protected', headers=headers)
+    return response.status_code, json.loads(response.get_data(as_text=True))
+
+
+def _rsa_pair():
+    rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+    serialization = pytest.importorskip('cryptography.hazmat.primitives.serialization')
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('utf-8')
+    public_pem = private_key.public_key().public_bytes(
+        serialization.Encoding.PEM,
+        serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode('utf-8')
+    return private_pem, public_pem
+
+
+def test_active_kid_in_header(app):
+    with app.test_request_context():
+        token = create_jwt('foo')
+        batch_token = list(create_jwts(['foo']))[0]
+    assert jwt.get_unverified_header(token) == {
+        'typ': 'JWT', 'alg': 'HS256', 'kid': 'one'
+    }
+    assert jwt.get_unverified_header(batch_token)['kid'] == 'one'
+    assert jwt.decode(token, 'secret-one', algorithms=['HS256'])['sub'] == 'foo'
+
+    jwt_data = jwt.decode(token, 'secret-one', algorithms=['HS256'])
+    expected = jwt.encode(jwt_data, 'secret-one', algorithm='HS256',
+                          headers={'kid': 'one'}).decode('utf-8')
+    assert token == expected
+
+
+def test_verify_by_kid(app):
+    legacy = jwt.encode({'sub': 'foo'}, 'legacy', algorithm='HS256').decode('utf-8')
+    two = jwt.encode({'sub': 'foo'}, 'secret-two', algorithm='HS256',
+                     headers={'kid': 'two'}).decode('utf-8')
+    unknown = jwt.encode({'sub': 'foo'}, 'secret-two', algorithm='HS256',
+                         headers={'kid': 'three'}).decode('utf-8')
+    wrong_key = jwt.encode({'sub': 'foo'}, 'secret-one', algorithm='HS256',
+                           headers={'kid': 'two'}).decode('utf-8')
+
+    assert _request(app, legacy)[0] == 200
+    assert _request(app, two)[0] == 200
+    assert _request(app, unknown) == (422, {'msg': 'Unknown key id'})
+    assert _request(app, wrong_key) == (422, {'msg': 'Signature verification failed'})
+
+
+def test_rotate_keys(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    key_ring = jwt_manager.key_ring(app)
+    assert key_ring.kids == ['one', 'two']
+    assert key_ring.active_kid == 'one'
+
+    with app.test_request_context():
+        old_token = create_jwt('foo')
+    assert _request(app, old_token)[0] == 200
+
+    key_ring.add('three', 'secret-three')
+    key_ring.activate('three')
+    with app.test_request_context():
+        new_token = create_jwt('foo')
+    assert jwt.get_unverified_header(new_token)['kid'] == 'three'
+    assert _request(app, new_token)[0] == 200
+    assert _request(app, old_token)[0] == 200
+
+    # Tokens signed with a removed key are rejected, even if they were cached
+    key_ring.remove('one')
+    assert 'one' not in key_ring
+    assert _request(app, old_token) == (422, {'msg': 'Unknown key id'})
+    assert _request(app, new_token)[0] == 200
+
+    with pytest.raises(ValueError):
+        key_ring.remove('three')
+    with pytest.raises(ValueError):
+        key_ring.activate('four')
+
+    # Going back to the keys from the app config
+    key_ring.activate(None)
+    with app.test_request_context():
+        token = create_jwt('foo')
+    assert 'kid' not in jwt.get_unverified_header(token)
+    assert _request(app, token)[0] == 200
+
+    jwt_manager.refresh_config(app)
+    assert jwt_manager.key_ring(app).kids == ['one', 'two']
+
+
+def test_asymmetric_key_ring():
+    app = Flask(__name__)
+    private_one, public_one = _rsa_pair()
+    private_two, public_two = _rsa_pair()
+    app.config['JWT_ALGORITHM'] = 'RS256'
+    app.config['JWT_KEYS'] = {
+        'one': (private_one, public_one),
+        'two': (None, public_two),
+    }
+    app.config['JWT_ACTIVE_KID'] = 'one'
+    jwt_manager = JWTManager(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    with app.test_request_context():
+        token = create_jwt('foo')
+    assert jwt.get_unverified_header(token)['kid'] == 'one'
+    assert _request(app, token)[0] == 200
+
+    two = jwt.encode({'sub': 'foo'}, private_two, algorithm='RS256',
+                     headers={'kid': 'two'}).decode('utf-8')
+    assert _request(app, two)[0] == 200
+
+    # Keys without a private key can only be used to verify tokens
+    key_ring = jwt_manager.key_ring(app)
+    with pytest.raises(ValueError):
+        key_ring.activate('two')
+
+
+def test_any_kid_without_key_ring():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'legacy'
+    jwt_manager = JWTManager(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    token = jwt.encode({'sub': 'foo'}, 'legacy', algorithm='HS256',
+                       headers={'kid': 'idp-key-1'}).decode('utf-8')
+    wrong_key = jwt.encode({'sub': 'foo'}, 'other', algorithm='HS256',
+                           headers={'kid': 'idp-key-1'}).decode('utf-8')
+    assert _request(app, token)[0] == 200
+    assert _request(app, wrong_key) == (422, {'msg': 'Signature verification failed'})
+
+    # Once there is a key ring, kids must match one of its keys
+    jwt_manager.key_ring(app).add('one', 'secret-one')
+    assert _request(app, token) == (422, {'msg': 'Unknown key id'})
+
+
+def test_no_kid_without_default_key():
+    app = Flask(__name__)
+    app.config['JWT_KEYS'] = {'one': 'secret-one'}
+    app.config['JWT_ACTIVE_KID'] = 'one'
+    JWTManager(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    with app.test_request_context():
+        token = create_jwt('foo')
+    no_kid = jwt.encode({'sub': 'foo'}, 'secret-one', algorithm='HS256').decode('utf-8')
+    assert _request(app, token)[0] == 200
+    assert _request(app, no_kid) == (422, {'msg': 'Unknown key id'})
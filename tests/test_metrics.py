@@ -0,0 +1,117 @@
+import pytest
+from flask import Flask, jsonify
+
+from flask_jwt_simple import JWTManager, jwt_required, create_jwt, decode_jwt
+from flask_jwt_simple.instrumentation import PhaseTiming
+from flask_jwt_simple.metrics import MetricsRegistry
+
+
+@pytest.fixture(scope='function')
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    app.config['JWT_METRICS_URL'] = '/metrics'
+    app.config['JWT_DECODE_CACHE_SIZE'] = 10
+    JWTManager(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    return app
+
+
+def _request(test_client, token=None):
+    headers = {}
+    if token is not None:
+        headers['Authorization'] = 'Bearer {}'.format(token)
+    return test_client.get('/protected', headers=headers)
+
+
+def test_metrics_disabled_by_default():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    jwt_manager = JWTManager(app)
+    with app.test_request_context():
+        create_jwt('foo')
+    assert jwt_manager.metrics.counter('jwt_tokens_issued_total') == 0
+    assert app.test_client().get('/metrics').status_code == 404
+
+
+def test_metrics_counters(app):
+    metrics = app.extensions['flask-jwt-simple'].metrics
+    with app.test_request_context():
+        token = create_jwt('foo')
+
+    test_client = app.test_client()
+    assert _request(test_client, token).status_code == 200
+    assert _request(test_client, token).status_code == 200
+    assert _request(test_client).status_code == 401
+    assert _request(test_client, token + 'x').status_code == 422
+    assert _request(test_client, 'foo').status_code == 422
+
+    assert metrics.counter('jwt_tokens_issued_total') == 1
+    assert metrics.counter('jwt_tokens_verified_total') == 2
+    assert metrics.counter('jwt_tokens_rejected_total', reason='missing') == 1
+    assert metrics.counter('jwt_tokens_rejected_total', reason='invalid') == 2
+
+    metrics.reset()
+    assert metrics.counter('jwt_tokens_issued_total') == 0
+
+
+def test_metrics_revoked_tokens(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    revoked_tokens = set()
+    jwt_manager.revocation_check_loader(lambda jwt_data: jwt_data['jti'] in revoked_tokens)
+    with app.test_request_context():
+        token = create_jwt('foo')
+        revoked = create_jwt('bar')
+        revoked_tokens.add(decode_jwt(revoked)['jti'])
+    metrics = jwt_manager.metrics
+    metrics.reset()
+
+    test_client = app.test_client()
+    assert _request(test_client, token).status_code == 200
+    assert _request(test_client, revoked).status_code == 401
+    assert metrics.counter('jwt_tokens_rejected_total', reason='revoked') == 1
+    assert metrics.counter('jwt_tokens_verified_total') == 2
+
+
+def test_metrics_endpoint(app):
+    with app.test_request_context():
+        token = create_jwt('foo')
+
+    test_client = app.test_client()
+    _request(test_client, token)
+    _request(test_client, token)
+
+    response = test_client.get('/metrics')
+    assert response.status_code == 200
+    assert response.content_type.startswith('text/plain; version=0.0.4')
+    lines = response.get_data(as_text=True).splitlines()
+    assert '# TYPE jwt_tokens_verified_total counter' in lines
+    assert 'jwt_tokens_verified_total 2' in lines
+    assert 'jwt_tokens_issued_total 1' in lines
+    assert 'jwt_decode_cache_hits_total 1' in lines
+    assert 'jwt_decode_cache_misses_total 1' in lines
+    assert '# TYPE jwt_phase_duration_seconds histogram' in lines
+    labels = 'operation="decode",phase="verify",algorithm="HS256"'
+    assert 'jwt_phase_duration_seconds_count{{{}}} 2'.format(labels) in lines
+    assert 'jwt_phase_duration_seconds_bucket{{{},le="+Inf"}} 2'.format(labels) in lines
+
+
+def test_metrics_histogram_buckets(app):
+    registry = MetricsRegistry(buckets=(0.1, 1))
+    registry(PhaseTiming('encode', 'sign', 'HS256', 'success', 0.05))
+    registry(PhaseTiming('encode', 'sign', 'HS256', 'success', 0.5))
+    registry(PhaseTiming('encode', 'sign', 'HS256', 'success', 5))
+
+    with app.app_context():
+        lines = registry.render().splitlines()
+    labels = 'operation="encode",phase="sign",algorithm="HS256"'
+    assert 'jwt_phase_duration_seconds_bucket{{{},le="0.1"}} 1'.format(labels) in lines
+    assert 'jwt_phase_duration_seconds_bucket{{{},le="1"}} 2'.format(labels) in lines
+    assert 'jwt_phase_duration_seconds_bucket{{{},le="+Inf"}} 3'.format(labels) in lines
+    assert 'jwt_phase_duration_seconds_sum{{{}}} 5.55'.format(labels) in lines
+    assert 'jwt_tokens_issued_total 3' in lines
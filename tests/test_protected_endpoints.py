@@ -1,8 +1,12 @@
 import pytest
 import datetime
+import jwt as pyjwt
 from flask import Flask, jsonify, json
 
-from flask_jwt_simple.utils import get_jwt_identity, create_jwt
+from flask_jwt_simple.utils import get_jwt_identity, create_jwt, decode_jwt
+from flask_jwt_simple.config import get_settings
+from flask_jwt_simple import create_jwts, decode_jwts
+from flask_jwt_simple import create_jwt_async, decode_jwt_async
 from flask_jwt_simple import JWTManager, jwt_required, jwt_optional
 
 
@@ -92,6 +96,29 @@ def app(request):
         else:
             return jsonify(foo='baz')
 
+    @app.route('/optional/unused')
+    @jwt_optional
+    def optional_unused():
+        return jsonify(foo='baz')
+
+    @app.route('/async/jwt', methods=['POST'])
+    async def create_token_async_endpoint():
+        access_token = await create_jwt_async('username')
+        return jsonify(jwt=access_token)
+
+    @app.route('/async/protected')
+    @jwt_required
+    async def async_protected():
+        return jsonify(foo='bar')
+
+    @app.route('/async/optional')
+    @jwt_optional
+    async def async_optional():
+        if get_jwt_identity():
+            return jsonify(foo='bar')
+        else:
+            return jsonify(foo='baz')
+
     return app
 
 
@@ -157,6 +184,7 @@ def test_optional_with_jwt(app):
 def test_with_custom_headers(app, header_name, header_type):
     app.config['JWT_HEADER_NAME'] = header_name
     app.config['JWT_HEADER_TYPE'] = header_type
+    app.extensions['flask-jwt-simple'].refresh_config(app)
 
     test_client = app.test_client()
     jwt = _get_jwt(test_client)
@@ -174,6 +202,7 @@ def test_with_custom_headers(app, header_name, header_type):
 @pytest.mark.parametrize("header_type", ['Foo', ''])
 def test_with_bad_header(app, endpoint, header_type):
     app.config['JWT_HEADER_TYPE'] = header_type
+    app.extensions['flask-jwt-simple'].refresh_config(app)
 
     test_client = app.test_client()
     jwt = _get_jwt(test_client)
@@ -205,6 +234,7 @@ def test_with_bad_token(app, endpoint):
     # change teh secret key here to make the token we just got invalid
     app.config['JWT_SECRET_KEY'] = 'something_different'
     app.config['JWT_PUBLIC_KEY'] = BAD_RSA_PUBLIC
+    app.extensions['flask-jwt-simple'].refresh_config(app)
 
     response = _make_jwt_request(test_client, jwt, endpoint)
     json_data = json.loads(response.get_data(as_text=True))
@@ -219,6 +249,7 @@ def test_with_bad_token(app, endpoint):
 ])
 def test_expired_token(app, endpoint):
     app.config['JWT_EXPIRES'] = datetime.timedelta(hours=-1)
+    app.extensions['flask-jwt-simple'].refresh_config(app)
 
     test_client = app.test_client()
     jwt = _get_jwt(test_client)
@@ -236,6 +267,7 @@ def test_expired_token(app, endpoint):
 def test_valid_aud(app, endpoint):
     app.config['JWT_DECODE_AUDIENCE'] = 'foo'
     jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
 
     @jwt_manager.jwt_data_loader
     def change_claims(identity):
@@ -265,6 +297,7 @@ def test_valid_aud(app, endpoint):
 def test_invalid_aud(app, endpoint):
     app.config['JWT_DECODE_AUDIENCE'] = 'bar'
     jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
 
     @jwt_manager.jwt_data_loader
     def change_claims(identity):
@@ -293,6 +326,7 @@ def test_invalid_aud(app, endpoint):
 ])
 def test_missing_aud(app, endpoint):
     app.config['JWT_DECODE_AUDIENCE'] = 'bar'
+    app.extensions['flask-jwt-simple'].refresh_config(app)
 
     test_client = app.test_client()
     jwt = _get_jwt(test_client)
@@ -301,3 +335,485 @@ def test_missing_aud(app, endpoint):
 
     assert response.status_code == 422
     assert json_data == {'msg': 'Token is missing the "aud" claim'}
+
+
+def test_decode_cache_disabled_by_default(app):
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    _make_jwt_request(test_client, jwt, '/protected')
+    _make_jwt_request(test_client, jwt, '/protected')
+
+    jwt_manager = app.extensions['flask-jwt-simple']
+    assert jwt_manager.decode_cache_info(app).currsize == 0
+    assert jwt_manager.decode_cache_info(app).hits == 0
+
+
+def test_decode_cache(app):
+    app.config['JWT_DECODE_CACHE_SIZE'] = 1
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    for _ in range(3):
+        response = _make_jwt_request(test_client, jwt, '/protected')
+        assert response.status_code == 200
+    info = jwt_manager.decode_cache_info(app)
+    assert (info.hits, info.misses, info.currsize) == (2, 1, 1)
+
+    # A second token pushes the first one out of the cache
+    with app.test_request_context():
+        other_jwt = create_jwt('other_user')
+    response = _make_jwt_request(test_client, other_jwt, '/protected')
+    assert response.status_code == 200
+    assert jwt_manager.decode_cache_info(app).evictions == 1
+
+
+def test_decode_cache_entries_cannot_be_changed(app):
+    app.config['JWT_DECODE_CACHE_SIZE'] = 10
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+
+    with app.test_request_context():
+        jwt = create_jwt({'name': 'foo', 'roles': ['user']})
+        identity_claim = app.config['JWT_IDENTITY_CLAIM']
+        for _ in range(3):
+            identity = decode_jwt(jwt)[identity_claim]
+            assert identity['roles'] == ['user']
+            identity['roles'].append('admin')
+
+
+def test_decode_cache_respects_key_changes(app):
+    app.config['JWT_DECODE_CACHE_SIZE'] = 10
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    response = _make_jwt_request(test_client, jwt, '/protected')
+    assert response.status_code == 200
+
+    app.config['JWT_SECRET_KEY'] = 'something_different'
+    app.config['JWT_PUBLIC_KEY'] = BAD_RSA_PUBLIC
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+    response = _make_jwt_request(test_client, jwt, '/protected')
+    json_data = json.loads(response.get_data(as_text=True))
+    assert response.status_code == 422
+    assert json_data == {'msg': 'Signature verification failed'}
+
+
+def test_decode_cache_never_outlives_token(app):
+    app.config['JWT_DECODE_CACHE_SIZE'] = 10
+    app.config['JWT_EXPIRES'] = datetime.timedelta(seconds=-1)
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    response = _make_jwt_request(test_client, jwt, '/protected')
+    assert response.status_code == 401
+    assert jwt_manager.decode_cache_info(app).currsize == 0
+
+
+@pytest.mark.parametrize("workers", [None, 1, 4])
+def test_create_jwts(app, workers):
+    identities = ['user{}'.format(i) for i in range(20)]
+    with app.test_request_context():
+        jwts = create_jwts(iter(identities), workers=workers)
+        assert not isinstance(jwts, list)
+        jwts = list(jwts)
+        identity_claim = app.config['JWT_IDENTITY_CLAIM']
+        decoded = [decode_jwt(jwt)[identity_claim] for jwt in jwts]
+    assert decoded == identities
+
+    test_client = app.test_client()
+    response = _make_jwt_request(test_client, jwts[-1], '/protected')
+    assert response.status_code == 200
+
+
+def test_create_jwts_shares_timestamps(app):
+    with app.test_request_context():
+        jwts = list(create_jwts(range(10)))
+        claims = [decode_jwt(jwt) for jwt in jwts]
+    assert len({(c['iat'], c['nbf'], c['exp']) for c in claims}) == 1
+
+
+def test_create_jwts_custom_data(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+
+    @jwt_manager.jwt_data_loader
+    def custom(identity):
+        return {'foo': identity}
+
+    with app.test_request_context():
+        jwts = create_jwts(['a', 'b', 'c'], workers=2)
+        assert [decode_jwt(jwt) for jwt in jwts] == [
+            {'foo': 'a'}, {'foo': 'b'}, {'foo': 'c'}
+        ]
+
+
+@pytest.mark.parametrize("workers", [None, 1, 4])
+def test_decode_jwts(app, workers):
+    identity_claim = app.config['JWT_IDENTITY_CLAIM']
+    with app.test_request_context():
+        jwts = list(create_jwts(['a', 'b', 'c']))
+
+    app.config['JWT_EXPIRES'] = datetime.timedelta(hours=-1)
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+    with app.test_request_context():
+        expired = create_jwt('d')
+        tokens = [jwts[0], 'not.a.jwt', jwts[1], expired, jwts[2]]
+        results = list(decode_jwts(iter(tokens), workers=workers))
+
+    assert len(results) == 5
+    assert [r.jwt_data[identity_claim] for r in results[0::2]] == ['a', 'b', 'c']
+    assert all(r.error is None for r in results[0::2])
+    assert results[1].jwt_data is None
+    assert isinstance(results[1].error, pyjwt.DecodeError)
+    assert results[3].jwt_data is None
+    assert isinstance(results[3].error, pyjwt.ExpiredSignatureError)
+
+
+def test_async_endpoints(app):
+    pytest.importorskip('asgiref')
+    test_client = app.test_client()
+
+    response = test_client.post('/async/jwt')
+    jwt = json.loads(response.get_data(as_text=True))['jwt']
+    assert response.status_code == 200
+
+    response = _make_jwt_request(test_client, jwt, '/async/protected')
+    assert response.status_code == 200
+    assert json.loads(response.get_data(as_text=True)) == {'foo': 'bar'}
+
+    response = _make_jwt_request(test_client, jwt, '/async/optional')
+    assert json.loads(response.get_data(as_text=True)) == {'foo': 'bar'}
+
+    response = test_client.get('/async/optional')
+    assert json.loads(response.get_data(as_text=True)) == {'foo': 'baz'}
+
+    response = test_client.get('/async/protected')
+    assert response.status_code == 401
+    assert json.loads(response.get_data(as_text=True)) == {
+        'msg': 'Missing Authorization Header'
+    }
+
+
+def test_async_expired_token(app):
+    pytest.importorskip('asgiref')
+    app.config['JWT_EXPIRES'] = datetime.timedelta(hours=-1)
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    for endpoint in ('/async/protected', '/async/optional'):
+        response = _make_jwt_request(test_client, jwt, endpoint)
+        assert response.status_code == 401
+        assert json.loads(response.get_data(as_text=True)) == {
+            'msg': 'Token has expired'
+        }
+
+
+def test_async_utils(app):
+    import asyncio
+    identity_claim = app.config['JWT_IDENTITY_CLAIM']
+
+    async def create_and_decode():
+        jwt = await create_jwt_async('foo')
+        return await decode_jwt_async(jwt)
+
+    with app.test_request_context():
+        jwt_data = asyncio.run(create_and_decode())
+    assert jwt_data[identity_claim] == 'foo'
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_optional_lazy_decode(app, lazy):
+    app.config['JWT_OPTIONAL_LAZY_DECODE'] = lazy
+    app.config['JWT_DECODE_CACHE_SIZE'] = 10
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    response = _make_jwt_request(test_client, jwt, '/optional/unused')
+    assert response.status_code == 200
+    assert jwt_manager.decode_cache_info(app).misses == (0 if lazy else 1)
+
+    response = _make_jwt_request(test_client, jwt, '/optional')
+    assert json.loads(response.get_data(as_text=True)) == {'foo': 'bar'}
+    assert jwt_manager.decode_cache_info(app).misses == 1
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_optional_lazy_decode_expired(app, lazy):
+    app.config['JWT_OPTIONAL_LAZY_DECODE'] = lazy
+    app.config['JWT_EXPIRES'] = datetime.timedelta(hours=-1)
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    response = _make_jwt_request(test_client, jwt, '/optional/unused')
+    assert response.status_code == (200 if lazy else 401)
+
+    for endpoint in ('/optional', '/async/optional'):
+        if endpoint.startswith('/async'):
+            pytest.importorskip('asgiref')
+        response = _make_jwt_request(test_client, jwt, endpoint)
+        assert response.status_code == 401
+        assert json.loads(response.get_data(as_text=True)) == {
+            'msg': 'Token has expired'
+        }
+
+
+@pytest.mark.parametrize("token,msg", [
+    ('foo', 'Not enough segments'),
+    ('a.b.c.d', 'Too many segments'),
+    ('a.b!.c', 'Invalid characters in token'),
+    ('a.b.c', 'Invalid header padding'),
+    ('Zm9v.b.c', 'Invalid header string: Expecting value: line 1 column 1 (char 0)'),
+    ('WzFd.b.c', 'Invalid header string: must be a json object'),
+    ('eyJ0eXAiOiJKV1QiLCJhbGciOiJub25lIn0.e30.c',
+     'The specified alg value is not allowed'),
+])
+def test_malformed_token(app, token, msg):
+    test_client = app.test_client()
+    response = _make_jwt_request(test_client, token, '/protected')
+    json_data = json.loads(response.get_data(as_text=True))
+
+    assert response.status_code == 422
+    assert json_data == {'msg': msg}
+
+
+def test_wrong_algorithm(app):
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+
+    app.config['JWT_ALGORITHM'] = 'HS512'
+    app.config['JWT_SECRET_KEY'] = 'testing_secret_key'
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+    response = _make_jwt_request(test_client, jwt, '/protected')
+    json_data = json.loads(response.get_data(as_text=True))
+
+    assert response.status_code == 422
+    assert json_data == {'msg': 'The specified alg value is not allowed'}
+
+
+def test_max_token_length(app):
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+
+    app.config['JWT_MAX_TOKEN_LENGTH'] = len(jwt)
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+    response = _make_jwt_request(test_client, jwt, '/protected')
+    assert response.status_code == 200
+
+    response = _make_jwt_request(test_client, jwt + 'a', '/protected')
+    json_data = json.loads(response.get_data(as_text=True))
+    assert response.status_code == 422
+    assert json_data == {'msg': 'Authorization header is too long'}
+
+    with app.test_request_context():
+        with pytest.raises(pyjwt.DecodeError) as e:
+            decode_jwt((jwt + 'a').encode('utf-8'))
+        assert str(e.value) == 'Token is too long'
+        with pytest.raises(pyjwt.DecodeError):
+            decode_jwt(b'\xff.a.b')
+
+
+def test_max_token_length_without_header_type(app):
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+
+    app.config['JWT_HEADER_TYPE'] = None
+    app.config['JWT_MAX_TOKEN_LENGTH'] = len(jwt)
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+    response = test_client.get('/protected', headers={'Authorization': jwt})
+    assert response.status_code == 200
+
+    response = test_client.get('/protected', headers={'Authorization': jwt + 'aa'})
+    assert response.status_code == 422
+    assert json.loads(response.get_data(as_text=True)) == {
+        'msg': 'Authorization header is too long'
+    }
+
+
+def test_negative_cache(app):
+    app.config['JWT_NEGATIVE_CACHE_SIZE'] = 10
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    app.config['JWT_SECRET_KEY'] = 'something_different'
+    app.config['JWT_PUBLIC_KEY'] = BAD_RSA_PUBLIC
+    jwt_manager.refresh_config(app)
+
+    for _ in range(3):
+        response = _make_jwt_request(test_client, jwt, '/protected')
+        json_data = json.loads(response.get_data(as_text=True))
+        assert response.status_code == 422
+        assert json_data == {'msg': 'Signature verification failed'}
+
+    info = jwt_manager.negative_cache_info(app)
+    assert (info.hits, info.misses, info.currsize) == (2, 1, 1)
+
+
+def test_negative_cache_error_types(app):
+    app.config['JWT_NEGATIVE_CACHE_SIZE'] = 10
+    app.config['JWT_DECODE_AUDIENCE'] = 'foo'
+    app.config['JWT_EXPIRES'] = datetime.timedelta(hours=-1)
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
+
+    test_client = app.test_client()
+    expired_jwt = _get_jwt(test_client)
+
+    @jwt_manager.jwt_data_loader
+    def no_aud(identity):
+        return {'sub': identity}
+
+    missing_aud_jwt = _get_jwt(test_client)
+    for _ in range(2):
+        response = _make_jwt_request(test_client, expired_jwt, '/protected')
+        assert response.status_code == 401
+        assert json.loads(response.get_data(as_text=True)) == {
+            'msg': 'Token has expired'
+        }
+
+        response = _make_jwt_request(test_client, missing_aud_jwt, '/protected')
+        assert response.status_code == 422
+        assert json.loads(response.get_data(as_text=True)) == {
+            'msg': 'Token is missing the "aud" claim'
+        }
+    assert jwt_manager.negative_cache_info(app).hits == 2
+
+
+def test_negative_cache_skips_immature_tokens(app):
+    app.config['JWT_NEGATIVE_CACHE_SIZE'] = 10
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.refresh_config(app)
+
+    @jwt_manager.jwt_data_loader
+    def not_yet_valid(identity):
+        nbf = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        return {'sub': identity, 'nbf': nbf}
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    response = _make_jwt_request(test_client, jwt, '/protected')
+    assert response.status_code == 422
+    assert jwt_manager.negative_cache_info(app).currsize == 0
+
+
+def test_timing_listener(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    timings = []
+    jwt_manager.timing_listener(timings.append)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    algorithm = app.config['JWT_ALGORITHM']
+    assert [(t.operation, t.phase, t.outcome) for t in timings] == [
+        ('encode', 'claims', 'success'),
+        ('encode', 'sign', 'success'),
+    ]
+    assert all(t.algorithm == algorithm and t.duration >= 0 for t in timings)
+
+    del timings[:]
+    response = _make_jwt_request(test_client, jwt, '/protected')
+    assert response.status_code == 200
+    assert [(t.operation, t.phase, t.outcome) for t in timings] == [
+        ('decode', 'header', 'success'),
+        ('decode', 'verify', 'success'),
+    ]
+
+    del timings[:]
+    response = test_client.get('/protected')
+    assert response.status_code == 401
+    assert [(t.phase, t.outcome) for t in timings] == [
+        ('header', 'missing'),
+        ('error_handler', 'missing'),
+    ]
+
+    del timings[:]
+    response = _make_jwt_request(test_client, jwt + 'x', '/protected')
+    assert response.status_code == 422
+    assert [(t.phase, t.outcome) for t in timings] == [
+        ('header', 'success'),
+        ('verify', 'invalid'),
+        ('error_handler', 'invalid'),
+    ]
+
+
+def test_error_bodies_are_cached(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    test_client = app.test_client()
+    for _ in range(2):
+        response = test_client.get('/protected')
+        assert response.status_code == 401
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.get_data(as_text=True)) == {
+            'msg': 'Missing Authorization Header'
+        }
+
+    bodies = get_settings(app).error_bodies
+    assert list(bodies) == ['Missing Authorization Header']
+
+    # The bodies are serialized again once the options change
+    app.config['JWT_HEADER_NAME'] = 'Foo'
+    jwt_manager.refresh_config(app)
+    response = test_client.get('/protected')
+    assert json.loads(response.get_data(as_text=True)) == {
+        'msg': 'Missing Foo Header'
+    }
+    assert list(get_settings(app).error_bodies) == ['Missing Foo Header']
+
+
+@pytest.mark.parametrize('prefix', ['', '/async'])
+def test_direct_error_responses(app, prefix):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    handled = []
+
+    @app.errorhandler(pyjwt.InvalidTokenError)
+    def app_handler(e):
+        handled.append(e)
+        return jwt_manager._handle_error(e)
+
+    test_client = app.test_client()
+    jwt = _get_jwt(test_client)
+    requests = [
+        (None, prefix + '/protected'),
+        ('', prefix + '/protected'),
+        (jwt + 'x', prefix + '/protected'),
+        (jwt + 'x', prefix + '/optional'),
+    ]
+
+    def responses():
+        results = []
+        for token, url in requests:
+            if token is None:
+                response = test_client.get(url)
+            else:
+                response = _make_jwt_request(test_client, token, url)
+            results.append((response.status_code, response.get_data()))
+        return results
+
+    expected = responses()
+    assert [status for status, _ in expected] == [401, 422, 422, 422]
+    assert len(handled) == 2
+
+    app.config['JWT_DIRECT_ERROR_RESPONSES'] = True
+    jwt_manager.refresh_config(app)
+    del handled[:]
+    assert responses() == expected
+    assert handled == []
+
+    # Custom callbacks are still called
+    @jwt_manager.invalid_token_loader
+    def custom_invalid(msg):
+        return jsonify(custom=msg), 400
+
+    response = _make_jwt_request(test_client, jwt + 'x', prefix + '/protected')
+    assert response.status_code == 400
+    assert json.loads(response.get_data(as_text=True)) == {
+        'custom': 'Signature verification failed'
+    }
@@ -0,0 +1,107 @@
+import time
+
+import pytest
+from flask import Flask, jsonify, json
+
+from flask_jwt_simple import (
+    JWTManager, jwt_required, jwt_optional, create_jwt, decode_jwt,
+    get_jwt_identity
+)
+from flask_jwt_simple.revocation import RevocationStore
+
+
+@pytest.fixture(scope='function')
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    jwt_manager = JWTManager(app)
+    store = RevocationStore()
+    jwt_manager.revocation_check_loader(store.is_token_revoked)
+    app.revocation_store = store
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    @app.route('/optional')
+    @jwt_optional
+    def optional():
+        return jsonify(identity=get_jwt_identity())
+
+    return app
+
+
+def _request(app, url, token):
+    headers = {'Authorization': 'Bearer {}'.format(token)}
+    response = app.test_client().get(url, headers=headers)
+    return response.status_code, json.loads(response.get_data(as_text=True))
+
+
+def test_revocation_store():
+    store = RevocationStore()
+    now = time.time()
+    store.revoke('forever')
+    store.revoke('expired', now - 1)
+    for i in range(10):
+        store.revoke('jti-{}'.format(i), now + 3600)
+    assert len(store) == 11
+    assert store.is_revoked('forever')
+    assert not store.is_revoked('expired')
+    assert all(store.is_revoked('jti-{}'.format(i)) for i in range(10))
+    assert not store.is_revoked('other')
+    assert not store.is_token_revoked({'sub': 'no jti'})
+
+    store.unrevoke('forever')
+    assert not store.is_revoked('forever')
+
+    with pytest.raises(ValueError):
+        store.revoke_token({'sub': 'no jti'})
+
+
+def test_revocation_store_expires_entries():
+    store = RevocationStore()
+    store.revoke('soon', time.time() + 0.05)
+    store.revoke('later', time.time() + 3600)
+    assert store.is_revoked('soon')
+    time.sleep(0.1)
+    assert not store.is_revoked('soon')
+    assert store.is_revoked('later')
+    assert len(store) == 1
+
+
+def test_revoked_token(app):
+    with app.test_request_context():
+        token = create_jwt('foo')
+        other_token = create_jwt('foo')
+        jwt_data = decode_jwt(token)
+
+    assert _request(app, '/protected', token)[0] == 200
+    app.revocation_store.revoke_token(jwt_data)
+
+    assert _request(app, '/protected', token) == (401, {'msg': 'Token has been revoked'})
+    assert _request(app, '/optional', token) == (401, {'msg': 'Token has been revoked'})
+    assert _request(app, '/protected', other_token)[0] == 200
+    assert _request(app, '/optional', other_token) == (200, {'identity': 'foo'})
+
+
+def test_revoked_token_lazy_optional(app):
+    app.config['JWT_OPTIONAL_LAZY_DECODE'] = True
+    app.extensions['flask-jwt-simple'].refresh_config(app)
+    with app.test_request_context():
+        token = create_jwt('foo')
+        app.revocation_store.revoke_token(decode_jwt(token))
+    assert _request(app, '/optional', token) == (401, {'msg': 'Token has been revoked'})
+
+
+def test_custom_revoked_token_callback(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+
+    @jwt_manager.revoked_token_loader
+    def revoked():
+        return jsonify(err='nope'), 403
+
+    with app.test_request_context():
+        token = create_jwt('foo')
+        app.revocation_store.revoke_token(decode_jwt(token))
+    assert _request(app, '/protected', token) == (403, {'err': 'nope'})
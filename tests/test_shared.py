@@ -0,0 +1,198 @@
+import datetime
+import multiprocessing
+import time
+
+import pytest
+from flask import Flask, jsonify, json
+
+from flask_jwt_simple import JWTManager, jwt_required, create_jwt, decode_jwt
+from flask_jwt_simple.cache import token_digest, verified_digest
+from flask_jwt_simple.shared import SharedStore, SharedStoreFullError, _seq
+
+
+@pytest.fixture(scope='module')
+def store():
+    return SharedStore(revoked_slots=64, identity_slots=16, verified_slots=64)
+
+
+def _make_app(store, secret='foobarbaz'):
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = secret
+    app.config['JWT_SHARED_STORE'] = store
+    jwt_manager = JWTManager(app)
+    jwt_manager.revocation_check_loader(store.is_token_revoked)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(foo='bar')
+
+    return app
+
+
+def _request(app, token):
+    headers = {'Authorization': 'Bearer {}'.format(token)}
+    response = app.test_client().get('/protected', headers=headers)
+    return response.status_code, json.loads(response.get_data(as_text=True))
+
+
+def _verified(token, secret=b'foobarbaz'):
+    return verified_digest(token_digest(token), 'HS256', None, secret)
+
+
+def _revoke_in_child(store, jti):
+    store.revoke(jti, time.time() + 3600)
+
+
+def test_revoke_across_fork(store):
+    context = multiprocessing.get_context('fork')
+    process = context.Process(target=_revoke_in_child, args=(store, 'from-child'))
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert store.is_revoked('from-child')
+
+    store.unrevoke('from-child')
+    assert not store.is_revoked('from-child')
+
+
+def test_revoked_tokens(store):
+    store.revoke('forever')
+    store.revoke('expired', time.time() - 1)
+    assert store.is_revoked('forever')
+    assert not store.is_revoked('expired')
+    assert not store.is_revoked('other')
+
+    app = _make_app(store)
+    with app.test_request_context():
+        token = create_jwt('foo')
+        store.revoke_token(decode_jwt(token))
+    assert _request(app, token) == (401, {'msg': 'Token has been revoked'})
+
+
+def test_revoked_identities(store):
+    app = _make_app(store)
+    with app.test_request_context():
+        old_token = create_jwt('bar')
+
+    store.revoke_identity('bar', datetime.timedelta(hours=1),
+                          issued_before=time.time() + 1)
+    with app.test_request_context():
+        assert store.is_token_revoked(decode_jwt(old_token))
+        assert not store.is_token_revoked({'sub': 'bar', 'iat': time.time() + 2})
+        assert not store.is_token_revoked({'sub': 'baz', 'iat': 0})
+    assert _request(app, old_token) == (401, {'msg': 'Token has been revoked'})
+
+    store.unrevoke_identity('bar')
+    assert _request(app, old_token)[0] == 200
+
+
+def test_token_issued_after_revoked_identity(store):
+    app = _make_app(store)
+    now = time.time()
+    store.revoke_identity('bar', datetime.timedelta(hours=1), issued_before=now)
+    with app.test_request_context():
+        assert not store.is_token_revoked({'sub': 'bar', 'iat': int(now)})
+        assert store.is_token_revoked({'sub': 'bar', 'iat': int(now) - 1})
+
+    # Logging in again right after the identity was revoked
+    store.revoke_identity('bar', datetime.timedelta(hours=1))
+    with app.test_request_context():
+        token = create_jwt('bar')
+    assert _request(app, token)[0] == 200
+
+
+def test_verified_tokens_are_shared(store):
+    worker_one = _make_app(store)
+    worker_two = _make_app(store)
+    with worker_one.test_request_context():
+        token = create_jwt('foo')
+    assert not store.is_verified(_verified(token))
+
+    assert _request(worker_one, token)[0] == 200
+    assert store.is_verified(_verified(token))
+    assert _request(worker_two, token)[0] == 200
+
+    # The claims are still checked for tokens verified by another worker
+    worker_one.config['JWT_EXPIRES'] = datetime.timedelta(seconds=-1)
+    worker_one.extensions['flask-jwt-simple'].refresh_config(worker_one)
+    with worker_one.test_request_context():
+        expired = create_jwt('foo')
+    store.mark_verified(_verified(expired), time.time() + 60)
+    assert _request(worker_two, expired) == (401, {'msg': 'Token has expired'})
+
+    store.clear_verified()
+    assert not store.is_verified(_verified(token))
+
+
+def test_mark_verified_does_not_wait_on_lock(store):
+    app = _make_app(store)
+    with app.test_request_context():
+        token = create_jwt('foo')
+
+    # As if another worker was stuck while holding the lock
+    store._lock.acquire()
+    try:
+        assert _request(app, token)[0] == 200
+        assert not store.is_verified(_verified(token))
+    finally:
+        store._lock.release()
+
+    assert _request(app, token)[0] == 200
+    assert store.is_verified(_verified(token))
+
+
+def test_verified_tokens_are_bound_to_the_key(store):
+    worker = _make_app(store)
+    other_app = _make_app(store, secret='another secret')
+    with other_app.test_request_context():
+        token = create_jwt('foo')
+
+    assert _request(other_app, token)[0] == 200
+    assert store.is_verified(_verified(token, b'another secret'))
+    assert not store.is_verified(_verified(token))
+    assert _request(worker, token) == (422, {'msg': 'Signature verification failed'})
+
+
+def test_read_gives_up_on_a_torn_slot():
+    store = SharedStore(revoked_slots=2, identity_slots=1, verified_slots=1)
+    store.revoke('one')
+    assert store.is_revoked('one')
+
+    # As if a writer died halfway through writing the slot of 'one'
+    table = store._revoked
+    for index in range(table.slots):
+        offset = table._slot_offset(index)
+        seq = _seq.unpack_from(table._buffer, offset)[0]
+        _seq.pack_into(table._buffer, offset, seq + 1)
+    assert not store.is_revoked('one')
+
+    # The next write to the slot puts it right
+    store.revoke('two')
+    store.revoke('one')
+    assert store.is_revoked('one')
+    assert store.is_revoked('two')
+
+
+def test_shared_store_full():
+    store = SharedStore(revoked_slots=2, identity_slots=1, verified_slots=1)
+    store.revoke('one')
+    store.revoke('two')
+    with pytest.raises(SharedStoreFullError):
+        store.revoke('three')
+
+    # Verified tokens are simply forgotten to make room
+    store.mark_verified(token_digest('a'), time.time() + 60)
+    store.mark_verified(token_digest('b'), time.time() + 60)
+    assert store.is_verified(token_digest('b'))
+    assert not store.is_verified(token_digest('a'))
+
+    with pytest.raises(ValueError):
+        SharedStore(revoked_slots=3)
+
+
+def test_invalid_shared_store_option():
+    app = Flask(__name__)
+    app.config['JWT_SHARED_STORE'] = 'banana'
+    with pytest.raises(RuntimeError):
+        JWTManager(app)
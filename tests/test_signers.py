@@ -0,0 +1,130 @@
+import pytest
+from flask import Flask
+
+import asyncio
+from concurrent.futures import Future
+
+from flask_jwt_simple import (
+    JWTManager, create_jwt, create_jwts, decode_jwt, create_jwt_async
+)
+from flask_jwt_simple.signers import Signer, ProcessPoolSigner
+
+
+class CountingSigner(Signer):
+    def __init__(self):
+        self.calls = 0
+        self._signer = ProcessPoolSigner(max_pending=1)
+
+    def submit(self, signing_input, algorithm, key):
+        self.calls += 1
+        return self._signer._sign_synchronously(signing_input, algorithm, key)
+
+
+class FailingSigner(Signer):
+    def submit(self, signing_input, algorithm, key):
+        future = Future()
+        future.set_exception(RuntimeError('The signer is down'))
+        return future
+
+
+@pytest.fixture(scope='function')
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'foobarbaz'
+    JWTManager(app)
+    return app
+
+
+def test_custom_signer(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    with app.test_request_context():
+        expected = create_jwt('foo')
+
+        signer = jwt_manager.set_signer(CountingSigner())
+        assert create_jwt('foo').split('.')[0] == expected.split('.')[0]
+        assert decode_jwt(create_jwt('foo'))['sub'] == 'foo'
+        assert len(list(create_jwts(['a', 'b']))) == 2
+        assert signer.calls == 4
+
+        jwt_manager.set_signer(None)
+        create_jwt('foo')
+        assert signer.calls == 4
+
+
+def test_process_pool_signer(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    signer = jwt_manager.set_signer(ProcessPoolSigner(max_workers=2))
+    try:
+        with app.test_request_context():
+            assert decode_jwt(create_jwt('foo'))['sub'] == 'foo'
+            jwts = list(create_jwts(['a', 'b', 'c'], workers=2))
+            assert [decode_jwt(jwt)['sub'] for jwt in jwts] == ['a', 'b', 'c']
+    finally:
+        signer.shutdown()
+    assert signer.fallbacks == 0
+
+
+def test_signer_create_jwt_async(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    signer = jwt_manager.set_signer(CountingSigner())
+    with app.test_request_context():
+        jwt = asyncio.run(create_jwt_async('foo'))
+        assert decode_jwt(jwt)['sub'] == 'foo'
+    assert signer.calls == 1
+
+
+@pytest.mark.parametrize('signer', [None, CountingSigner()])
+def test_create_jwt_async_timing(app, signer):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.set_signer(signer)
+    timings = []
+    jwt_manager.timing_listener(timings.append)
+    with app.test_request_context():
+        jwt = asyncio.run(create_jwt_async('foo'))
+        assert decode_jwt(jwt)['sub'] == 'foo'
+    assert [(t.operation, t.phase, t.outcome) for t in timings[:2]] == [
+        ('encode', 'claims', 'success'),
+        ('encode', 'sign', 'success'),
+    ]
+
+
+def test_failing_signer_create_jwt_async(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.set_signer(FailingSigner())
+    timings = []
+    jwt_manager.timing_listener(timings.append)
+    with app.test_request_context():
+        with pytest.raises(RuntimeError):
+            asyncio.run(create_jwt_async('foo'))
+    assert [(t.phase, t.outcome) for t in timings] == [
+        ('claims', 'success'),
+        ('sign', 'error'),
+    ]
+
+
+def test_process_pool_signer_fallback(app):
+    signer = ProcessPoolSigner(max_workers=1, max_pending=1)
+    app.extensions['flask-jwt-simple'].set_signer(signer)
+
+    # With the queue full, tokens are signed in this thread
+    signer._pending.acquire()
+    with app.test_request_context():
+        assert decode_jwt(create_jwt('foo'))['sub'] == 'foo'
+    assert signer.fallbacks == 1
+    assert signer._pool is None
+
+    # Same when the pool can no longer be used
+    signer._pending.release()
+    with app.test_request_context():
+        create_jwt('foo')
+        signer._pool.shutdown()
+        assert decode_jwt(create_jwt('foo'))['sub'] == 'foo'
+    assert signer.fallbacks == 2
+    signer.shutdown()
+
+
+def test_process_pool_signer_options():
+    with pytest.raises(ValueError):
+        ProcessPoolSigner(max_pending=0)
+    with pytest.raises(NotImplementedError):
+        Signer().sign(b'foo', 'HS256', 'bar')
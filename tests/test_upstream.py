@@ -0,0 +1,168 @@
+import datetime
+import time
+
+import jwt as pyjwt
+import pytest
+from flask import Flask, jsonify, json
+
+from flask_jwt_simple import JWTManager, jwt_required, jwt_optional, get_jwt
+from flask_jwt_simple import get_jwt_identity
+from flask_jwt_simple.upstream import create_envelope, decode_envelope
+
+SECRET = 'upstream_secret'
+
+
+def test_envelope_round_trip():
+    now = int(time.time())
+    jwt_data = {'sub': 'username', 'exp': now + 60, 'roles': ['admin']}
+    envelope = create_envelope(jwt_data, SECRET)
+    assert envelope.count('.') == 2
+    assert decode_envelope(envelope, SECRET, 30) == jwt_data
+
+    exp = datetime.datetime.utcnow() + datetime.timedelta(minutes=1)
+    decoded = decode_envelope(create_envelope({'exp': exp}, SECRET), SECRET, 30)
+    assert isinstance(decoded['exp'], int)
+
+
+@pytest.mark.parametrize('envelope', [
+    '', 'foo', 'a.b', 'a.b.c.d', 'a.notanumber.c', 'é.1.c',
+])
+def test_malformed_envelope(envelope):
+    with pytest.raises(pyjwt.DecodeError):
+        decode_envelope(envelope, SECRET, 30)
+
+
+def test_tampered_envelope():
+    envelope = create_envelope({'sub': 'username'}, SECRET)
+    with pytest.raises(pyjwt.InvalidSignatureError):
+        decode_envelope(envelope, 'other_secret', 30)
+
+    other = create_envelope({'sub': 'admin'}, SECRET)
+    forged = '.'.join(other.split('.')[:2] + envelope.split('.')[2:])
+    with pytest.raises(pyjwt.InvalidSignatureError):
+        decode_envelope(forged, SECRET, 30)
+
+
+def test_envelope_max_age():
+    old = create_envelope({'sub': 'username'}, SECRET, created_at=time.time() - 60)
+    with pytest.raises(pyjwt.InvalidTokenError) as e:
+        decode_envelope(old, SECRET, 30)
+    assert str(e.value) == 'Envelope has expired'
+    assert decode_envelope(old, SECRET, 120) == {'sub': 'username'}
+
+    future = create_envelope({'sub': 'username'}, SECRET, created_at=time.time() + 60)
+    with pytest.raises(pyjwt.InvalidTokenError):
+        decode_envelope(future, SECRET, 30)
+
+
+def test_envelope_claims_validated():
+    expired = create_envelope({'sub': 'username', 'exp': int(time.time()) - 1}, SECRET)
+    with pytest.raises(pyjwt.ExpiredSignatureError):
+        decode_envelope(expired, SECRET, 30)
+
+    envelope = create_envelope({'sub': 'username', 'aud': 'foo'}, SECRET)
+    with pytest.raises(pyjwt.InvalidAudienceError):
+        decode_envelope(envelope, SECRET, 30, audience='bar')
+    assert decode_envelope(envelope, SECRET, 30, audience='foo')['aud'] == 'foo'
+
+
+@pytest.fixture(scope='function')
+def app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'testing_secret_key'
+    app.config['JWT_UPSTREAM_HEADER'] = 'X-JWT-Claims'
+    app.config['JWT_UPSTREAM_SECRET'] = SECRET
+    JWTManager(app)
+
+    @app.route('/protected')
+    @jwt_required
+    def protected():
+        return jsonify(identity=get_jwt_identity(), jwt=get_jwt())
+
+    @app.route('/optional')
+    @jwt_optional
+    def optional():
+        return jsonify(identity=get_jwt_identity())
+
+    @app.route('/async/protected')
+    @jwt_required
+    async def async_protected():
+        return jsonify(identity=get_jwt_identity(), jwt=get_jwt())
+
+    return app
+
+
+def _get(test_client, url, envelope):
+    response = test_client.get(url, headers={'X-JWT-Claims': envelope})
+    return response.status_code, json.loads(response.get_data(as_text=True))
+
+
+@pytest.mark.parametrize('url', ['/protected', '/async/protected'])
+def test_upstream_envelope(app, url):
+    test_client = app.test_client()
+    jwt_data = {'sub': 'username', 'exp': int(time.time()) + 60}
+    status, data = _get(test_client, url, create_envelope(jwt_data, SECRET))
+    assert status == 200
+    assert data == {'identity': 'username', 'jwt': jwt_data}
+
+    status, data = _get(test_client, url, create_envelope(jwt_data, 'wrong'))
+    assert status == 422
+    assert data == {'msg': 'Envelope verification failed'}
+
+    expired = dict(jwt_data, exp=int(time.time()) - 1)
+    status, data = _get(test_client, url, create_envelope(expired, SECRET))
+    assert status == 401
+    assert data == {'msg': 'Token has expired'}
+
+    # Without the envelope, the JWT is still looked for
+    response = test_client.get(url)
+    assert response.status_code == 401
+
+
+def test_upstream_envelope_optional(app):
+    test_client = app.test_client()
+    envelope = create_envelope({'sub': 'username'}, SECRET)
+    assert _get(test_client, '/optional', envelope) == (200, {'identity': 'username'})
+    assert _get(test_client, '/optional', envelope + 'x')[0] == 422
+    assert test_client.get('/optional').status_code == 200
+
+
+def test_upstream_envelope_revoked(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    jwt_manager.revocation_check_loader(lambda jwt_data: jwt_data['jti'] == 'revoked')
+
+    test_client = app.test_client()
+    envelope = create_envelope({'sub': 'username', 'jti': 'revoked'}, SECRET)
+    assert _get(test_client, '/protected', envelope) == (
+        401, {'msg': 'Token has been revoked'}
+    )
+
+
+def test_upstream_header_disabled(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    app.config['JWT_UPSTREAM_HEADER'] = None
+    jwt_manager.refresh_config(app)
+
+    test_client = app.test_client()
+    envelope = create_envelope({'sub': 'username'}, SECRET)
+    assert _get(test_client, '/protected', envelope) == (
+        401, {'msg': 'Missing Authorization Header'}
+    )
+
+
+def test_upstream_envelope_with_claim_map(app):
+    jwt_manager = app.extensions['flask-jwt-simple']
+    app.config['JWT_CLAIM_MAP'] = {'role': ('r', ['user', 'admin'])}
+    jwt_manager.refresh_config(app)
+
+    test_client = app.test_client()
+    expected = {'sub': 'username', 'role': 'admin'}
+    for jwt_data in ({'sub': 'username', 'r': 1}, expected):
+        status, data = _get(test_client, '/protected', create_envelope(jwt_data, SECRET))
+        assert status == 200
+        assert data == {'identity': 'username', 'jwt': expected}
+
+    envelope = create_envelope({'sub': 'username', 'r': 5}, SECRET)
+    assert _get(test_client, '/protected', envelope) == (
+        422, {'msg': 'Invalid value for the "role" claim'}
+    )